@@ -0,0 +1,866 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import resource
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Process, Queue, get_context
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(REPO_DIR, 'benchmark_fixtures')
+DEFAULT_COMMANDS = ['scrape', 'scrape --check-liveness']
+DEFAULT_PAGES = 50
+LINKS_PER_PAGE = 60
+ARCHIVED_PERCENT = 70  # share of URLs the fake Wayback reports as archived
+MISSING_PERCENT = 5  # share of synthetic URLs that answer 404
+CAPTURE_SECONDS = 1.0  # mean time the fake Save Page Now takes per capture job
+CAPTURE_FAIL_PERCENT = 10  # share of capture jobs that end in an error
+SESSION_LIMIT = 8  # capture jobs the fake Save Page Now runs at once per client
+WORKER_TIMEOUT = 1800
+INGEST_URLS = 10_000_000  # size of the synthetic source list for the ingest benchmark
+INGEST_DUPLICATE_PERCENT = 10  # share of entries in the unsorted list that repeat an earlier URL
+INGEST_PROCESSED = 100_000  # URLs the fake shard checkpoint marks as saved
+PARSE_THREADS = 20  # fetch threads handing pages to the parse pool, as in scrape
+LARGE_PAGE_PERCENT = 10  # synthetic corpus pages made ~50x longer, past the shared memory threshold
+RULE_COUNTS = [2, 10, 100, 1000, 5000]  # raw pattern rules registered in the rules benchmark
+QUEUE_URLS = 100_000  # URLs in the save queue benchmark
+QUEUE_BUDGET = 400  # saves per run, as in the mecabricks workflow
+REGRESSION_THRESHOLD = 0.15  # relative change that counts as a regression in compare
+MIN_LATENCY_DELTA_MS = 2.0  # latency changes smaller than this are noise, whatever the ratio
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg')
+TINY_PNG = bytes.fromhex('89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+                         '1f15c4890000000d4944415478da63f8ffff3f0005fe02fea7d6a4b00000000049454e44ae426082')
+
+
+def stable_hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8', 'replace'), digest_size=8).digest(), 'big')
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def load_fixtures(fixtures_dir):
+    index_path = os.path.join(fixtures_dir, 'index.json')
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path) as f:
+        index = json.load(f)
+    fixtures = {}
+    for url, entry in index.items():
+        with open(os.path.join(fixtures_dir, entry['file']), 'rb') as f:
+            fixtures[url] = (entry['status'], entry['content_type'], f.read())
+    return fixtures
+
+
+def synthetic_page(url):
+    # Shaped like the pages in source_urls.txt: mostly same-site links and
+    # images, a few other hosts, GitHub repos and LEGO Ideas CDN images.
+    rng = random.Random(stable_hash(url))
+    parts = urlsplit(url)
+    site = f"{parts.scheme}://{parts.netloc}"
+    links = []
+    for _ in range(LINKS_PER_PAGE):
+        roll = rng.random()
+        if roll < 0.45:
+            links.append(('a', f"{site}/post/{rng.randrange(5000)}.html"))
+        elif roll < 0.75:
+            links.append(('img', f"{site}/img/{rng.randrange(5000)}.jpg"))
+        elif roll < 0.9:
+            links.append(('a', f"https://site{rng.randrange(40)}.example/page/{rng.randrange(500)}"))
+        elif roll < 0.95:
+            links.append(('a', f"https://github.com/user{rng.randrange(30)}/repo{rng.randrange(5)}"))
+        else:
+            links.append(('img', f"https://ideascdn.lego.com/media/generate/lego_ci/{rng.randrange(10 ** 6)}/legacy"))
+    body = ['<!DOCTYPE html><html><head><title>Benchmark page</title>',
+            f'<link rel="stylesheet" href="{site}/static/site.css">',
+            '<style>body { font-family: sans-serif; }</style>',
+            '<script>var links = document.querySelectorAll("a"); // <a href="/not-a-link">',
+            '</script></head><body>']
+    for tag, link in links:
+        if tag == 'a':
+            body.append(f'<p>Some text <a href="{link}" class="link">{link}</a> and more text.</p>')
+        else:
+            body.append(f'<img src="{link}" alt="image" srcset="{link} 1x, {link} 2x">')
+    body.append('<!-- <a href="https://commented.example/out"> --></body></html>')
+    return '\n'.join(body).encode('utf-8'), [link for _, link in links]
+
+
+class FakeState:
+    def __init__(self, fixtures, latency, throttle_rate, error_rate, seed):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.known = {}  # CDX group prefix -> urlkeys of archived URLs seen in served pages
+        self.github_remaining = 5000
+        self.served = 0
+        self.throttled = 0
+        self.errors = 0
+        self.uploads = {}  # /item/name -> md5 of PUT bodies
+        self.jobs = {}  # capture job ID -> [url, finish time]
+        self.capture_seconds = CAPTURE_SECONDS
+        self.lock = threading.Lock()
+
+    def is_archived(self, url):
+        return stable_hash('archived:' + url) % 100 < ARCHIVED_PERCENT
+
+    def remember(self, urls):
+        from web_tool.cdx_batch import group_prefix, surt_key
+        with self.lock:
+            for url in urls:
+                prefix = group_prefix(url)
+                if prefix and self.is_archived(url):
+                    self.known.setdefault(prefix, set()).add(surt_key(url))
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, status, body=b'', content_type='application/json', headers=None):
+            if isinstance(body, (dict, list)):
+                body = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def handle_any(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = self.rfile.read(length) if length else b''
+            host = self.headers.get('X-Bench-Host', self.headers.get('Host', ''))
+            scheme = self.headers.get('X-Bench-Scheme', 'http')
+            url = urlunsplit((scheme, host, urlsplit(self.path).path, urlsplit(self.path).query, ''))
+
+            with state.lock:
+                state.served += 1
+                delay = state.rng.uniform(0, 2 * state.latency) if state.latency else 0
+                roll = state.rng.random()
+            if delay:
+                time.sleep(delay)
+            if roll < state.throttle_rate:
+                with state.lock:
+                    state.throttled += 1
+                return self.send(429, {'message': 'Too Many Requests'}, headers={'Retry-After': '1'})
+            if roll < state.throttle_rate + state.error_rate:
+                with state.lock:
+                    state.errors += 1
+                return self.send(503, {'message': 'Service Unavailable'})
+
+            parts = urlsplit(url)
+            params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+            if parts.netloc.startswith('s3.') and parts.netloc.endswith('archive.org') and self.command == 'PUT':
+                return self.s3_put(parts, payload)
+            if parts.netloc.endswith('archive.org') and parts.path == '/wayback/available':
+                return self.wayback_available(params.get('url', ''))
+            if parts.netloc.endswith('archive.org') and parts.path == '/cdx/search/cdx':
+                return self.cdx(params)
+            if parts.netloc.endswith('archive.org') and parts.path.startswith('/save/status/'):
+                return self.capture_status(parts.path.rsplit('/', 1)[1])
+            if parts.netloc.endswith('archive.org') and parts.path == '/save' and self.command == 'POST':
+                return self.capture_submit(parse_qs(payload.decode()).get('url', [''])[0])
+            if parts.netloc.endswith('archive.org') and parts.path.startswith('/save/'):
+                return self.send(200, b'<html>Saved</html>', 'text/html',
+                                 {'Content-Location': '/web/20240101000000/' + parts.path[len('/save/'):]})
+            if parts.netloc == 'api.github.com':
+                return self.github(parts, payload)
+            return self.page(url, parts)
+
+        def wayback_available(self, url):
+            if state.is_archived(url):
+                snapshot = {'available': True, 'status': '200', 'timestamp': '20240101000000',
+                            'url': f'http://web.archive.org/web/20240101000000/{url}'}
+                return self.send(200, {'url': url, 'archived_snapshots': {'closest': snapshot}})
+            return self.send(200, {'url': url, 'archived_snapshots': {}})
+
+        def cdx(self, params):
+            with state.lock:
+                keys = sorted(state.known.get(params.get('url', ''), ()))
+            start = int(params.get('resumeKey') or 0)
+            limit = int(params.get('limit') or len(keys) or 1)
+            rows = [['urlkey']] + [[key] for key in keys[start:start + limit]]
+            if params.get('showResumeKey') and start + limit < len(keys):
+                rows += [[], [str(start + limit)]]
+            return self.send(200, rows if len(rows) > 1 else b'')
+
+        def capture_submit(self, url):
+            # Save Page Now 2: starts a job and answers with its ID straight away
+            now = time.monotonic()
+            job_id = None
+            with state.lock:
+                if sum(1 for _, finish in state.jobs.values() if finish > now) < SESSION_LIMIT:
+                    job_id = f"spn2-{len(state.jobs):08x}"
+                    state.jobs[job_id] = [url, now + state.rng.uniform(0.5, 1.5) * state.capture_seconds]
+            if job_id is None:
+                return self.send(429, {'status': 'error', 'status_ext': 'error:user-session-limit',
+                                       'message': 'You have already reached the limit of active sessions'})
+            return self.send(200, {'url': url, 'job_id': job_id})
+
+        def capture_status(self, job_id):
+            with state.lock:
+                job = state.jobs.get(job_id)
+            if job is None:
+                return self.send(200, {'status': 'error', 'status_ext': 'error:invalid-job-id', 'job_id': job_id})
+            url, finish = job
+            if time.monotonic() < finish:
+                return self.send(200, {'status': 'pending', 'job_id': job_id, 'resources': []})
+            if stable_hash('capture:' + url) % 100 < CAPTURE_FAIL_PERCENT:
+                return self.send(200, {'status': 'error', 'status_ext': 'error:not-found', 'job_id': job_id,
+                                       'message': 'The server cannot find the requested resource'})
+            return self.send(200, {'status': 'success', 'job_id': job_id, 'original_url': url,
+                                   'timestamp': '20240101000000'})
+
+        def s3_put(self, parts, payload):
+            # IA's S3-style upload endpoint: checks Content-MD5 and answers with the MD5 as ETag
+            if not self.headers.get('Authorization', '').startswith('LOW '):
+                return self.send(403, b'<Error><Code>AccessDenied</Code></Error>', 'application/xml')
+            md5 = hashlib.md5(payload).hexdigest()
+            expected = self.headers.get('Content-MD5')
+            if expected and base64.b64decode(expected).hex() != md5:
+                return self.send(400, b'<Error><Code>BadDigest</Code></Error>', 'application/xml')
+            with state.lock:
+                state.uploads[parts.path] = md5
+            return self.send(200, b'', 'text/plain', {'ETag': f'"{md5}"'})
+
+        def github(self, parts, payload):
+            with state.lock:
+                state.github_remaining = max(0, state.github_remaining - 1)
+                headers = {'X-RateLimit-Remaining': str(state.github_remaining),
+                           'X-RateLimit-Reset': str(int(time.time()) + 3600)}
+            if parts.path == '/graphql':
+                variables = json.loads(payload or b'{}').get('variables', {})
+                data = {}
+                for i in range(len(variables) // 2):
+                    owner, repo = variables[f'o{i}'], variables[f'n{i}']
+                    data[f'r{i}'] = {
+                        'releases': {'pageInfo': {'hasNextPage': False}, 'nodes': [{'releaseAssets': {'nodes': [
+                            {'downloadUrl': f'https://github.com/{owner}/{repo}/releases/download/v1/{repo}.zip'}]}}]},
+                        'issues': {'pageInfo': {'hasNextPage': False},
+                                   'nodes': [{'url': f'https://github.com/{owner}/{repo}/issues/{n}'} for n in range(3)]},
+                        'pullRequests': {'pageInfo': {'hasNextPage': False},
+                                         'nodes': [{'url': f'https://github.com/{owner}/{repo}/pull/{n}'} for n in range(2)]},
+                    }
+                return self.send(200, {'data': data}, headers=headers)
+
+            segments = parts.path.strip('/').split('/')
+            if len(segments) != 4 or segments[0] != 'repos':
+                return self.send(404, {'message': 'Not Found'}, headers=headers)
+            _, owner, repo, kind = segments
+            if kind == 'releases':
+                body = [{'assets': [{'browser_download_url':
+                                     f'https://github.com/{owner}/{repo}/releases/download/v1/{repo}.zip'}]}]
+            elif kind == 'issues':
+                body = [{'html_url': f'https://github.com/{owner}/{repo}/issues/{n}'} for n in range(3)]
+            else:
+                body = [{'html_url': f'https://github.com/{owner}/{repo}/pull/{n}'} for n in range(2)]
+            data = json.dumps(body).encode()
+            etag = '"' + hashlib.blake2b(data, digest_size=8).hexdigest() + '"'
+            headers['ETag'] = etag
+            if self.headers.get('If-None-Match') == etag:
+                return self.send(304, headers=headers)
+            return self.send(200, data, headers=headers)
+
+        def page(self, url, parts):
+            fixture = state.fixtures.get(url)
+            if fixture:
+                status, content_type, body = fixture
+                if 'html' in content_type:
+                    from web_tool.link_extractor import extract_urls
+                    links, images, other_urls = extract_urls(body, url)
+                    state.remember(links | images | other_urls)
+                return self.send(status, body, content_type)
+            if stable_hash('missing:' + url) % 100 < MISSING_PERCENT:
+                return self.send(404, b'Not Found', 'text/plain')
+            if parts.path.lower().endswith(IMAGE_EXTENSIONS) or parts.path.endswith('/legacy'):
+                return self.send(200, TINY_PNG, 'image/png')
+            body, links = synthetic_page(url)
+            state.remember(links + [url])
+            return self.send(200, body, 'text/html; charset=utf-8')
+
+        do_GET = do_HEAD = do_POST = do_PUT = handle_any
+
+    return Handler
+
+
+def serve(ready, fixtures_dir, latency, throttle_rate, error_rate, seed):
+    sys.path.insert(0, REPO_DIR)
+    state = FakeState(load_fixtures(fixtures_dir), latency, throttle_rate, error_rate, seed)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(state))
+    server.daemon_threads = True
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_server(fixtures_dir, latency, throttle_rate, error_rate, seed):
+    ready = Queue()
+    process = Process(target=serve, args=(ready, fixtures_dir, latency, throttle_rate, error_rate, seed), daemon=True)
+    process.start()
+    return process, ready.get(timeout=30)
+
+
+def install_replay(port):
+    # Sends every request the commands make to the fake server, keeping the
+    # original host in a header so scheduler limits and caches see real URLs.
+    from requests.adapters import HTTPAdapter
+
+    from web_tool import http_client
+
+    class ReplayAdapter(HTTPAdapter):
+        def send(self, request, **kwargs):
+            parts = urlsplit(request.url)
+            request.headers['X-Bench-Host'] = parts.netloc
+            request.headers['X-Bench-Scheme'] = parts.scheme
+            request.url = urlunsplit(('http', f'127.0.0.1:{port}', parts.path or '/', parts.query, ''))
+            return super().send(request, **kwargs)
+
+    adapter = ReplayAdapter(pool_connections=1, pool_maxsize=http_client.POOL_SIZE)
+    session = http_client.get_client().session
+    session.trust_env = False
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+
+def request_stage(method, url):
+    parts = urlsplit(url)
+    if parts.netloc == 'api.github.com':
+        return 'github'
+    if parts.netloc.startswith('s3.') and parts.netloc.endswith('archive.org'):
+        return 'upload'
+    if parts.netloc.endswith('archive.org'):
+        if parts.path.startswith('/save/status/'):
+            return 'save_status'
+        return 'save' if parts.path == '/save' or parts.path.startswith('/save/') else 'availability'
+    return 'status' if method == 'HEAD' else 'fetch'
+
+
+def run_worker(args):
+    sys.path.insert(0, args.repo)
+    from web_tool import http_client, link_extractor, url_store, wayback_cache
+
+    random.seed(args.seed)
+    install_replay(args.port)
+    timings = {}
+    lock = threading.Lock()
+
+    def record(stage, elapsed):
+        with lock:
+            timings.setdefault(stage, []).append(elapsed)
+
+    http_client.add_observer(lambda method, url, response, elapsed: record(request_stage(method, url), elapsed))
+
+    def timed(stage, fn):
+        def wrapper(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return fn(*a, **kw)
+            finally:
+                record(stage, time.perf_counter() - start)
+        return wrapper
+
+    # Patched before the command modules import these names
+    try:
+        # Parsing may run in pool workers, which the patch below wouldn't reach
+        from web_tool import parse_pool
+        parse_pool.ParsePool.run = timed('parse', parse_pool.ParsePool.run)
+    except ImportError:
+        link_extractor.extract_urls = timed('parse', link_extractor.extract_urls)
+    from web_tool import cli, extract
+    extract.fetch_urls = timed('extract', extract.fetch_urls)
+    wayback_cache.AvailabilityCache.get = timed('cache', wayback_cache.AvailabilityCache.get)
+    for name in ('add', 'remove', 'compact'):
+        setattr(url_store.UrlStore, name, timed('output', getattr(url_store.UrlStore, name)))
+
+    peak_threads = [threading.active_count()]
+    done = threading.Event()
+
+    def sample_threads():
+        while not done.wait(0.02):
+            peak_threads[0] = max(peak_threads[0], threading.active_count() - 1)
+
+    threading.Thread(target=sample_threads, daemon=True).start()
+    start = time.perf_counter()
+    cli.main(shlex.split(args.command))
+    wall = time.perf_counter() - start
+    done.set()
+
+    # Every URL goes through one cache lookup before its availability check
+    lookups = len(timings.get('cache', ()))
+    result = {
+        'wall': wall,
+        'pages': len(timings.get('extract', ())),
+        'urls': lookups,
+        'urls_per_sec': lookups / wall if wall else 0.0,
+        'peak_threads': peak_threads[0],
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'stages': {stage: {'count': len(values),
+                           'p50_ms': 1000 * percentile(values, 0.5),
+                           'p99_ms': 1000 * percentile(values, 0.99)}
+                   for stage, values in sorted(timings.items())},
+    }
+    with open(args.result, 'w') as f:
+        json.dump(result, f)
+
+
+def pick_sources(count, seed, fixtures):
+    urls = list(fixtures)
+    if len(urls) < count:
+        with open(os.path.join(REPO_DIR, 'source_urls.txt')) as f:
+            candidates = [line.strip() for line in f if line.strip()]
+        # Image and GitHub entries don't exercise the page pipeline, so prefer pages
+        pages = [url for url in candidates if not urlsplit(url).path.lower().endswith(IMAGE_EXTENSIONS)]
+        random.Random(seed).shuffle(pages)
+        urls += [url for url in pages if url not in fixtures][:count - len(urls)]
+    return urls[:count]
+
+
+def run_command(command, port, sources, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, 'source_urls.txt'), 'w') as f:
+            f.write('\n'.join(sources) + '\n')
+        open(os.path.join(workdir, 'output_urls.txt'), 'w').close()
+        result_path = os.path.join(workdir, 'result.json')
+        env = dict(os.environ, GITHUB_TOKEN='benchmark', PYTHONHASHSEED=str(args.seed))
+        for name in ('WAYBACK_CACHE_PATH', 'GITHUB_CACHE_PATH', 'LIVENESS_CACHE_PATH', 'CDX_API_URL', 'GITHUB_API_URL',
+                     'SAVE_ENDPOINT', 'SPN2_ENDPOINT'):
+            env.pop(name, None)
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), 'worker', command, '--port', str(port),
+             '--repo', os.path.abspath(args.repo), '--seed', str(args.seed), '--result', result_path],
+            cwd=workdir, env=env, timeout=WORKER_TIMEOUT,
+            stdout=None if args.verbose else subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        if completed.returncode != 0 or not os.path.exists(result_path):
+            print(completed.stdout[-4000:] if completed.stdout else '')
+            raise RuntimeError(f"{command} exited with status {completed.returncode}")
+        with open(result_path) as f:
+            return json.load(f)
+
+
+def print_result(command, result):
+    print(f"{command}: {result['pages']} pages, {result['urls']} URLs in {result['wall']:.2f}s "
+          f"({result['urls_per_sec']:.1f} URLs/s), peak {result['peak_threads']} threads, "
+          f"peak RSS {result['peak_rss_mb']:.1f} MB")
+    for stage, stats in result['stages'].items():
+        print(f"  {stage:<12} {stats['count']:>7} calls  p50 {stats['p50_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms")
+
+
+def run_benchmark(args):
+    fixtures = load_fixtures(args.fixtures)
+    sources = pick_sources(args.pages, args.seed, fixtures)
+    server, port = start_server(args.fixtures, args.latency / 1000.0, args.throttle_rate, args.error_rate, args.seed)
+    print(f"Fake server on port {port}: {len(sources)} source pages ({len(fixtures)} recorded), "
+          f"latency ~{args.latency:g} ms, {args.throttle_rate:.1%} 429s, {args.error_rate:.1%} 503s")
+    runs = {}
+    try:
+        for command in args.commands:
+            attempts = [run_command(command, port, sources, args) for _ in range(args.repeat)]
+            # Keep the median run by wall time so one noisy run doesn't skew comparisons
+            attempts.sort(key=lambda result: result['wall'])
+            runs[command] = attempts[len(attempts) // 2]
+            print_result(command, runs[command])
+    finally:
+        server.terminate()
+    results = {
+        'config': {'pages': len(sources), 'latency_ms': args.latency, 'throttle_rate': args.throttle_rate,
+                   'error_rate': args.error_rate, 'seed': args.seed, 'repeat': args.repeat},
+        'runs': runs,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+def run_spn2(args):
+    # Save Page Now throughput for a range of job counts. The fake captures
+    # take ~CAPTURE_SECONDS each, so URLs/s should grow with the jobs in flight
+    # until SESSION_LIMIT, not stay at one capture at a time.
+    sys.path.insert(0, os.path.abspath(args.repo))
+    from web_tool import save_page_now
+    from web_tool.rate_limiter import TokenBucket
+
+    server, port = start_server(args.fixtures, args.latency / 1000.0, 0.0, 0.0, args.seed)
+    install_replay(port)
+    # Generous buckets so the job count, not the client's pacing, is what's measured
+    save_page_now.save_bucket = TokenBucket(rate=100.0, burst=100, max_rate=100.0)
+    save_page_now.status_bucket = TokenBucket(rate=1000.0, burst=1000, max_rate=1000.0)
+    urls = [f"https://example.com/spn2/{args.seed}/{i}" for i in range(args.urls)]
+    print(f"Fake Save Page Now on port {port}: {args.urls} URLs, ~{CAPTURE_SECONDS:g}s per capture, "
+          f"{CAPTURE_FAIL_PERCENT}% failing, {SESSION_LIMIT} sessions per client")
+    try:
+        for max_jobs in args.jobs:
+            jobs = save_page_now.SaveJobs(max_jobs, 'https://web.archive.org/save', credentials=(),
+                                          poll_interval=CAPTURE_SECONDS / 4)
+            start = time.perf_counter()
+            results = jobs.run(urls)
+            wall = time.perf_counter() - start
+            saved = sum(1 for ok, _ in results.values() if ok)
+            print(f"{max_jobs:>3} jobs: {saved} saved, {len(results) - saved} failed in {wall:.2f}s "
+                  f"({len(urls) / wall:.2f} URLs/s), peak {jobs.peak_jobs} in flight")
+    finally:
+        server.terminate()
+
+
+def ingest_phase(name, workdir, sample_size, result):
+    # Runs in a fresh process so each phase's peak RSS is its own
+    sys.path.insert(0, REPO_DIR)
+    from web_tool.sharding import merge
+    from web_tool.url_store import UrlStore
+    from web_tool.url_stream import reservoir_sample
+
+    start = time.perf_counter()
+    if name == 'sample':
+        count = len(reservoir_sample(UrlStore(os.path.join(workdir, 'source_urls.txt.gz')), sample_size))
+    elif name == 'compact':
+        count = UrlStore(os.path.join(workdir, 'output_urls.txt.gz')).compact()
+    else:
+        merge([os.path.join(workdir, 'checkpoint.txt')], os.path.join(workdir, 'output_urls.txt.gz'))
+        count = sum(1 for _ in UrlStore(os.path.join(workdir, 'output_urls.txt.gz')))
+    result.put((count, time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+
+
+def write_ingest_lists(workdir, urls, seed):
+    # A sorted source list (as UrlStore keeps it) and an unsorted output list
+    # with duplicates (as several runs append to it), both gzip-compressed
+    sys.path.insert(0, REPO_DIR)
+    from web_tool.url_stream import open_list
+
+    hosts = max(1, urls // 2000)
+    with open_list(os.path.join(workdir, 'source_urls.txt.gz'), 'w') as f:
+        for i in range(urls):
+            f.write(f"https://host{i * hosts // urls:06d}.example/page/{i:09d}\n")
+    rng = random.Random(seed)
+    with open_list(os.path.join(workdir, 'output_urls.txt.gz'), 'w') as f, \
+            open(os.path.join(workdir, 'checkpoint.txt'), 'w') as checkpoint:
+        for i in range(urls):
+            n = rng.randrange(i) if i and rng.randrange(100) < INGEST_DUPLICATE_PERCENT else i
+            url = f"https://host{stable_hash(str(n)) % hosts:06d}.example/item/{n:09d}"
+            f.write(url + '\n')
+            if n < INGEST_PROCESSED:
+                checkpoint.write(f"ok\t0.100\t{url}\n")
+
+
+def run_ingest(args):
+    context = get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='web_tool-ingest-') as workdir:
+        start = time.perf_counter()
+        write_ingest_lists(workdir, args.urls, args.seed)
+        size = sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir))
+        print(f"Wrote {args.urls} synthetic URLs per list ({size / 2 ** 20:.0f} MB gzip-compressed) "
+              f"in {time.perf_counter() - start:.1f}s")
+        for name, label in (('sample', f"reservoir sample of {args.sample} from the sorted list"),
+                            ('compact', "external sort and dedup of the unsorted list"),
+                            ('merge', "canonicalize, subtract processed and rewrite")):
+            result = context.Queue()
+            process = context.Process(target=ingest_phase, args=(name, workdir, args.sample, result))
+            process.start()
+            count, wall, peak_rss = result.get(timeout=WORKER_TIMEOUT)
+            process.join()
+            print(f"{name:<8} {args.urls / wall:>11,.0f} URLs/s  {wall:8.1f}s  peak RSS {peak_rss:7.1f} MB  "
+                  f"{count:>10} URLs  ({label})")
+
+
+def parse_corpus(fixtures_dir, pages, seed):
+    # Recorded pages first, topped up with synthetic ones
+    corpus = [(url, body) for url, (status, content_type, body) in load_fixtures(fixtures_dir).items()
+              if 'html' in content_type][:pages]
+    rng = random.Random(seed)
+    for i in range(pages - len(corpus)):
+        url = f"https://site{rng.randrange(40)}.example/post/{i}.html"
+        body, _ = synthetic_page(url)
+        if rng.randrange(100) < LARGE_PAGE_PERCENT:
+            body = b'\n'.join(synthetic_page(f"{url}?part={part}")[0] for part in range(50))
+        corpus.append((url, body))
+    return corpus
+
+
+def run_parse(args):
+    # Extraction throughput for a range of parse pool sizes; one process
+    # parses in the fetch threads, as before the pool existed
+    sys.path.insert(0, os.path.abspath(args.repo))
+    from concurrent.futures import ThreadPoolExecutor
+
+    from web_tool.extract import parse_page
+    from web_tool.parse_pool import ParsePool
+
+    corpus = parse_corpus(args.fixtures, args.pages, args.seed)
+    size = sum(len(body) for _, body in corpus)
+    print(f"{len(corpus)} pages, {size / 2 ** 20:.1f} MB, {os.cpu_count()} CPUs, {PARSE_THREADS} fetch threads")
+    for processes in args.processes:
+        pool = ParsePool(processes)
+        try:
+            # Start the workers before timing
+            with ThreadPoolExecutor(max(processes, 1)) as executor:
+                list(executor.map(lambda page: pool.run(parse_page, page[1], page[0]), corpus[:processes]))
+            pool.counts.clear()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(PARSE_THREADS) as executor:
+                found = sum(len(links) + len(other) for links, other in executor.map(
+                    lambda page: pool.run(parse_page, page[1], page[0]), corpus))
+            wall = time.perf_counter() - start
+        finally:
+            pool.close()
+        print(f"{processes:>3} processes: {len(corpus) / wall:8.1f} pages/s  {size / 2 ** 20 / wall:7.2f} MB/s  "
+              f"{found} URLs  ({', '.join(f'{count} {name}' for name, count in sorted(pool.counts.items()))})")
+
+
+def scan_per_rule(rules, content):
+    # One pass per rule, as find_lego_urls did before the rule registry
+    found = set()
+    for rule in rules:
+        prefix = rule.prefix.encode()
+        start = content.find(prefix)
+        while start != -1:
+            end = min((i for i in (content.find(t.encode(), start) for t in rule.terminators) if i != -1), default=-1)
+            if end == -1:
+                break
+            found.add(content[start:end].decode('utf-8', 'replace'))
+            start = content.find(prefix, end)
+    return found
+
+
+def run_rules(args):
+    # Raw pattern scan cost as site rules are added: the combined regex against
+    # one find loop per rule. The added rules are for sites the pages don't
+    # link to, so the URLs found (and the work per match) stay the same and
+    # only the cost of the scan itself can change.
+    sys.path.insert(0, os.path.abspath(args.repo))
+    from web_tool.raw_patterns import BUILTIN_RULES, Rule, RuleSet
+
+    corpus = [body for _, body in parse_corpus(args.fixtures, args.pages, args.seed)]
+    size = sum(len(body) for body in corpus) / 2 ** 20
+    print(f"{len(corpus)} pages, {size:.1f} MB")
+    rng = random.Random(args.seed)
+    hosts = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(8)) for _ in range(max(args.rules))]
+    for count in args.rules:
+        rules = list(BUILTIN_RULES) + [Rule(host, prefix=f"https://{host}.example/media/")
+                                       for host in hosts[:max(count - len(BUILTIN_RULES), 0)]]
+        rule_set = RuleSet(rules)
+        rule_set.scan(b'')  # compile before timing
+        start = time.perf_counter()
+        found = sum(len(rule_set.scan(body)) for body in corpus)
+        combined = time.perf_counter() - start
+        start = time.perf_counter()
+        naive = sum(len(scan_per_rule(rules, body)) for body in corpus) if count <= args.max_naive else None
+        separate = time.perf_counter() - start
+        print(f"{len(rules):>5} rules: combined {size / combined:8.1f} MB/s ({found} URLs)"
+              + (f"   one pass per rule {size / separate:8.1f} MB/s ({naive} URLs)" if naive is not None else ""))
+
+
+def run_queue(args):
+    # Taking a run's budget and updating a batch of signals in the save queue,
+    # against scoring and sorting the whole list each time
+    sys.path.insert(0, os.path.abspath(args.repo))
+    from web_tool.save_queue import SaveQueue
+
+    rng = random.Random(args.seed)
+    urls = [f"https://site{rng.randrange(2000)}.example/{kind}/{i}"
+            for i, kind in ((i, rng.choice(('post', 'img/a.png', ''))) for i in range(args.urls))]
+    with tempfile.TemporaryDirectory(prefix='web_tool-bench-') as workdir:
+        queue = SaveQueue(os.path.join(workdir, 'queue.sqlite'))
+        start = time.perf_counter()
+        queue.add(urls)
+        queue.record_captures({url: rng.randrange(100) < ARCHIVED_PERCENT for url in urls},
+                              capture_time=time.time() - 200 * 24 * 3600)
+        print(f"{args.urls} URLs queued and scored in {time.perf_counter() - start:.2f}s")
+
+        def timed(label, fn, repeat=20):
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - start)
+            print(f"{label:<44} median {percentile(times, 50) * 1000:9.2f} ms")
+
+        def full_sort():
+            scores = queue.scores(urls)
+            return sorted(urls, key=lambda url: (-scores[url], url))[:args.budget]
+
+        def update():
+            batch = rng.sample(urls, args.budget)
+            queue.record_failures({url: 'error:too-many-daily-captures' for url in batch})
+
+        timed(f"take({args.budget})", lambda: queue.take(args.budget))
+        timed(f"record {args.budget} failures (incremental)", update)
+        timed(f"look up and sort all {args.urls} URLs", full_sort, repeat=3)
+        assert queue.take(args.budget) == full_sort()
+        queue.close()
+
+
+def compare_results(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline['config'] != candidate['config']:
+        print(f"Warning: configs differ\n  baseline:  {baseline['config']}\n  candidate: {candidate['config']}")
+
+    regressions = []
+
+    def check(label, old, new, higher_is_better, min_delta=0.0):
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > args.threshold and abs(new - old) >= min_delta:
+            flag = '  REGRESSION'
+            regressions.append(label)
+        print(f"  {label:<32} {old:10.2f} -> {new:10.2f} ({change:+.1%}){flag}")
+
+    for command, old in baseline['runs'].items():
+        new = candidate['runs'].get(command)
+        if new is None:
+            print(f"{command}: missing from {args.candidate}")
+            continue
+        print(command)
+        check('URLs/s', old['urls_per_sec'], new['urls_per_sec'], True)
+        check('peak threads', old['peak_threads'], new['peak_threads'], False)
+        check('peak RSS MB', old['peak_rss_mb'], new['peak_rss_mb'], False)
+        for stage, stats in old['stages'].items():
+            if stage in new['stages']:
+                check(f'{stage} p50 ms', stats['p50_ms'], new['stages'][stage]['p50_ms'], False, MIN_LATENCY_DELTA_MS)
+                check(f'{stage} p99 ms', stats['p99_ms'], new['stages'][stage]['p99_ms'], False, MIN_LATENCY_DELTA_MS)
+
+    if regressions:
+        print(f"{len(regressions)} metrics regressed by more than {args.threshold:.0%}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+def record_fixtures(args):
+    from web_tool import http_client
+    os.makedirs(os.path.join(args.fixtures, 'pages'), exist_ok=True)
+    index_path = os.path.join(args.fixtures, 'index.json')
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+    for url in pick_sources(args.pages, args.seed, {}):
+        try:
+            response = http_client.get(url, timeout=30)
+        except Exception as e:
+            print(f"Skipping {url}: {e}")
+            continue
+        name = hashlib.blake2b(url.encode(), digest_size=10).hexdigest()
+        with open(os.path.join(args.fixtures, 'pages', name), 'wb') as f:
+            f.write(response.content)
+        index[url] = {'file': f'pages/{name}', 'status': response.status_code,
+                      'content_type': response.headers.get('Content-Type', 'text/html')}
+        print(f"Recorded {url} ({len(response.content)} bytes)")
+    with open(index_path, 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers against a local fake web, Wayback and GitHub")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="run the pipelines against the fake server")
+    run.add_argument('--commands', nargs='+', default=DEFAULT_COMMANDS, help="web_tool subcommands, quoted")
+    run.add_argument('--pages', type=int, default=DEFAULT_PAGES, help="source pages per run")
+    run.add_argument('--latency', type=float, default=20.0, help="mean response latency in ms")
+    run.add_argument('--throttle-rate', type=float, default=0.0, help="share of responses that are 429")
+    run.add_argument('--error-rate', type=float, default=0.0, help="share of responses that are 503")
+    run.add_argument('--repeat', type=int, default=1)
+    run.add_argument('--seed', type=int, default=1)
+    run.add_argument('--fixtures', default=FIXTURES_DIR)
+    run.add_argument('--repo', default=REPO_DIR, help="checkout whose web_tool is benchmarked")
+    run.add_argument('--output', help="write results as JSON for compare")
+    run.add_argument('--verbose', action='store_true', help="show the commands' own output")
+
+    compare = commands.add_parser('compare', help="compare two result files")
+    compare.add_argument('baseline')
+    compare.add_argument('candidate')
+    compare.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+
+    record = commands.add_parser('record', help="save live source pages as fixtures")
+    record.add_argument('--pages', type=int, default=DEFAULT_PAGES)
+    record.add_argument('--seed', type=int, default=1)
+    record.add_argument('--fixtures', default=FIXTURES_DIR)
+
+    spn2 = commands.add_parser('spn2', help="Save Page Now job throughput against the fake server")
+    spn2.add_argument('--urls', type=int, default=24)
+    spn2.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 5, 8])
+    spn2.add_argument('--latency', type=float, default=20.0, help="mean response latency in ms")
+    spn2.add_argument('--seed', type=int, default=1)
+    spn2.add_argument('--fixtures', default=FIXTURES_DIR)
+    spn2.add_argument('--repo', default=REPO_DIR, help="checkout whose web_tool is benchmarked")
+
+    ingest = commands.add_parser('ingest', help="throughput and peak RSS of streaming list ingestion")
+    ingest.add_argument('--urls', type=int, default=INGEST_URLS)
+    ingest.add_argument('--sample', type=int, default=3000, help="source pages sampled per run")
+    ingest.add_argument('--seed', type=int, default=1)
+
+    parse = commands.add_parser('parse', help="HTML extraction throughput as parse processes are added")
+    parse.add_argument('--pages', type=int, default=2000)
+    parse.add_argument('--processes', type=int, nargs='+',
+                       default=sorted({1, 2, os.cpu_count() or 1} | {n for n in (4, 8) if n <= (os.cpu_count() or 1)}))
+    parse.add_argument('--seed', type=int, default=1)
+    parse.add_argument('--fixtures', default=FIXTURES_DIR)
+    parse.add_argument('--repo', default=REPO_DIR, help="checkout whose web_tool is benchmarked")
+
+    rules = commands.add_parser('rules', help="raw pattern scan throughput as site rules are added")
+    rules.add_argument('--pages', type=int, default=500)
+    rules.add_argument('--rules', type=int, nargs='+', default=RULE_COUNTS)
+    rules.add_argument('--max-naive', type=int, default=100, help="largest rule count also timed one pass per rule")
+    rules.add_argument('--seed', type=int, default=1)
+    rules.add_argument('--fixtures', default=FIXTURES_DIR)
+    rules.add_argument('--repo', default=REPO_DIR, help="checkout whose web_tool is benchmarked")
+
+    queue = commands.add_parser('queue', help="save queue lookups and updates against re-sorting the list")
+    queue.add_argument('--urls', type=int, default=QUEUE_URLS)
+    queue.add_argument('--budget', type=int, default=QUEUE_BUDGET)
+    queue.add_argument('--seed', type=int, default=1)
+    queue.add_argument('--repo', default=REPO_DIR, help="checkout whose web_tool is benchmarked")
+
+    worker = commands.add_parser('worker')
+    worker.add_argument('command')
+    worker.add_argument('--port', type=int, required=True)
+    worker.add_argument('--repo', default=REPO_DIR)
+    worker.add_argument('--seed', type=int, default=1)
+    worker.add_argument('--result', required=True)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        run_benchmark(args)
+    elif args.command == 'compare':
+        return compare_results(args)
+    elif args.command == 'record':
+        record_fixtures(args)
+    elif args.command == 'spn2':
+        run_spn2(args)
+    elif args.command == 'ingest':
+        run_ingest(args)
+    elif args.command == 'parse':
+        run_parse(args)
+    elif args.command == 'rules':
+        run_rules(args)
+    elif args.command == 'queue':
+        run_queue(args)
+    else:
+        run_worker(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
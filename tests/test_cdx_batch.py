@@ -0,0 +1,96 @@
+from web_tool.cdx_batch import group_prefix, group_urls, query_prefix, resolve_availability, surt_key
+
+# Hand-written CDX answers, keyed by the queried prefix, in the form the real
+# API returns with fl=urlkey and collapse=urlkey
+CDX_FIXTURES = {
+    'damiensfiles.b-cdn.net/gesaffelstein-2024/': [
+        'net,b-cdn,damiensfiles)/gesaffelstein-2024/01.jpg',
+        'net,b-cdn,damiensfiles)/gesaffelstein-2024/02.jpg',
+        'net,b-cdn,damiensfiles)/gesaffelstein-2024/index.html',
+    ],
+    'example.com/docs/': [
+        'com,example)/docs/a',
+        'com,example)/docs/b',
+        'com,example)/docs/c',
+        'com,example)/docs/d',
+        'com,example)/docs/e',
+    ],
+}
+
+
+def cdx_handler(method, path, params, headers, body):
+    keys = CDX_FIXTURES.get(params['url'], [])
+    start = int(params.get('resumeKey') or 0)
+    limit = int(params['limit'])
+    rows = [['urlkey']] + [[key] for key in keys[start:start + limit]]
+    if params.get('showResumeKey') == 'true' and start + limit < len(keys):
+        rows += [[], [str(start + limit)]]
+    return 200, rows, {'Content-Type': 'application/json'}
+
+
+def test_surt_key():
+    assert surt_key('https://www.Example.com:443/Docs/A?b=2&a=1') == 'com,example)/docs/a?a=1&b=2'
+    assert surt_key('http://damiensfiles.b-cdn.net/gesaffelstein-2024/01.jpg') == \
+        'net,b-cdn,damiensfiles)/gesaffelstein-2024/01.jpg'
+    assert surt_key('http://example.com') == 'com,example)/'
+
+
+def test_group_prefix_never_uses_the_host_root():
+    assert group_prefix('https://github.com/alice') is None
+    assert group_prefix('https://www.youtube.com/watch?v=abc') is None
+    assert group_prefix('https://example.com/') is None
+    assert group_prefix('https://www.example.com/docs/a') == 'example.com/docs/'
+    assert group_prefix('https://example.com/docs/deep/x') == 'example.com/docs/'
+
+
+def test_group_urls_leaves_root_level_urls_for_single_checks():
+    urls = ['https://github.com/alice', 'https://github.com/bob', 'https://github.com/carol',
+            'https://example.com/docs/a', 'https://example.com/docs/b', 'https://example.com/docs/c',
+            'https://example.com/other/x']
+    groups, leftovers = group_urls(urls)
+    assert dict(groups) == {'example.com/docs/': urls[3:6]}
+    assert sorted(leftovers) == sorted(urls[:3] + urls[6:])
+
+
+def test_query_prefix_follows_resume_keys(stub_server):
+    server = stub_server(cdx_handler)
+    keys, complete = query_prefix('example.com/docs/', cdx_api=server.url + '/cdx', page_size=2)
+    assert complete
+    assert keys == set(CDX_FIXTURES['example.com/docs/'])
+    assert len(server.requests) == 3
+
+
+def test_query_prefix_reports_incomplete_results(stub_server):
+    server = stub_server(cdx_handler)
+    keys, complete = query_prefix('example.com/docs/', cdx_api=server.url + '/cdx', page_size=2, max_pages=1)
+    assert not complete
+    assert len(keys) == 2
+
+
+def test_resolve_availability_batches_groups_and_checks_leftovers(stub_server):
+    server = stub_server(cdx_handler)
+    base = 'https://damiensfiles.b-cdn.net/gesaffelstein-2024/'
+    grouped = [base + '01.jpg', base + '02.jpg', base + '03.jpg', base + 'index.html']
+    singles = ['https://github.com/alice', 'https://github.com/bob', 'https://github.com/carol']
+    checked = []
+
+    def check(url):
+        checked.append(url)
+        return url.endswith('alice')
+
+    results = resolve_availability(grouped + singles, check, cdx_api=server.url + '/cdx')
+    assert results == {base + '01.jpg': True, base + '02.jpg': True, base + '03.jpg': False,
+                       base + 'index.html': True, singles[0]: True, singles[1]: False, singles[2]: False}
+    # One prefix query for the four grouped URLs, none for github.com/
+    assert [params['url'] for _, _, params, _, _ in server.requests] == ['damiensfiles.b-cdn.net/gesaffelstein-2024/']
+    assert sorted(checked) == sorted(singles)
+
+
+def test_resolve_availability_falls_back_when_a_prefix_fails(stub_server):
+    server = stub_server(lambda *args: (503, b'', {}))
+    urls = ['https://example.com/docs/a', 'https://example.com/docs/b', 'https://example.com/docs/c']
+    errors = []
+    results = resolve_availability(urls, lambda url: False, cdx_api=server.url + '/cdx',
+                                   on_error=lambda url, e: errors.append(url))
+    assert results == {url: False for url in urls}
+    assert errors == ['example.com/docs/']
@@ -0,0 +1,117 @@
+import pytest
+
+from web_tool.github_enrich import GitHubEnricher, base_urls
+from web_tool.scheduler import RequestScheduler
+
+RELEASES_PAGE_1 = [
+    {'assets': [{'browser_download_url': 'https://github.com/alice/bricks/releases/download/v2/bricks.zip'}]},
+]
+RELEASES_PAGE_2 = [
+    {'assets': [{'browser_download_url': 'https://github.com/alice/bricks/releases/download/v1/bricks.zip'},
+                {'browser_download_url': 'https://github.com/alice/bricks/releases/download/v1/notes.pdf'}]},
+]
+
+
+def graphql_repo(download_urls, has_next=False):
+    return {'releases': {'pageInfo': {'hasNextPage': has_next},
+                         'nodes': [{'releaseAssets': {'nodes': [{'downloadUrl': url} for url in download_urls]}}]}}
+
+
+class FakeGitHub:
+    # Paginated releases with ETags, a GraphQL endpoint and a rate limit budget
+    def __init__(self, remaining=5000):
+        self.remaining = remaining
+        self.server = None
+
+    def __call__(self, method, path, params, headers, body):
+        rate = {'X-RateLimit-Remaining': str(self.remaining), 'X-RateLimit-Reset': '9999999999'}
+        if self.remaining <= 0:
+            return 403, {'message': 'API rate limit exceeded'}, rate
+        if method == 'POST' and path == '/graphql':
+            return 200, {'data': {'r0': graphql_repo(['https://example.com/a.zip']),
+                                  'r1': graphql_repo(['https://example.com/b.zip'], has_next=True)}}, rate
+        if path == '/repos/alice/bricks/releases':
+            page = params.get('page', '1')
+            etag = f'"releases-{page}"'
+            if headers.get('If-None-Match') == etag:
+                return 304, b'', dict(rate, ETag=etag)
+            rate['ETag'] = etag
+            if page == '1':
+                rate['Link'] = f'<{self.server.url}/repos/alice/bricks/releases?per_page=100&page=2>; rel="next"'
+                return 200, RELEASES_PAGE_1, rate
+            return 200, RELEASES_PAGE_2, rate
+        if path == '/repos/bob/kit/releases':
+            return 200, [], rate
+        return 404, {'message': 'Not Found'}, rate
+
+
+@pytest.fixture
+def github(stub_server):
+    fake = FakeGitHub()
+    fake.server = stub_server(fake)
+    return fake
+
+
+def make_enricher(github, tmp_path, token='secret'):
+    return GitHubEnricher(token=token, kinds=('releases',), cache_path=str(tmp_path / 'github.sqlite'),
+                          api_url=github.server.url, scheduler=RequestScheduler())
+
+
+def test_rest_follows_pages_and_revalidates_with_etags(github, tmp_path):
+    enricher = make_enricher(github, tmp_path)
+    urls = enricher.urls_for('https://github.com/alice/bricks')
+    assert urls == sorted(base_urls('alice', 'bricks') + [
+        'https://github.com/alice/bricks/releases/download/v1/bricks.zip',
+        'https://github.com/alice/bricks/releases/download/v1/notes.pdf',
+        'https://github.com/alice/bricks/releases/download/v2/bricks.zip',
+    ])
+    assert enricher.requests == 2
+    assert enricher.not_modified == 0
+
+    # A later run answers from the cache after two 304s
+    again = make_enricher(github, tmp_path)
+    assert again.urls_for('https://github.com/alice/bricks') == urls
+    assert again.not_modified == 2
+    assert [request[3].get('If-None-Match') for request in github.server.requests[2:]] == \
+        ['"releases-1"', '"releases-2"']
+
+
+def test_repeat_repos_are_served_from_memory(github, tmp_path):
+    enricher = make_enricher(github, tmp_path)
+    enricher.urls_for('https://github.com/alice/bricks')
+    enricher.urls_for('https://github.com/alice/bricks/')
+    assert enricher.requests == 2
+    assert enricher.run_hits == 1
+
+
+def test_without_a_token_only_archive_links_are_returned(github, tmp_path):
+    enricher = make_enricher(github, tmp_path, token=None)
+    assert enricher.urls_for('https://github.com/alice/bricks') == sorted(base_urls('alice', 'bricks'))
+    assert github.server.requests == []
+
+
+def test_exhausted_rate_limit_defers_the_repo(github, tmp_path):
+    github.remaining = 0
+    enricher = make_enricher(github, tmp_path)
+    assert enricher.urls_for('https://github.com/alice/bricks') == sorted(base_urls('alice', 'bricks'))
+    assert enricher.deferred_repo_urls() == ['https://github.com/alice/bricks']
+
+
+def test_low_budget_stops_spending_calls(github, tmp_path):
+    github.remaining = 50
+    enricher = make_enricher(github, tmp_path)
+    enricher.urls_for('https://github.com/alice/bricks')
+    # The first response reveals the budget is under the reserve; the second page isn't fetched
+    assert len(github.server.requests) == 1
+    assert enricher.deferred_repo_urls() == ['https://github.com/alice/bricks']
+
+
+def test_graphql_batches_repos_and_falls_back_to_rest_for_long_lists(github, tmp_path):
+    enricher = make_enricher(github, tmp_path)
+    results = enricher.urls_for_many(['https://github.com/carol/set', 'https://github.com/bob/kit'])
+    assert results['https://github.com/carol/set'] == sorted(base_urls('carol', 'set') + ['https://example.com/a.zip'])
+    # bob/kit had more releases than the first GraphQL page, so REST fetched them
+    assert results['https://github.com/bob/kit'] == sorted(base_urls('bob', 'kit'))
+    assert github.server.paths() == ['/graphql', '/repos/bob/kit/releases']
+    variables = github.server.requests[0][4]
+    assert b'"o0": "carol"' in variables and b'"n1": "kit"' in variables
@@ -0,0 +1,156 @@
+import base64
+import hashlib
+import json
+import os
+
+import pytest
+
+from web_tool import ia_upload
+from web_tool.ia_upload import IaUploader, UploadLedger, metadata_headers, upload_packages
+from web_tool.rate_limiter import RetryPolicy, TokenBucket
+from web_tool.scheduler import RequestScheduler
+
+
+class FakeS3:
+    # Stands in for IA's S3 endpoint: checks Content-MD5, answers with the MD5
+    # as ETag and creates an item on the first PUT into it
+    def __init__(self):
+        self.items = {}  # item -> {name: body}
+        self.metadata = {}  # item -> x-archive-meta-* headers of the creating PUT
+        self.fail = set()
+
+    def __call__(self, method, path, params, headers, body):
+        item, _, name = path.lstrip('/').partition('/')
+        if headers.get('Authorization') != 'LOW access:secret':
+            return 403, b'<Error><Code>AccessDenied</Code></Error>', {}
+        md5 = hashlib.md5(body).hexdigest()
+        if base64.b64decode(headers['Content-MD5']).hex() != md5:
+            return 400, b'<Error><Code>BadDigest</Code></Error>', {}
+        if name in self.fail:
+            return 500, b'', {}
+        if item not in self.items:
+            self.items[item] = {}
+            self.metadata[item] = {key.lower(): value for key, value in headers.items()
+                                   if key.lower().startswith('x-archive-')}
+        self.items[item][name] = body
+        return 200, b'', {'ETag': f'"{md5}"'}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(ia_upload, 'retry_policy', RetryPolicy(max_attempts=2, base_delay=0))
+    monkeypatch.setattr(ia_upload, 'upload_bucket', TokenBucket(rate=1000, burst=1000, max_rate=1000))
+
+
+@pytest.fixture
+def s3(stub_server):
+    fake = FakeS3()
+    fake.server = stub_server(fake)
+    return fake
+
+
+def write_object(objects_dir, data):
+    sha256 = hashlib.sha256(data).hexdigest()
+    os.makedirs(os.path.join(objects_dir, sha256[:2]), exist_ok=True)
+    with open(os.path.join(objects_dir, sha256[:2], sha256), 'wb') as f:
+        f.write(data)
+    return sha256
+
+
+def make_package(root, name, shared=b'body { color: red }'):
+    objects_dir = os.path.join(root, 'objects')
+    index = write_object(objects_dir, f'<html>{name}</html>'.encode())
+    css = write_object(objects_dir, shared)
+    os.makedirs(os.path.join(root, name))
+    with open(os.path.join(root, name, 'manifest.json'), 'w') as f:
+        json.dump({'url': f'https://example.com/{name}', 'index': index, 'warc': False,
+                   'resources': {'https://example.com/style.css': {
+                       'file': f'resources/{css}.css', 'sha256': css, 'size': len(shared), 'status': 200,
+                       'content_type': 'text/css'}}}, f)
+    return os.path.join(root, name)
+
+
+def make_uploader(s3, tmp_path):
+    return IaUploader(('access', 'secret'), ledger=UploadLedger(str(tmp_path / 'ledger.tsv')),
+                      endpoint=s3.server.url, scheduler=RequestScheduler())
+
+
+def test_metadata_headers():
+    assert metadata_headers({'title': 'Pages', 'subject': ['lego', 'bricks'], 'description': 'a\nb',
+                             'external_identifier': 'x'}) == {
+        'x-archive-meta-title': 'Pages',
+        'x-archive-meta01-subject': 'lego',
+        'x-archive-meta02-subject': 'bricks',
+        'x-archive-meta-description': 'uri(a%0Ab)',
+        'x-archive-meta-external--identifier': 'x',
+    }
+
+
+def test_upload_sends_metadata_only_with_the_creating_put(s3, tmp_path):
+    root = str(tmp_path / 'packages')
+    dirs = [make_package(root, name) for name in ('page-a', 'page-b')]
+    uploader = make_uploader(s3, tmp_path)
+    assert upload_packages(dirs, os.path.join(root, 'objects'), uploader, pages_per_item=10) == (2, 0)
+
+    [item] = s3.items
+    assert item.startswith('web_tool_pages_') and item.endswith('_001')
+    # Two manifests, two pages and the shared stylesheet once
+    assert len(s3.items[item]) == 5
+    puts = [headers for method, path, _, headers, _ in s3.server.requests]
+    creating = [headers for headers in puts if 'x-archive-meta-collection' in headers]
+    assert len(creating) == 1
+    assert not any('x-archive-size-hint' in headers for headers in puts if headers not in creating)
+    assert s3.metadata[item]['x-archive-meta-mediatype'] == 'web'
+
+
+def test_rerun_skips_verified_files_and_resumes_failures(s3, tmp_path):
+    root = str(tmp_path / 'packages')
+    dirs = [make_package(root, name) for name in ('page-a', 'page-b')]
+    s3.fail.add('page-b/index.html')
+    uploader = make_uploader(s3, tmp_path)
+    assert upload_packages(dirs, os.path.join(root, 'objects'), uploader, pages_per_item=10) == (0, 2)
+
+    s3.fail.clear()
+    count = len(s3.server.requests)
+    uploader = make_uploader(s3, tmp_path)
+    assert upload_packages(dirs, os.path.join(root, 'objects'), uploader, pages_per_item=10) == (2, 0)
+    assert [path.split('/', 2)[2] for path in s3.server.paths()[count:]] == ['page-b/index.html']
+    assert uploader.stats['files skipped'] == 4
+
+
+def test_items_stay_stable_when_the_package_set_changes(s3, tmp_path):
+    root = str(tmp_path / 'packages')
+    objects_dir = os.path.join(root, 'objects')
+    first = [make_package(root, name) for name in ('page-b', 'page-d', 'page-f')]
+    assert upload_packages(first, objects_dir, make_uploader(s3, tmp_path), pages_per_item=2) == (3, 0)
+    items = sorted(s3.items)
+    assert [sorted({name.split('/')[0] for name in s3.items[item] if '/' in name and not name.startswith('resources/')})
+            for item in items] == [['page-b', 'page-d'], ['page-f']]
+
+    # A new package that sorts first joins the open item instead of shifting everything
+    second = first[1:] + [make_package(root, 'page-a')]
+    assert upload_packages(second, objects_dir, make_uploader(s3, tmp_path), pages_per_item=2) == (3, 0)
+    assert sorted(s3.items) == items
+    assert 'page-a/index.html' in s3.items[items[1]]
+    assert 'page-a/index.html' not in s3.items[items[0]]
+
+
+def test_ledger_assignment_fills_open_items(tmp_path):
+    ledger = UploadLedger(str(tmp_path / 'ledger.tsv'))
+    assert ledger.assign(['a', 'b', 'c'], per_item=2, prefix='p', date='20260101') == \
+        {'p_20260101_001': ['a', 'b'], 'p_20260101_002': ['c']}
+    reopened = UploadLedger(str(tmp_path / 'ledger.tsv'))
+    assert reopened.assign(['c', 'd', 'e'], per_item=2, prefix='p', date='20260101') == \
+        {'p_20260101_002': ['c', 'd'], 'p_20260101_003': ['e']}
+
+
+def test_ledger_places_packages_from_older_ledgers(tmp_path):
+    path = tmp_path / 'ledger.tsv'
+    path.write_text('0' * 32 + '\tweb_tool_pages_0123456789abcdef/page-a/index.html\n'
+                    + '1' * 32 + '\tweb_tool_pages_0123456789abcdef/resources/x.css\n'
+                    + '2' * 32 + '\tweb_tool_pages_0123')
+    ledger = UploadLedger(str(path))
+    assert ledger.assign(['page-a'], per_item=2, prefix='web_tool_pages') == \
+        {'web_tool_pages_0123456789abcdef': ['page-a']}
+    # The partial last line was dropped and nothing new was assigned
+    assert path.read_text().count('\n') == 2
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from web_tool import liveness
+from web_tool.liveness import LivenessChecker
+from web_tool.liveness_cache import LivenessCache
+from web_tool.scheduler import RequestScheduler
+
+
+def scripted(monkeypatch, outcomes):
+    # probe_url answers from outcomes[host], a list consumed in order (the last answer repeats)
+    probed = []
+    lock = threading.Lock()
+
+    def probe(url):
+        host = url.split('/')[2]
+        with lock:
+            probed.append(url)
+            answers = outcomes[host]
+            return answers.pop(0) if len(answers) > 1 else answers[0]
+
+    monkeypatch.setattr(liveness, 'probe_url', probe)
+    return probed
+
+
+def test_one_dns_failure_does_not_mark_the_host(monkeypatch, tmp_path):
+    probed = scripted(monkeypatch, {'flaky.example': ['dns', 'live']})
+    cache = LivenessCache(str(tmp_path / 'liveness.sqlite'))
+    checker = LivenessChecker(cache, RequestScheduler(default_host_limit=1))
+    assert checker.check(['https://flaky.example/a', 'https://flaky.example/b']) == \
+        {'https://flaky.example/a': False, 'https://flaky.example/b': True}
+    assert len(probed) == 2
+    assert cache.host_state('flaky.example') is None
+
+
+def test_repeated_dns_failures_mark_the_host(monkeypatch, tmp_path):
+    probed = scripted(monkeypatch, {'gone.example': ['dns']})
+    cache = LivenessCache(str(tmp_path / 'liveness.sqlite'))
+    checker = LivenessChecker(cache, RequestScheduler(default_host_limit=1))
+    urls = [f'https://gone.example/{i}' for i in range(6)]
+    assert not any(checker.check(urls).values())
+    assert len(probed) == liveness.DNS_FAILURES
+    assert cache.host_state('gone.example')[0] == 'dns'
+
+
+def test_half_open_host_gets_exactly_one_trial_probe(monkeypatch, tmp_path):
+    probed = scripted(monkeypatch, {'down.example': ['unreachable']})
+    cache = LivenessCache(str(tmp_path / 'liveness.sqlite'))
+    cache.mark_host_down('down.example', 'unreachable', -1)  # the cooldown has just ended
+    checker = LivenessChecker(cache, RequestScheduler())
+    urls = [f'https://down.example/{i}' for i in range(10)]
+    assert not any(checker.check(urls).values())
+    assert len(probed) == 1
+    reason, expires = cache.host_state('down.example')
+    assert reason == 'unreachable' and expires > time.time()
+
+
+def test_half_open_host_that_answers_is_probed_again(monkeypatch, tmp_path):
+    probed = scripted(monkeypatch, {'back.example': ['live']})
+    cache = LivenessCache(str(tmp_path / 'liveness.sqlite'))
+    cache.mark_host_down('back.example', 'unreachable', -1)
+    checker = LivenessChecker(cache, RequestScheduler())
+    urls = [f'https://back.example/{i}' for i in range(5)]
+    assert all(checker.check(urls).values())
+    assert len(probed) == 5
+    assert checker.outcomes['trial probes'] == 1
+    assert cache.host_state('back.example') is None
+
+
+def test_cache_expiry_and_size_cap(tmp_path):
+    cache = LivenessCache(str(tmp_path / 'liveness.sqlite'), live_ttl=-1, max_entries=2)
+    cache.put('https://a.example/', True)
+    assert cache.get('https://a.example/') is None
+    cache.live_ttl = 3600
+    for name in 'bcd':
+        cache.put(f'https://{name}.example/', True)
+    cache.evict()
+    assert [cache.get(f'https://{name}.example/') for name in 'bcd'] == [None, True, True]
+    cache.close()
@@ -0,0 +1,38 @@
+import os
+
+from web_tool.crawler import page_links
+from web_tool.extract import parse_page
+from web_tool.parse_pool import ParsePool
+
+PAGE = (b'<html><a href="/about">About</a><img src="https://cdn.example/a.png">'
+        b'<div data-src="https://media.example/v.mp4"></div>'
+        b'<script>var x = "https://ideascdn.lego.com/media/generate/lego_ci/abc/legacy";</script>'
+        b'<!-- <a href="/hidden"> --></html>')
+
+
+def shm_blocks():
+    return set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+
+
+def test_pool_matches_parsing_in_thread():
+    expected = parse_page(PAGE, 'https://example.com/')
+    big = PAGE + b' ' * 4096
+    before = shm_blocks()
+    pool = ParsePool(processes=2, shm_threshold=1024)
+    try:
+        assert pool.run(parse_page, PAGE, 'https://example.com/') == expected
+        assert pool.run(parse_page, big, 'https://example.com/') == expected
+        assert pool.run(page_links, big, 'https://example.com/', 'utf-8') == {
+            'https://example.com/about', 'https://ideascdn.lego.com/media/generate/lego_ci/abc/webp'}
+    finally:
+        pool.close()
+    assert pool.counts == {'pickled': 1, 'shared memory': 2}
+    assert shm_blocks() == before
+
+
+def test_single_process_parses_in_thread():
+    pool = ParsePool(processes=1)
+    links, found = pool.run(parse_page, PAGE, 'https://example.com/')
+    assert links == {'https://example.com/about'}
+    assert 'https://ideascdn.lego.com/media/generate/lego_ci/abc/webp' in found
+    assert pool.counts == {'in thread': 1} and pool._executor is None
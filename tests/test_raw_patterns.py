@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from web_tool.crawler import page_links
+from web_tool.raw_patterns import BUILTIN_RULES, Rule, RuleSet, load_rules
+
+LEGO = 'https://ideascdn.lego.com/media/generate/lego_ci/'
+
+
+def upper(url):
+    return url.upper()
+
+
+def test_builtin_rules_match_the_old_scans():
+    page = (f'<img src="{LEGO}abc/legacy"><script>x = \'{LEGO}def/thumb\';</script>'
+            f'var m = "https://www.mecabricks.com/en/models/123";'
+            f'<a href=https://www.mecabricks.com/en/user/x>x</a> {LEGO}open-ended').encode()
+    assert RuleSet(BUILTIN_RULES).scan(page) == {
+        f'{LEGO}abc/webp', f'{LEGO}def/thumb',
+        'https://www.mecabricks.com/en/models/123', 'https://www.mecabricks.com/en/user/x'}
+
+
+def test_longest_prefix_and_patterns_share_one_scan():
+    rules = RuleSet([Rule('site', prefix='https://a.example/'),
+                     Rule('media', prefix='https://a.example/media/', rewrite=upper),
+                     Rule('numbered', pattern=r'https://(b|c)\.example/\d+/', terminators='" ')])
+    page = (b'"https://a.example/x" "https://a.example/media/y" '
+            b'"https://b.example/12/z" "https://c.example/no/"')
+    assert rules.scan(page) == {'https://a.example/x', 'HTTPS://A.EXAMPLE/MEDIA/Y', 'https://b.example/12/z'}
+    rules.add(Rule('c', prefix='https://c.example/'))
+    assert 'https://c.example/no/' in rules.scan(page)
+    with pytest.raises(ValueError):
+        rules.add(Rule('c', prefix='https://d.example/'))
+    assert RuleSet().scan(page) == set()
+
+
+def test_rules_from_config(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps([{'name': 'shout', 'prefix': 'https://s.example/', 'rewrite': f'{__name__}:upper'},
+                                {'name': 'plain', 'pattern': r'https://p\.example/', 'terminators': '<'}]))
+    rules = RuleSet(load_rules(str(path)))
+    assert rules.scan(b'"https://s.example/a" https://p.example/b<') == {'HTTPS://S.EXAMPLE/A', 'https://p.example/b'}
+    with pytest.raises(ValueError):
+        Rule('both', prefix='https://x/', pattern='https://x/')
+
+
+def test_crawler_links_include_urls_from_scripts():
+    page = b'<script>load("https://www.mecabricks.com/en/models/9")</script><a href="/about">a</a>'
+    assert page_links(page, 'https://www.mecabricks.com/', 'utf-8') == {
+        'https://www.mecabricks.com/about', 'https://www.mecabricks.com/en/models/9'}
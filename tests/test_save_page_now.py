@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from web_tool import save_page_now
+from web_tool.rate_limiter import RetryPolicy, TokenBucket
+from web_tool.save_page_now import SaveJobs
+from web_tool.sharding import merge, read_checkpoint, run_shard
+
+
+class FakeSpn2:
+    # Stands in for Save Page Now 2: POST /save starts a job that stays pending
+    # for `pending` status checks, then ends with the URL's outcome
+    def __init__(self, pending=1, outcomes=None, capture_seconds=0.0):
+        self.pending = pending
+        self.outcomes = outcomes or {}  # url -> status_ext of a failed capture, or 'never' to stay pending
+        self.capture_seconds = capture_seconds
+        self.jobs = {}  # job ID -> [url, status checks so far]
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, method, path, params, headers, body):
+        if method == 'POST' and path == '/save':
+            with self.lock:
+                job_id = f"job-{len(self.jobs)}"
+                self.jobs[job_id] = [params['url'], 0]
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+            return 200, {'url': params['url'], 'job_id': job_id}, {}
+        job_id = path.rsplit('/', 1)[1]
+        with self.lock:
+            job = self.jobs[job_id]
+            job[1] += 1
+            url, checks = job
+        outcome = self.outcomes.get(url)
+        if checks <= self.pending or outcome == 'never':
+            time.sleep(self.capture_seconds)
+            return 200, {'status': 'pending', 'job_id': job_id}, {}
+        with self.lock:
+            self.active -= 1
+        if outcome:
+            return 200, {'status': 'error', 'status_ext': outcome, 'job_id': job_id,
+                         'message': 'Capture failed'}, {}
+        return 200, {'status': 'success', 'job_id': job_id, 'timestamp': '20240101000000'}, {}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(save_page_now, 'retry_policy', RetryPolicy(max_attempts=2, base_delay=0.01, max_delay=0.01))
+    monkeypatch.setattr(save_page_now, 'save_bucket', TokenBucket(rate=1000.0, burst=100, max_rate=1000.0))
+    monkeypatch.setattr(save_page_now, 'status_bucket', TokenBucket(rate=1000.0, burst=100, max_rate=1000.0))
+
+
+def make_jobs(server, max_jobs=5, job_timeout=5):
+    return SaveJobs(max_jobs, server.url + '/save', credentials=(), poll_interval=0.01, job_timeout=job_timeout)
+
+
+def test_success_only_after_job_reports_it(stub_server):
+    spn2 = FakeSpn2(pending=2)
+    server = stub_server(spn2)
+    assert make_jobs(server).run(['https://example.com/a']) == {'https://example.com/a': (True, '20240101000000')}
+    assert server.paths() == ['/save'] + ['/save/status/job-0'] * 3
+    method, _, params, headers, _ = server.requests[0]
+    assert (method, params, headers['Accept']) == ('POST', {'url': 'https://example.com/a'}, 'application/json')
+    assert 'Authorization' not in headers
+
+
+def test_failed_capture_carries_status_ext(stub_server):
+    server = stub_server(FakeSpn2(outcomes={'https://example.com/gone': 'error:not-found'}))
+    results = make_jobs(server).run(['https://example.com/gone', 'https://example.com/ok'])
+    assert results == {'https://example.com/gone': (False, 'error:not-found'),
+                       'https://example.com/ok': (True, '20240101000000')}
+
+
+def test_job_still_pending_times_out(stub_server):
+    server = stub_server(FakeSpn2(outcomes={'https://example.com/slow': 'never'}))
+    assert make_jobs(server, job_timeout=0.1).run(['https://example.com/slow']) == {
+        'https://example.com/slow': (False, 'timeout')}
+
+
+def test_credentials_are_sent(stub_server):
+    server = stub_server(FakeSpn2(pending=0))
+    SaveJobs(1, server.url + '/save', credentials=('access', 'secret'), poll_interval=0.01).run(['https://example.com/'])
+    assert {headers['Authorization'] for _, _, _, headers, _ in server.requests} == {'LOW access:secret'}
+
+
+def test_jobs_in_flight_are_bounded(stub_server):
+    spn2 = FakeSpn2(pending=3, capture_seconds=0.02)
+    server = stub_server(spn2)
+    jobs = make_jobs(server, max_jobs=3)
+    urls = [f"https://example.com/{i}" for i in range(12)]
+    results = jobs.run(urls)
+    assert all(saved for saved, _ in results.values()) and len(results) == 12
+    assert jobs.peak_jobs == 3
+    assert 1 < spn2.peak <= 3
+
+
+def test_shard_checkpoint_records_reasons_and_merge_keeps_failures(stub_server, tmp_path, capsys):
+    server = stub_server(FakeSpn2(outcomes={'https://example.com/b': 'error:blocked-url'}))
+    shard = tmp_path / 'batch_00'
+    shard.write_text('https://example.com/a\nhttps://example.com/b\n')
+    checkpoint = tmp_path / 'checkpoint_0.txt'
+    assert run_shard(str(shard), str(checkpoint), make_jobs(server)) == (1, 1)
+    statuses = {url: status for status, _, url in read_checkpoint(str(checkpoint))}
+    assert statuses == {'https://example.com/a': 'ok', 'https://example.com/b': 'failed:error:blocked-url'}
+
+    listing = tmp_path / 'output_urls.txt'
+    listing.write_text('https://example.com/a\nhttps://example.com/b\n')
+    assert merge([str(checkpoint)], str(listing)) == (1, 1)
+    assert listing.read_text() == 'https://example.com/b\n'
+    assert '1 failed: error:blocked-url' in capsys.readouterr().out
@@ -0,0 +1,132 @@
+import time
+
+from web_tool import sharding
+from web_tool.liveness_cache import LivenessCache
+from web_tool.save_queue import SaveQueue, classify
+from web_tool.sharding import merge
+from web_tool.url_store import UrlStore
+from web_tool.wayback_cache import AvailabilityCache
+
+PAGE = 'https://example.com/page'
+HOME = 'https://example.com/'
+ASSET = 'https://cdn.example.net/a.png'
+RELEASE = 'https://github.com/o/r/releases/download/v1/r.zip'
+
+
+def make_queue(tmp_path, **kwargs):
+    return SaveQueue(str(tmp_path / 'queue.sqlite'), **kwargs)
+
+
+def count_scores(signals):
+    return float(signals['failures'])
+
+
+def test_classify():
+    assert [classify(url) for url in (PAGE, HOME, ASSET, RELEASE)] == ['page', 'homepage', 'cdn-asset',
+                                                                       'release-asset']
+
+
+def test_never_captured_and_ephemeral_urls_come_first(tmp_path):
+    queue = make_queue(tmp_path)
+    assert queue.add([HOME, PAGE, ASSET, RELEASE, PAGE]) == 4
+    queue.record_captures({HOME: False, PAGE: True, ASSET: True}, capture_time=time.time() - 30 * 24 * 3600)
+    # HOME never captured, RELEASE not checked, ASSET and PAGE captured a month ago
+    assert queue.take(4) == [HOME, RELEASE, ASSET, PAGE]
+    assert queue.take(2) == [HOME, RELEASE]
+    queue.record_captures({PAGE: True}, capture_time=time.time() - 3 * 365 * 24 * 3600)
+    assert queue.take(4) == [HOME, RELEASE, PAGE, ASSET]
+    queue.close()
+
+
+def test_only_touched_rows_are_rescored(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.add([f'https://example.com/{i}' for i in range(100)])
+    queue.record_failures({'https://example.com/7': 'error:too-many-daily-captures'})
+    assert queue.stats['rescored'] == 1
+    assert queue.take(100)[-1] == 'https://example.com/7'
+    queue.record_failures({'https://example.com/7': 'error:not-found'})
+    assert queue.scores(['https://example.com/7'])['https://example.com/7'] < -400
+    queue.close()
+
+
+def test_sync_keeps_signals_of_listed_urls(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.add([PAGE, HOME])
+    queue.record_failures({PAGE: 'timeout'})
+    assert queue.sync([PAGE, ASSET]) == (1, 1)
+    assert sorted(queue.take(10)) == sorted([PAGE, ASSET])
+    assert queue.take(1) == [ASSET]
+    queue.remove([ASSET])
+    assert len(queue) == 1
+    queue.close()
+
+
+def test_full_queue_drops_lowest_scores(tmp_path):
+    queue = make_queue(tmp_path, max_entries=2)
+    queue.add([PAGE, HOME])
+    queue.record_failures({PAGE: 'timeout'})
+    queue.add([ASSET])
+    assert queue.take(10) == [ASSET, HOME]
+    assert queue.stats['dropped'] == 1
+    queue.close()
+
+
+def test_refresh_reads_the_caches(tmp_path):
+    wayback = AvailabilityCache(str(tmp_path / 'wayback.sqlite'))
+    liveness = LivenessCache(str(tmp_path / 'liveness.sqlite'))
+    wayback.put(PAGE, False)
+    wayback.put(ASSET, True)
+    liveness.put(RELEASE, False)
+    liveness.mark_host_down('example.com', 'dns', -60)  # down before, back up now
+    queue = make_queue(tmp_path)
+    queue.add([PAGE, ASSET, RELEASE])
+    queue.refresh(wayback, liveness)
+    scores = queue.scores([PAGE, ASSET, RELEASE])
+    assert queue.take(3) == [PAGE, ASSET, RELEASE]
+    assert scores[PAGE] > 100 and scores[RELEASE] < 0
+
+    rescored = queue.stats['rescored']
+    queue.refresh(wayback, liveness)
+    assert queue.stats['rescored'] == rescored  # nothing changed
+    liveness.mark_host_down('example.com', 'dns', 3600)
+    queue.refresh(None, liveness)
+    assert queue.take(3) == [ASSET, PAGE, RELEASE]
+    for cache in (wayback, liveness, queue):
+        cache.close()
+
+
+def test_pluggable_scorer(tmp_path):
+    queue = make_queue(tmp_path, scorer=count_scores)
+    queue.add([PAGE, HOME])
+    queue.record_failures({HOME: 'timeout'})
+    assert queue.take(2) == [HOME, PAGE]
+    queue.close()
+
+    queue = make_queue(tmp_path)
+    assert queue.take(2) == [HOME, PAGE]  # stored scores stay until rescored
+    assert queue.rescore() == 2
+    assert queue.take(2) == [PAGE, HOME]
+    queue.close()
+
+
+def test_split_orders_shards_and_merge_updates_queue(tmp_path):
+    queue_path = str(tmp_path / 'queue.sqlite')
+    queue = SaveQueue(queue_path)
+    queue.add([PAGE, HOME, ASSET])
+    queue.record_captures({HOME: False, ASSET: True, PAGE: True})
+    queue.close()
+    list_path = tmp_path / 'urls.txt'
+    list_path.write_text(f"{PAGE}\n{HOME}\n{ASSET}\n")
+    out_dir = tmp_path / 'splits'
+    sharding.main(['split', str(list_path), '--shards', '1', '--out-dir', str(out_dir),
+                   '--costs', str(tmp_path / 'costs.json'), '--queue', queue_path])
+    shard = next(out_dir.iterdir())
+    assert shard.read_text().split() == [HOME, ASSET, PAGE]
+
+    checkpoint = tmp_path / 'checkpoint.txt'
+    checkpoint.write_text(f"ok\t1.0\t{HOME}\nfailed:error:not-found\t1.0\t{ASSET}\n")
+    queue = SaveQueue(queue_path)
+    merge([str(checkpoint)], str(list_path), queue=queue)
+    assert list(UrlStore(str(list_path))) == [ASSET, PAGE]
+    assert queue.take(3) == [PAGE, ASSET]
+    queue.close()
@@ -0,0 +1,79 @@
+import os
+
+from web_tool.url_store import UrlStore
+
+
+def read(path):
+    with open(path) as f:
+        return f.read().split()
+
+
+def test_compact_folds_the_journal_into_a_sorted_snapshot(tmp_path):
+    path = str(tmp_path / 'urls.txt')
+    with open(path, 'w') as f:
+        f.write('https://b.example/\nhttps://a.example/\n')
+    store = UrlStore(path)
+    store.add(['https://c.example/', 'https://a.example/'])
+    store.remove(['https://b.example/'])
+    assert list(store) == ['https://a.example/', 'https://c.example/']
+    assert store.compact() == 2
+    assert read(path) == ['https://a.example/', 'https://c.example/']
+    assert not os.path.exists(store.journal_path)
+    assert store.pending() == 0
+
+
+def test_records_added_during_a_compaction_survive_it(tmp_path):
+    path = str(tmp_path / 'urls.txt')
+    with open(path, 'w') as f:
+        f.write('https://a.example/\nhttps://c.example/\n')
+    store = UrlStore(path)
+    store.add(['https://b.example/'])
+    snapshot = store._snapshot
+
+    def slow_snapshot():
+        # Another thread adds and removes while compact() streams the old snapshot
+        for i, url in enumerate(snapshot()):
+            if i == 1:
+                store.add(['https://late.example/'])
+                store.remove(['https://a.example/'])
+            yield url
+
+    store._snapshot = slow_snapshot
+    assert store.compact() == 3
+    store._snapshot = snapshot
+    assert read(path) == ['https://a.example/', 'https://b.example/', 'https://c.example/']
+    assert list(store) == ['https://b.example/', 'https://c.example/', 'https://late.example/']
+    assert list(UrlStore(path)) == ['https://b.example/', 'https://c.example/', 'https://late.example/']
+
+
+def test_an_interrupted_compaction_loses_no_records(tmp_path):
+    path = str(tmp_path / 'urls.txt')
+    store = UrlStore(path)
+    store.add(['https://a.example/'])
+
+    def failing():
+        store.add(['https://b.example/'])
+        yield 'https://a.example/'
+        raise OSError('disk full')
+
+    store._snapshot = failing
+    try:
+        store.compact()
+    except OSError:
+        pass
+    del store._snapshot
+    assert list(store) == ['https://a.example/', 'https://b.example/']
+    assert not os.path.exists(store.rotated_path)
+    assert list(UrlStore(path)) == ['https://a.example/', 'https://b.example/']
+
+
+def test_a_leftover_rotated_journal_is_replayed_first(tmp_path):
+    path = str(tmp_path / 'urls.txt')
+    with open(path + '.journal.compacting', 'w') as f:
+        f.write('+https://a.example/\n+https://b.example/\n')
+    with open(path + '.journal', 'w') as f:
+        f.write('-https://a.example/\n')
+    store = UrlStore(path)
+    assert list(store) == ['https://b.example/']
+    assert not os.path.exists(store.rotated_path)
+    assert store.compact() == 1
@@ -0,0 +1,69 @@
+import gzip
+import random
+from collections import Counter
+
+from web_tool import url_set as url_set_module
+from web_tool import url_stream
+from web_tool.url_set import UrlSet, import_text
+from web_tool.url_store import UrlStore
+from web_tool.url_stream import open_list, reservoir_sample, sorted_unique, subtract
+
+
+def test_reservoir_sample_is_uniform():
+    assert sorted(reservoir_sample(range(5), 10)) == [0, 1, 2, 3, 4]
+    assert reservoir_sample(range(5), 0) == []
+    rng = random.Random(1)
+    counts = Counter()
+    for _ in range(4000):
+        sample = reservoir_sample(range(100), 5, rng)
+        assert len(set(sample)) == 5
+        counts.update(sample)
+    # Each item is expected 200 times
+    assert min(counts.values()) > 140 and max(counts.values()) < 260
+
+
+def test_sorted_unique_spills_and_merges_runs(monkeypatch, tmp_path):
+    monkeypatch.setattr(url_stream, 'MERGE_FAN_IN', 3)
+    urls = [f"https://example.com/{i % 250}" for i in range(1000)]
+    random.Random(2).shuffle(urls)
+    assert list(sorted_unique(urls, chunk_size=40, tmp_dir=tmp_path)) == sorted(set(urls))
+    assert list(tmp_path.iterdir()) == []
+    assert list(sorted_unique([b'b', b'a', b'b'] * 10, chunk_size=4)) == [b'a', b'b']
+    assert list(sorted_unique(['b', 'a', 'b'])) == ['a', 'b']
+
+
+def test_subtract():
+    assert list(subtract(['a', 'b', 'c', 'e'], ['b', 'd', 'e', 'f'])) == ['a', 'c']
+    assert list(subtract(['a'], [])) == ['a']
+
+
+def test_gzip_lists_are_read_directly(tmp_path):
+    path = tmp_path / 'source_urls.txt.gz'
+    with gzip.open(path, 'wt') as f:
+        f.write('https://b.example/\nhttps://a.example/\n\n')
+    store = UrlStore(str(path))
+    assert list(store) == ['https://a.example/', 'https://b.example/']
+    store.remove(['https://b.example/'])
+    store.add(['https://c.example/'])
+    assert store.compact() == 2
+    with gzip.open(path, 'rt') as f:
+        assert f.read() == 'https://a.example/\nhttps://c.example/\n'
+    with open_list(str(path)) as f:
+        assert f.readline() == 'https://a.example/\n'
+
+    import_text(str(tmp_path / 'set.urlset'), str(path))
+    url_set = UrlSet(str(tmp_path / 'set.urlset'))
+    assert list(url_set) == [b'https://a.example/', b'https://c.example/']
+    assert 'https://c.example/' in url_set and 'https://b.example/' not in url_set
+    url_set.close()
+
+
+def test_urlset_written_in_spilled_batches(monkeypatch, tmp_path):
+    monkeypatch.setattr(url_set_module, 'OFFSET_BATCH', 7)
+    urls = [f"https://example.com/{i:03d}".encode() for i in range(100)]
+    path = str(tmp_path / 'big.urlset')
+    assert url_set_module.write_urlset(path, urls) == 100
+    url_set = UrlSet(path)
+    assert list(url_set) == urls
+    assert all(url in url_set for url in urls) and b'https://example.com/100' not in url_set
+    url_set.close()
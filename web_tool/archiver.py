@@ -0,0 +1,106 @@
+import argparse
+
+from web_tool import extract, http_client
+from web_tool.availability import check_availability
+from web_tool.github_enrich import GitHubEnricher
+from web_tool.parse_pool import get_parse_pool
+from web_tool.save_page_now import SaveJobs, save_bucket
+from web_tool.save_queue import SaveQueue
+from web_tool.url_store import UrlStore
+from web_tool.url_stream import reservoir_sample
+from web_tool.wayback_cache import AvailabilityCache
+
+MAX_URLS_TO_ARCHIVE = 20
+MAX_QUEUED = 100000  # URLs left over for later runs; the lowest-scoring go first
+
+
+class Archiver:
+    def __init__(self, max_urls=MAX_URLS_TO_ARCHIVE, cache=None, github=None, jobs=None, queue=None):
+        self.max_urls = max_urls
+        self.cache = cache or AvailabilityCache()
+        self.github = github or GitHubEnricher(kinds=('releases',))
+        self.jobs = jobs or SaveJobs()
+        self.queue = queue or SaveQueue(max_entries=MAX_QUEUED)
+        self.archived_urls = 0
+        self.already_archived_urls = 0
+        self.failed_urls = 0
+
+    def archive_page(self, source_url):
+        all_urls = extract.fetch_urls(source_url, self.github)
+        all_urls.add(source_url)  # Add the source URL itself
+        print(f"Found {len(all_urls)} URLs. Checking which are archived...")
+
+        # URLs whose status couldn't be checked are queued with an unknown capture
+        archived = check_availability(all_urls, self.cache)
+        done = [url for url in all_urls if archived.get(url)]
+        self.already_archived_urls += len(done)
+        pending = {url: archived.get(url) for url in all_urls if not archived.get(url)}
+        self.queue.remove(done)
+        self.queue.add(pending)
+        self.queue.record_captures(pending)
+
+        # The budget goes to the highest-scoring URLs, from this page or ones
+        # left over from earlier runs; captures run concurrently and a URL
+        # counts once its job has succeeded
+        to_save = self.queue.take(self.max_urls)
+        print(f"Archiving {len(to_save)} of {len(self.queue)} queued URLs")
+        failures = {}
+        for url, (saved, reason) in self.jobs.run(to_save).items():
+            if saved:
+                print(f"Successfully archived: {url}")
+                self.cache.put(url, True)
+                self.archived_urls += 1
+            else:
+                print(f"Failed to archive {url}: {reason}")
+                failures[url] = reason
+                self.failed_urls += 1
+        self.queue.remove(url for url in to_save if url not in failures)
+        self.queue.record_failures(failures)
+
+    def run(self, source_path='source_urls.txt'):
+        source_store = UrlStore(source_path)
+        sample = reservoir_sample(source_store, 1)
+        if not sample:
+            print(f"No source URLs left in {source_path}")
+            return
+        source_url = sample[0]
+        print(f"Processing source URL: {source_url}")
+        try:
+            self.archive_page(source_url)
+        finally:
+            # Remove the source URL regardless of the archiving results
+            source_store.remove([source_url])
+            source_store.add(self.github.deferred_repo_urls())
+            source_store.compact()
+            print(f"Removed {source_url} from {source_path}")
+
+    def report(self):
+        self.cache.report()
+        http_client.report()
+        get_parse_pool().report()
+        self.github.report()
+        self.queue.report()
+        print(f"Save Page Now: {save_bucket.throttles} throttled responses, final rate {save_bucket.rate:.3f}/s, "
+              f"up to {self.jobs.peak_jobs} jobs in flight")
+        print(f"Process complete. Archived {self.archived_urls} new URLs, {self.already_archived_urls} were already "
+              f"archived, {self.failed_urls} failed to archive.")
+
+    def close(self):
+        self.cache.close()
+        self.queue.close()
+        get_parse_pool().close()
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Save the unarchived URLs of one random source page")
+    parser.add_argument('--sources', default='source_urls.txt')
+    parser.add_argument('--max-urls', type=int, default=MAX_URLS_TO_ARCHIVE)
+    args = parser.parse_args(argv)
+
+    archiver = Archiver(args.max_urls)
+    try:
+        archiver.run(args.sources)
+    finally:
+        archiver.report()
+        archiver.close()
+    return 0
@@ -0,0 +1,88 @@
+import argparse
+import contextlib
+import os
+import sys
+
+from web_tool import http_client, metrics
+from web_tool.canonicalize import canonicalize_file, get_canonicalizer
+from web_tool.cdx_batch import resolve_availability
+
+AVAILABILITY_API_URL = os.getenv('AVAILABILITY_API_URL', 'http://archive.org/wayback/available')
+AVAILABILITY_TIMEOUT = 15
+PRUNE_BATCH_SIZE = 1000
+
+
+def fetch_archive_status(url):
+    with metrics.stage('availability', url):
+        response = http_client.get(AVAILABILITY_API_URL, params={'url': url}, timeout=AVAILABILITY_TIMEOUT)
+        return response.json()['archived_snapshots'] != {}
+
+
+def check_availability(urls, cache=None, scheduler=None, on_error=None):
+    # CDX prefix queries for clustered URLs, the availability API for the rest
+    return resolve_availability(urls, fetch_archive_status, cache, scheduler, on_error)
+
+
+def prune_archived(store, cache=None, batch_size=PRUNE_BATCH_SIZE, on_error=None):
+    removed = 0
+    batch = []
+    for url in store:
+        batch.append(url)
+        if len(batch) >= batch_size:
+            removed += _prune_batch(store, batch, cache, on_error)
+            batch = []
+    if batch:
+        removed += _prune_batch(store, batch, cache, on_error)
+    return removed
+
+
+def _prune_batch(store, batch, cache, on_error):
+    archived = check_availability(batch, cache, on_error=on_error)
+    # Iteration reads the snapshot, so queued removals don't disturb it
+    archived_urls = [url for url in batch if archived.get(url)]
+    store.remove(archived_urls)
+    print(f"{len(archived_urls)} of {len(batch)} URLs already archived")
+    return len(archived_urls)
+
+
+def _read_args_or_stdin(urls):
+    if urls:
+        return urls
+    return [line.strip() for line in sys.stdin if line.strip()]
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Check URLs against the Wayback Machine")
+    parser.add_argument('urls', nargs='*', help="URLs to check (default: one per line on stdin)")
+    parser.add_argument('--archived', action='store_true', help="print archived URLs instead of unarchived ones")
+    parser.add_argument('--prune', metavar='FILE', help="remove archived URLs from a URL list file instead")
+    args = parser.parse_args(argv)
+
+    from web_tool.wayback_cache import AvailabilityCache
+    cache = AvailabilityCache()
+    # Failed lookups are counted by the 'availability' and 'cdx' stages
+    metrics.enable()
+    try:
+        if args.prune:
+            from web_tool.url_store import UrlStore
+            # Variants of the same URL would otherwise each cost a lookup
+            canonicalize_file(args.prune)
+            store = UrlStore(args.prune)
+            removed = prune_archived(store, cache)
+            print(f"Compacted {args.prune} to {store.compact()} URLs after removing {removed}", file=sys.stderr)
+        else:
+            urls = _read_args_or_stdin(args.urls)
+            archived = check_availability(urls, cache)
+            for url in dict.fromkeys(urls):
+                # URLs that couldn't be checked count as unarchived
+                if bool(archived.get(url)) == args.archived:
+                    sys.stdout.write(f"{url}\n")
+    finally:
+        # stdout carries the URL list, so statistics go to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            cache.report()
+            if args.prune:
+                get_canonicalizer().report()
+            metrics.report()
+        cache.close()
+    return 0
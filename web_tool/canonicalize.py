@@ -0,0 +1,224 @@
+import argparse
+import contextlib
+import itertools
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from urllib.parse import quote, urlsplit
+
+# One canonical spelling per URL so duplicates collapse before any request is
+# made: lowercase scheme and host, no default port, credentials or fragment
+# (except "#!" routes), tracking parameters stripped, the rest sorted, and
+# percent-escapes normalized (unreserved characters decoded, hex uppercased,
+# unsafe characters escaped). Anything that can't be archived is dropped.
+
+ALLOWED_SCHEMES = ('http', 'https')
+MAX_URL_LENGTH = 2048
+SORT_QUERY = True
+TRACKING_PARAMS = frozenset(os.getenv('CANONICAL_STRIP_PARAMS', ','.join([
+    'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid', 'twclid', 'igshid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok', 'ref_src',
+])).split(','))
+TRACKING_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+STREAM_BATCH = 100_000  # URLs per canonicalize_many call when streaming a list
+
+PATH_SAFE = "/%:@!$&'()*+,;=~"
+QUERY_SAFE = PATH_SAFE + "?"
+_UNRESERVED = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+_ESCAPE = re.compile(r'%([0-9A-Fa-f]{2})')
+# Lowercase http(s) host without port or credentials, then a path and query of
+# plain characters (no escapes, no fragment). Most list entries match, and only
+# their query needs any work, so they skip urlsplit and quoting entirely.
+_PLAIN = re.compile(r"(https?://[a-z0-9-]+(?:\.[a-z0-9-]+)*)(/[A-Za-z0-9\-._~!$&'()*+,;=:@/]*)?"
+                    r"(?:\?([A-Za-z0-9\-._~!$&'()*+,;=:@/?]*))?\Z")
+
+
+def _fix_escape(match):
+    char = chr(int(match.group(1), 16))
+    return char if char in _UNRESERVED else '%' + match.group(1).upper()
+
+
+def _normalize_escapes(value, safe):
+    value = quote(value, safe=safe)
+    return _ESCAPE.sub(_fix_escape, value) if '%' in value else value
+
+
+class Canonicalizer:
+    def __init__(self, strip_params=TRACKING_PARAMS, strip_prefixes=TRACKING_PREFIXES, sort_query=SORT_QUERY,
+                 max_length=MAX_URL_LENGTH, schemes=ALLOWED_SCHEMES):
+        self.strip_params = frozenset(param.lower() for param in strip_params if param)
+        self.strip_prefixes = tuple(strip_prefixes)
+        self.sort_query = sort_query
+        self.max_length = max_length
+        self.schemes = frozenset(schemes)
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def _reject(self, url):
+        # Returns the reason a URL is dropped, or None
+        if len(url) > self.max_length:
+            return 'too long'
+        scheme = url.split(':', 1)[0].lower() if ':' in url else ''
+        if scheme not in self.schemes:
+            return 'scheme'
+        return None
+
+    def _query(self, query, plain=False):
+        params = []
+        for param in query.split('&'):
+            if not param:
+                continue
+            key = param.split('=', 1)[0].lower()
+            if key in self.strip_params or key.startswith(self.strip_prefixes):
+                continue
+            params.append(param if plain else _normalize_escapes(param, QUERY_SAFE))
+        if self.sort_query:
+            params.sort()
+        return '&'.join(params)
+
+    def _slow(self, url):
+        try:
+            parts = urlsplit(url)
+            host = parts.hostname
+            port = parts.port
+        except ValueError:
+            return None
+        if not host:
+            return None
+        host = host.rstrip('.')
+        if not host.isascii():
+            try:
+                host = host.encode('idna').decode('ascii')
+            except UnicodeError:
+                return None
+        if ':' in host:
+            host = f"[{host}]"
+        scheme = parts.scheme.lower()
+        netloc = host if port is None or port == DEFAULT_PORTS.get(scheme) else f"{host}:{port}"
+        canonical = f"{scheme}://{netloc}{_normalize_escapes(parts.path, PATH_SAFE) or '/'}"
+        if parts.query:
+            query = self._query(parts.query)
+            if query:
+                canonical += '?' + query
+        if parts.fragment.startswith('!'):
+            canonical += '#' + _normalize_escapes(parts.fragment, QUERY_SAFE)
+        return canonical
+
+    def canonicalize(self, url):
+        return self.canonicalize_many([url])[0] if url else None
+
+    def canonicalize_many(self, urls, unique=False):
+        # Batch form: locals are bound once, repeated inputs are looked up
+        # instead of recomputed, and counts are merged once per batch. With
+        # unique=True duplicates are dropped (first one wins) instead of returned.
+        counts = Counter()
+        plain = _PLAIN.match
+        query = self._query
+        reject = self._reject
+        slow = self._slow
+        max_length = self.max_length
+        memo = {}
+        results = []
+        seen = set()
+        for url in urls:
+            url = url.strip()
+            counts['in'] += 1
+            if url in memo:
+                canonical = memo[url]
+            else:
+                match = plain(url) if len(url) <= max_length else None
+                reason = None
+                if match:
+                    origin, path, params = match.groups()
+                    canonical = origin + (path or '/')
+                    if params:
+                        params = query(params, plain=True)
+                        if params:
+                            canonical += '?' + params
+                else:
+                    reason = reject(url)
+                    canonical = None if reason else slow(url)
+                    if canonical is not None and len(canonical) > max_length:
+                        canonical, reason = None, 'too long'
+                if canonical is None:
+                    counts[reason or 'invalid'] += 1
+                elif canonical != url:
+                    counts['rewritten'] += 1
+                memo[url] = canonical
+            if canonical is None:
+                if not unique:
+                    results.append(None)
+                continue
+            if unique:
+                if canonical in seen:
+                    counts['duplicate'] += 1
+                    continue
+                seen.add(canonical)
+            results.append(canonical)
+        with self._lock:
+            self.counts.update(counts)
+        return results
+
+    def canonicalize_set(self, urls):
+        return set(self.canonicalize_many(urls, unique=True))
+
+    def canonicalize_stream(self, urls, batch_size=STREAM_BATCH):
+        # canonicalize_many a batch at a time, so lists of any size stream
+        # through; duplicates are kept for the caller's sort to drop
+        urls = iter(urls)
+        while True:
+            batch = list(itertools.islice(urls, batch_size))
+            if not batch:
+                return
+            yield from filter(None, self.canonicalize_many(batch))
+
+    def report(self, label='Canonicalization'):
+        with self._lock:
+            counts = dict(self.counts)
+        dropped = counts.get('scheme', 0) + counts.get('too long', 0) + counts.get('invalid', 0)
+        saved = dropped + counts.get('duplicate', 0)
+        print(f"{label}: {counts.get('in', 0)} URLs, {counts.get('rewritten', 0)} rewritten, "
+              f"{counts.get('duplicate', 0)} duplicates merged, {dropped} dropped "
+              f"({counts.get('scheme', 0)} scheme, {counts.get('too long', 0)} too long, "
+              f"{counts.get('invalid', 0)} invalid); {saved} requests eliminated")
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_canonicalizer():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Canonicalizer()
+        return _shared
+
+
+def canonicalize_file(path, canonicalizer=None):
+    from web_tool.url_store import UrlStore
+    canonicalizer = canonicalizer or get_canonicalizer()
+    store = UrlStore(path)
+    return store.replace(canonicalizer.canonicalize_stream(store))
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Canonicalize URLs and drop ones that can't be archived")
+    parser.add_argument('files', nargs='*', help="URL list files to rewrite in place (default: filter stdin)")
+    parser.add_argument('--keep-order', action='store_true', help="keep query parameter order")
+    args = parser.parse_args(argv)
+
+    canonicalizer = Canonicalizer(sort_query=not args.keep_order)
+    if args.files:
+        for path in args.files:
+            count = canonicalize_file(path, canonicalizer)
+            print(f"Rewrote {path} with {count} canonical URLs", file=sys.stderr)
+    else:
+        for url in canonicalizer.canonicalize_many((line for line in sys.stdin if line.strip()), unique=True):
+            sys.stdout.write(f"{url}\n")
+    with contextlib.redirect_stdout(sys.stderr):
+        canonicalizer.report()
+    return 0
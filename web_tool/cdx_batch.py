@@ -0,0 +1,138 @@
+import os
+import re
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from web_tool import http_client, metrics
+from web_tool.scheduler import get_scheduler
+
+CDX_API_URL = os.getenv('CDX_API_URL', 'https://web.archive.org/cdx/search/cdx')
+MIN_GROUP_SIZE = 3  # smaller groups are cheaper to check one by one
+PAGE_SIZE = 5000
+MAX_PAGES = 4  # give up on a prefix and fall back per URL beyond this
+CDX_TIMEOUT = 30
+
+_WWW = re.compile(r'^www\d*\.')
+DEFAULT_PORTS = {'http': ':80', 'https': ':443'}
+
+
+def surt_key(url):
+    # Approximates the Wayback urlkey so CDX rows can be matched to our URLs
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().rsplit('@', 1)[-1]
+    port = DEFAULT_PORTS.get(parts.scheme.lower())
+    if port and host.endswith(port):
+        host = host[:-len(port)]
+    host = _WWW.sub('', host)
+    key = ','.join(reversed(host.split('.'))) + ')' + (parts.path or '/')
+    if parts.query:
+        key += '?' + '&'.join(sorted(parts.query.split('&')))
+    return key.lower()
+
+
+def group_prefix(url):
+    # Only URLs below a first-level directory are grouped. A host-root prefix
+    # (github.com/alice, youtube.com/watch?v=...) would page through the whole
+    # domain and still come back incomplete, so those are checked one by one.
+    parts = urlsplit(url)
+    path = parts.path or '/'
+    if path.count('/') < 2:
+        return None
+    host = _WWW.sub('', parts.netloc.lower())
+    return host + path[:path.find('/', 1) + 1]
+
+
+def group_urls(urls, min_group_size=MIN_GROUP_SIZE):
+    groups = defaultdict(list)
+    leftovers = []
+    for url in urls:
+        prefix = group_prefix(url)
+        if prefix is None:
+            leftovers.append(url)
+        else:
+            groups[prefix].append(url)
+    for prefix in list(groups):
+        if len(groups[prefix]) < min_group_size:
+            leftovers.extend(groups.pop(prefix))
+    return groups, leftovers
+
+
+def query_prefix(prefix, cdx_api=CDX_API_URL, page_size=PAGE_SIZE, max_pages=MAX_PAGES):
+    keys = set()
+    resume_key = None
+    for _ in range(max_pages):
+        params = {
+            'url': prefix,
+            'matchType': 'prefix',
+            'collapse': 'urlkey',
+            'fl': 'urlkey',
+            'output': 'json',
+            'limit': page_size,
+            'showResumeKey': 'true',
+        }
+        if resume_key:
+            params['resumeKey'] = resume_key
+        with metrics.stage('cdx', 'http://' + prefix):
+            response = http_client.get(cdx_api, params=params, timeout=CDX_TIMEOUT)
+            response.raise_for_status()
+            rows = response.json() if response.content.strip() else []
+
+        resume_key = None
+        if len(rows) >= 2 and rows[-2] == []:
+            resume_key = rows[-1][0]
+            rows = rows[:-2]
+        keys.update(row[0] for row in rows[1:] if row)
+
+        if not resume_key:
+            return keys, True
+    return keys, False
+
+
+def resolve_availability(urls, check, cache=None, scheduler=None, on_error=None, cdx_api=CDX_API_URL):
+    scheduler = scheduler or get_scheduler()
+    results = {}
+    pending = []
+    for url in dict.fromkeys(urls):
+        archived = cache.get(url) if cache else None
+        if archived is None:
+            pending.append(url)
+        else:
+            results[url] = archived
+
+    groups, leftovers = group_urls(pending)
+    queries = {prefix: scheduler.submit(cdx_api, query_prefix, prefix, cdx_api) for prefix in groups}
+    for prefix, members in groups.items():
+        try:
+            keys, complete = queries[prefix].result()
+        except Exception as e:
+            if on_error:
+                on_error(prefix, e)
+            leftovers.extend(members)
+            continue
+        for url in members:
+            if surt_key(url) in keys:
+                results[url] = True
+            elif complete:
+                results[url] = False
+            else:
+                leftovers.append(url)
+                continue
+            if cache:
+                cache.put(url, results[url])
+
+    def check_leftover(url):
+        try:
+            return url, check(url)
+        except Exception as e:
+            if on_error:
+                on_error(url, e)
+            return url, None
+
+    for url, archived in scheduler.map(check_leftover, leftovers, host=cdx_api):
+        if archived is None:
+            continue
+        results[url] = archived
+        if cache:
+            cache.put(url, archived)
+
+    return results
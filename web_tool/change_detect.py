@@ -0,0 +1,209 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+
+from web_tool import http_client
+from web_tool.canonicalize import get_canonicalizer
+from web_tool.link_extractor import iter_tags
+from web_tool.scheduler import get_scheduler
+
+CHANGE_STATE_PATH = os.getenv('CHANGE_STATE_PATH', 'change_state.sqlite')
+FETCH_TIMEOUT = 20
+MIN_INTERVAL = 3600  # the workflows run hourly, so nothing can be checked more often
+MAX_INTERVAL = 7 * 24 * 3600  # even pages that never change get a fresh snapshot weekly
+FASTER = 0.5  # interval multiplier after a check that found a change
+SLOWER = 1.5  # ... and after one that didn't
+DUE_SLACK = 600  # cron starts drift by minutes; don't push a URL back a whole period for that
+
+# Each URL keeps its validators (ETag, Last-Modified), the fingerprint seen at
+# the last check and the one at its last successful save. A URL is checked
+# only when due, with a conditional GET; it goes to the save step only if its
+# content differs from the last snapshot (or couldn't be checked). The check
+# interval halves after a change and grows by half otherwise, so constantly
+# changing pages stay hourly and static ones drift towards weekly.
+
+_VOLATILE_BLOCKS = re.compile(rb'<(script|style|noscript|template)\b.*?</\1\s*>|<!--.*?-->',
+                              re.IGNORECASE | re.DOTALL)
+_TAG = re.compile(rb'<[^>]*>')
+_SPACE = re.compile(rb'\s+')
+
+
+def fingerprint(content, encoding='utf-8'):
+    # Visible text plus link targets (without query strings, which are often
+    # cache-busters), so rotating nonces, inline scripts and markup tweaks
+    # don't count as changes
+    digest = hashlib.blake2b(digest_size=16)
+    text = _VOLATILE_BLOCKS.sub(b' ', content)
+    digest.update(_SPACE.sub(b' ', _TAG.sub(b' ', text)).strip().lower())
+    for name, attrs in iter_tags(text, encoding):
+        target = attrs.get('href') or attrs.get('src')
+        if target:
+            digest.update(b'\0' + target.split('?', 1)[0].encode('utf-8', 'replace'))
+    return digest.hexdigest()
+
+
+class ChangeState:
+    def __init__(self, path=CHANGE_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pages ("
+                          "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, fingerprint TEXT, snapshot TEXT, "
+                          "checked REAL, next_check REAL NOT NULL DEFAULT 0, interval REAL NOT NULL, "
+                          "checks INTEGER NOT NULL DEFAULT 0, changes INTEGER NOT NULL DEFAULT 0)")
+
+    def get(self, url):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified, fingerprint, snapshot, next_check, interval, checks, changes "
+                "FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        keys = ('etag', 'last_modified', 'fingerprint', 'snapshot', 'next_check', 'interval', 'checks', 'changes')
+        return dict(zip(keys, row))
+
+    def put(self, url, page):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, fingerprint, snapshot, checked, next_check, "
+                "interval, checks, changes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, page['etag'], page['last_modified'], page['fingerprint'], page['snapshot'], time.time(),
+                 page['next_check'], page['interval'], page['checks'], page['changes']))
+
+    def mark_saved(self, urls):
+        # The fingerprint from the check that sent a URL to be saved becomes its snapshot
+        with self._lock:
+            self.conn.executemany("UPDATE pages SET snapshot = fingerprint WHERE url = ?", [(url,) for url in urls])
+
+    def close(self):
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.close()
+
+
+class ChangeDetector:
+    def __init__(self, state, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, scheduler=None):
+        self.state = state
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.scheduler = scheduler or get_scheduler()
+        self.outcomes = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, outcome):
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    def _check(self, url):
+        # Returns True if the URL should be saved
+        page = self.state.get(url) or {'etag': None, 'last_modified': None, 'fingerprint': None, 'snapshot': None,
+                                       'next_check': 0, 'interval': self.min_interval, 'checks': 0, 'changes': 0}
+        headers = {}
+        if page['snapshot']:
+            # Validators only help once there is a snapshot to compare against
+            if page['etag']:
+                headers['If-None-Match'] = page['etag']
+            if page['last_modified']:
+                headers['If-Modified-Since'] = page['last_modified']
+        try:
+            response = http_client.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+        except Exception as e:
+            # Can't tell, so save as before and look again next run
+            print(f"Error checking {url}: {e}", file=sys.stderr)
+            self._count('errors')
+            return True
+        if response.status_code == 304:
+            current = page['fingerprint']
+            self._count('not modified')
+        elif response.status_code >= 400:
+            self._count('errors')
+            return True
+        else:
+            current = fingerprint(response.content, response.encoding or 'utf-8')
+            page['etag'] = response.headers.get('ETag') or page['etag']
+            page['last_modified'] = response.headers.get('Last-Modified') or page['last_modified']
+        changed_since_check = page['fingerprint'] is not None and current != page['fingerprint']
+        if changed_since_check:
+            page['changes'] += 1
+        page['checks'] += 1
+        factor = FASTER if changed_since_check else SLOWER
+        page['interval'] = min(self.max_interval, max(self.min_interval, page['interval'] * factor))
+        page['fingerprint'] = current
+        page['next_check'] = time.time() + page['interval']
+        self.state.put(url, page)
+        if current != page['snapshot']:
+            self._count('changed')
+            return True
+        self._count('unchanged')
+        return False
+
+    def detect(self, urls, force=False):
+        now = time.time() + DUE_SLACK
+        due = []
+        for url in dict.fromkeys(urls):
+            page = self.state.get(url)
+            # A change whose save never got recorded stays due until it does,
+            # however far the last check pushed next_check out
+            if force or page is None or page['next_check'] <= now or page['fingerprint'] != page['snapshot']:
+                due.append(url)
+            else:
+                self._count('not due')
+        return [url for url, save in zip(due, self.scheduler.map(self._check, due)) if save]
+
+    def report(self):
+        with self._lock:
+            outcomes = dict(self.outcomes)
+        print("Change detection: " + ", ".join(f"{count} {name}" for name, count in sorted(outcomes.items())))
+
+
+def _read_urls(path):
+    with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Send only changed pages to the save step")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    detect = subparsers.add_parser('detect', help="check due URLs and write the ones that changed")
+    detect.add_argument('input', help="URL list")
+    detect.add_argument('output', help="file for the URLs to save")
+    detect.add_argument('--state', default=CHANGE_STATE_PATH)
+    detect.add_argument('--min-interval', type=float, default=MIN_INTERVAL, help="seconds")
+    detect.add_argument('--max-interval', type=float, default=MAX_INTERVAL, help="seconds")
+    detect.add_argument('--force', action='store_true', help="check every URL, due or not")
+
+    record = subparsers.add_parser('record', help="mark URLs in shard checkpoints as saved snapshots")
+    record.add_argument('checkpoints', nargs='*')
+    record.add_argument('--state', default=CHANGE_STATE_PATH)
+
+    args = parser.parse_args(argv)
+    state = ChangeState(args.state)
+    try:
+        if args.command == 'detect':
+            # Canonical, like the shard files whose checkpoints `record` reads
+            urls = get_canonicalizer().canonicalize_many(_read_urls(args.input), unique=True)
+            detector = ChangeDetector(state, args.min_interval, args.max_interval)
+            changed = detector.detect(urls, args.force)
+            with open(args.output, 'w', encoding='utf-8', errors='surrogateescape') as f:
+                f.writelines(f"{url}\n" for url in sorted(changed))
+            detector.report()
+            print(f"{len(changed)} of {len(urls)} URLs to save")
+            if os.getenv('GITHUB_OUTPUT'):
+                with open(os.environ['GITHUB_OUTPUT'], 'a') as f:
+                    f.write(f"changed={len(changed)}\n")
+        elif args.command == 'record':
+            from web_tool.sharding import read_checkpoint
+            saved = {url for path in args.checkpoints for status, _, url in read_checkpoint(path) if status == 'ok'}
+            state.mark_saved(saved)
+            print(f"Recorded {len(saved)} saved snapshots")
+    finally:
+        state.close()
+    return 0
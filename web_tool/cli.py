@@ -0,0 +1,45 @@
+import importlib
+import sys
+
+# Subcommand -> module with a main(argv, prog). Modules are imported only when
+# their command runs, so e.g. an availability check never loads internetarchive.
+COMMANDS = {
+    'extract': ('web_tool.extract', "print every URL found on pages"),
+    'check-availability': ('web_tool.availability', "check URLs against the Wayback Machine"),
+    'check-liveness': ('web_tool.liveness', "print the URLs that don't answer 404"),
+    'crawl': ('web_tool.crawler', "crawl sites breadth-first, resuming a saved frontier, and queue new URLs"),
+    'scrape': ('web_tool.scrape', "collect unarchived URLs from sampled source pages"),
+    'archive': ('web_tool.archiver', "save the unarchived URLs of one random source page"),
+    'save': ('web_tool.save_page_now', "submit a batch file to Save Page Now"),
+    'queue': ('web_tool.save_queue', "rank pending saves so a run's budget goes to the most at-risk URLs"),
+    'shard': ('web_tool.sharding', "split URL lists by host and run shards with checkpoints"),
+    'changes': ('web_tool.change_detect', "pass on only the URLs whose content changed since their last save"),
+    'package': ('web_tool.package', "package pages with their resources and upload them to IA"),
+    'upload': ('web_tool.ia_upload', "upload packaged pages to IA in batched items, resuming from a ledger"),
+    'urlset': ('web_tool.url_set', "query and update compact sorted URL sets"),
+    'urlstore': ('web_tool.url_store', "journaled add/remove for URL list files"),
+    'canonicalize': ('web_tool.canonicalize', "rewrite URL lists in canonical form, dropping unarchivable URLs"),
+}
+
+
+def usage():
+    lines = ["usage: python -m web_tool <command> [args]", "", "commands:"]
+    width = max(len(command) for command in COMMANDS)
+    for command, (_, help_text) in COMMANDS.items():
+        lines.append(f"  {command:<{width}}  {help_text}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0 if argv else 2
+    command = argv[0]
+    if command not in COMMANDS:
+        print(f"unknown command: {command}\n\n{usage()}", file=sys.stderr)
+        return 2
+    module = importlib.import_module(COMMANDS[command][0])
+    from web_tool import metrics
+    with metrics.recording(command):
+        return module.main(argv[1:], prog=f"python -m web_tool {command}")
@@ -0,0 +1,355 @@
+import argparse
+import contextlib
+import gzip
+import html
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+from web_tool import http_client
+from web_tool.canonicalize import get_canonicalizer
+from web_tool.link_extractor import extract_urls
+from web_tool.parse_pool import get_parse_pool
+from web_tool.raw_patterns import get_rules
+from web_tool.rate_limiter import THROTTLE_STATUSES, get_bucket, parse_retry_after
+from web_tool.scheduler import MAX_IN_FLIGHT, get_scheduler, host_key
+
+CRAWL_STATE_PATH = os.getenv('CRAWL_STATE_PATH', 'crawl_state.sqlite')
+MAX_DEPTH = 3  # link hops from a seed or sitemap entry
+MAX_PAGES = 200  # fetches per run; the frontier carries the rest over
+HOST_RATE = 1.0  # requests per second per host, unless robots.txt sets a Crawl-delay
+HOST_BURST = 2
+FETCH_TIMEOUT = 20
+MAX_PAGE_BYTES = 5 * 1024 * 1024  # larger bodies are read only this far for links
+MAX_FAILURES = 3  # fetch errors before a URL leaves the frontier
+REVISIT_AFTER = 7 * 24 * 3600  # a visited page rejoins the frontier when rediscovered after this
+SITEMAP_INTERVAL = 24 * 3600
+MAX_SITEMAPS = 50  # sitemap files read per seeding, nested indexes included
+BATCH_SIZE = MAX_IN_FLIGHT  # frontier entries fetched together
+SKIPPED_EXTENSIONS = frozenset((
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif', '.svg', '.ico', '.bmp', '.tif', '.tiff',
+    '.css', '.js', '.mjs', '.map', '.woff', '.woff2', '.ttf', '.otf', '.eot',
+    '.mp3', '.mp4', '.m4a', '.webm', '.ogg', '.wav', '.mov', '.avi',
+    '.zip', '.gz', '.tgz', '.rar', '.7z', '.exe', '.dmg', '.iso',
+))
+
+# Breadth-first crawl whose frontier and visited set live in SQLite, so each
+# run continues where the last one stopped instead of starting over from the
+# homepage. Every URL row is either queued (visited IS NULL) or visited; the
+# frontier is popped shallowest-first in batches that are fetched through the
+# scheduler, whose per-host limit caps concurrency while a per-host token bucket
+# (slowed by robots.txt Crawl-delay and by 429/5xx answers) paces requests.
+# URLs seen for the first time are returned in one batch for the archive queue.
+
+_LOC = re.compile(rb'<loc>\s*([^<\s]+)\s*</loc>', re.IGNORECASE)
+_SITEMAP_INDEX = re.compile(rb'<sitemapindex[\s>]', re.IGNORECASE)
+
+
+def page_links(body, url, encoding):
+    # Runs in a parse pool worker. Site URLs in scripts and JSON count as links
+    # too; the ones outside the crawl's hosts are dropped by in_scope
+    return extract_urls(body, url, encoding)[0] | get_rules().scan(body, encoding)
+
+
+def _skipped(url):
+    path = urlsplit(url).path.lower()
+    return os.path.splitext(path)[1] in SKIPPED_EXTENSIONS
+
+
+class CrawlState:
+    def __init__(self, path=CRAWL_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS urls ("
+                          "url TEXT PRIMARY KEY, depth INTEGER NOT NULL, discovered REAL NOT NULL, "
+                          "visited REAL, status INTEGER, failures INTEGER NOT NULL DEFAULT 0)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS frontier ON urls (depth, discovered) WHERE visited IS NULL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+
+    def enqueue(self, entries, revisit_after=REVISIT_AFTER):
+        # entries are (url, depth); returns the URLs never seen before. A known
+        # URL moves up if found at a shallower depth, and a visited one is
+        # queued again once its visit is older than revisit_after.
+        now = time.time()
+        stale = now - revisit_after
+        new = []
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                for url, depth in entries:
+                    if self.conn.execute("INSERT OR IGNORE INTO urls (url, depth, discovered) VALUES (?, ?, ?)",
+                                         (url, depth, now)).rowcount:
+                        new.append(url)
+                    else:
+                        self.conn.execute(
+                            "UPDATE urls SET depth = ?, visited = NULL, failures = 0 WHERE url = ? AND "
+                            "((visited IS NULL AND depth > ?) OR visited < ?)", (depth, url, depth, stale))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return new
+
+    def pop(self, count, max_depth):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT url, depth FROM urls WHERE visited IS NULL AND depth <= ? "
+                "ORDER BY depth, discovered LIMIT ?", (max_depth, count)).fetchall()
+
+    def mark_visited(self, results):
+        # results are (url, status); status None means the fetch failed
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN")
+            for url, status in results:
+                if status is None:
+                    self.conn.execute("UPDATE urls SET failures = failures + 1, "
+                                      "visited = CASE WHEN failures + 1 >= ? THEN ? END WHERE url = ?",
+                                      (MAX_FAILURES, now, url))
+                else:
+                    self.conn.execute("UPDATE urls SET visited = ?, status = ? WHERE url = ?", (now, status, url))
+            self.conn.execute("COMMIT")
+
+    def get_meta(self, key):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def counts(self):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) - COUNT(visited), COUNT(visited) FROM urls").fetchone()
+
+    def close(self):
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.close()
+
+
+class Crawler:
+    def __init__(self, state, seeds, hosts=None, max_depth=MAX_DEPTH, host_rate=HOST_RATE, scheduler=None):
+        self.state = state
+        self.canonicalizer = get_canonicalizer()
+        self.seeds = self.canonicalizer.canonicalize_many(seeds, unique=True)
+        self.hosts = {host_key(host) for host in hosts} if hosts else {host_key(url) for url in self.seeds}
+        self.max_depth = max_depth
+        self.host_rate = host_rate
+        self.scheduler = scheduler or get_scheduler()
+        self.stats = Counter()
+        self._robots = {}  # origin -> RobotFileParser, or None if there is no usable robots.txt
+        self._lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def in_scope(self, url):
+        return host_key(url) in self.hosts and not _skipped(url)
+
+    def _bucket(self, url):
+        return get_bucket(f"crawl:{host_key(url)}", rate=self.host_rate, burst=HOST_BURST, max_rate=self.host_rate)
+
+    def _get(self, url, **kwargs):
+        # Paced per host; a 429/5xx slows the host down for the rest of the run
+        bucket = self._bucket(url)
+        bucket.acquire()
+        response = http_client.get(url, timeout=FETCH_TIMEOUT, **kwargs)
+        if response.status_code in THROTTLE_STATUSES:
+            bucket.on_throttle(parse_retry_after(response.headers.get('Retry-After')))
+        else:
+            bucket.on_success()
+        return response
+
+    def _origin(self, url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def robots(self, origin):
+        # Fetched once per origin, from the main thread before any of its pages
+        if origin in self._robots:
+            return self._robots[origin]
+        parser = None
+        try:
+            response = self._get(origin + '/robots.txt')
+            if response.status_code < 400:
+                parser = RobotFileParser()
+                parser.parse(response.text.splitlines())
+                delay = parser.crawl_delay('*')
+                if delay:
+                    bucket = self._bucket(origin)
+                    bucket.rate = bucket.max_rate = min(self.host_rate, 1.0 / float(delay))
+        except Exception as e:
+            print(f"Error fetching {origin}/robots.txt: {e}", file=sys.stderr)
+        self._robots[origin] = parser
+        return parser
+
+    def allowed(self, url):
+        parser = self.robots(self._origin(url))
+        return parser is None or parser.can_fetch('*', url)
+
+    def sitemap_urls(self):
+        # Page URLs from each seed origin's sitemap.xml and robots.txt Sitemap
+        # lines, following sitemap indexes up to MAX_SITEMAPS files
+        pending = []
+        for origin in dict.fromkeys(self._origin(url) for url in self.seeds):
+            parser = self.robots(origin)
+            pending.extend((parser.site_maps() if parser else None) or [origin + '/sitemap.xml'])
+        seen = set()
+        pages = []
+        while pending and len(seen) < MAX_SITEMAPS:
+            sitemap = pending.pop(0)
+            if sitemap in seen:
+                continue
+            seen.add(sitemap)
+            try:
+                response = self._get(sitemap)
+                if response.status_code >= 400:
+                    continue
+                body = response.content
+                if body[:2] == b'\x1f\x8b':
+                    body = gzip.decompress(body)
+            except Exception as e:
+                print(f"Error fetching sitemap {sitemap}: {e}", file=sys.stderr)
+                continue
+            self._count('sitemaps read')
+            locs = [html.unescape(loc.decode('utf-8', 'replace')) for loc in _LOC.findall(body)]
+            if _SITEMAP_INDEX.search(body):
+                pending.extend(locs)
+            else:
+                pages.extend(locs)
+        return pages
+
+    def _fetch(self, url):
+        # Returns (status, links); status None means try again on a later run
+        try:
+            response = self._get(url, stream=True)
+            with response:
+                if response.status_code in THROTTLE_STATUSES:
+                    self._count('throttled')
+                    return None, []
+                content_type = response.headers.get('Content-Type', '')
+                if response.status_code >= 400 or 'html' not in content_type.lower() \
+                        or host_key(response.url) not in self.hosts:
+                    return response.status_code, []
+                body = bytearray()
+                for chunk in response.iter_content(64 * 1024):
+                    body += chunk
+                    if len(body) >= MAX_PAGE_BYTES:
+                        self._count('truncated')
+                        break
+                links = get_parse_pool().run(page_links, bytes(body), response.url, response.encoding or 'utf-8')
+        except Exception as e:
+            print(f"Error crawling {url}: {e}", file=sys.stderr)
+            self._count('errors')
+            return None, []
+        self._count('fetched')
+        return response.status_code, links
+
+    def seed(self, sitemaps=True, sitemap_interval=SITEMAP_INTERVAL):
+        entries = [(url, 0) for url in self.seeds]
+        last = self.state.get_meta('sitemaps_read')
+        if sitemaps and (last is None or time.time() - last >= sitemap_interval):
+            found = self.canonicalizer.canonicalize_many(self.sitemap_urls(), unique=True)
+            entries.extend((url, 0) for url in found if self.in_scope(url))
+            self.state.set_meta('sitemaps_read', time.time())
+        new = self.state.enqueue(entries)
+        self._count('discovered', len(new))
+        return new
+
+    def crawl(self, max_pages=MAX_PAGES):
+        # Returns the URLs discovered during this run, in discovery order
+        discovered = []
+        fetched = 0
+        while fetched < max_pages:
+            batch = self.state.pop(min(BATCH_SIZE, max_pages - fetched), self.max_depth)
+            if not batch:
+                break
+            for origin in dict.fromkeys(self._origin(url) for url, _ in batch):
+                self.robots(origin)
+            results = []
+            todo = []
+            for url, depth in batch:
+                if self.allowed(url):
+                    todo.append((url, depth))
+                else:
+                    self._count('disallowed')
+                    results.append((url, 0))
+            pages = self.scheduler.map(self._fetch, [url for url, _ in todo])
+            fetched += len(batch)
+            entries = []
+            for (url, depth), (status, links) in zip(todo, pages):
+                results.append((url, status))
+                if depth < self.max_depth and links:
+                    found = self.canonicalizer.canonicalize_many(links, unique=True)
+                    entries.extend((link, depth + 1) for link in found if self.in_scope(link))
+            self.state.mark_visited(results)
+            new = self.state.enqueue(entries)
+            self._count('discovered', len(new))
+            discovered.extend(new)
+            if all(status is None for _, status in results):
+                break  # the whole batch failed; leave it queued for the next run
+        return discovered
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+        queued, visited = self.state.counts()
+        print("Crawl: " + (", ".join(f"{count} {name}" for name, count in sorted(stats.items())) or "nothing to do")
+              + f"; frontier {queued} queued, {visited} visited")
+        get_parse_pool().report()
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Crawl sites breadth-first and queue new URLs for archiving")
+    parser.add_argument('seeds', nargs='+', help="start URLs; their hosts are the crawl scope")
+    parser.add_argument('--state', default=CRAWL_STATE_PATH, help="frontier and visited set, kept across runs")
+    parser.add_argument('--output', help="URL store to add new URLs to (default: print them)")
+    parser.add_argument('--archived', help="URL set of already archived URLs to leave out")
+    parser.add_argument('--allow-host', action='append', default=[], help="host to crawl (default: the seed hosts)")
+    parser.add_argument('--max-depth', type=int, default=MAX_DEPTH)
+    parser.add_argument('--max-pages', type=int, default=MAX_PAGES, help="pages fetched this run")
+    parser.add_argument('--rate', type=float, default=HOST_RATE, help="requests per second per host")
+    parser.add_argument('--no-sitemap', action='store_true', help="don't seed from sitemap.xml")
+    args = parser.parse_args(argv)
+
+    state = CrawlState(args.state)
+    try:
+        crawler = Crawler(state, args.seeds, args.allow_host, args.max_depth, args.rate)
+        discovered = crawler.seed(not args.no_sitemap)
+        discovered += crawler.crawl(args.max_pages)
+        with contextlib.redirect_stdout(sys.stderr):
+            crawler.report()
+    finally:
+        state.close()
+        get_parse_pool().close()
+
+    if args.archived:
+        from web_tool.url_set import UrlSet
+        archived = UrlSet(args.archived)
+        try:
+            discovered = [url for url in discovered if url not in archived]
+        finally:
+            archived.close()
+    if args.output:
+        from web_tool.url_store import UrlStore
+        store = UrlStore(args.output)
+        added = store.add(discovered)
+        store.compact()
+        print(f"Added {added} new URLs to {args.output}", file=sys.stderr)
+    else:
+        for url in discovered:
+            sys.stdout.write(f"{url}\n")
+    return 0
@@ -0,0 +1,68 @@
+import argparse
+import sys
+from urllib.parse import urlparse
+
+from web_tool import http_client, metrics
+from web_tool.canonicalize import get_canonicalizer
+from web_tool.link_extractor import extract_urls
+from web_tool.parse_pool import get_parse_pool
+from web_tool.raw_patterns import get_rules
+from web_tool.scheduler import get_scheduler
+
+FETCH_TIMEOUT = 10
+
+
+def is_github_repo(url):
+    parsed = urlparse(url)
+    parts = parsed.path.split('/')
+    return parsed.netloc == 'github.com' and len(parts) == 3
+
+
+def parse_page(html_content, url, encoding='utf-8'):
+    # Runs in a parse pool worker: (links, every other URL found)
+    links, images, other_urls = extract_urls(html_content, url, encoding)
+    return links, images | other_urls | get_rules().scan(html_content, encoding)
+
+
+def page_urls(html_content, url, encoding='utf-8', github=None):
+    # Separate stages, so parsing cost isn't mixed up with GitHub API latency
+    with metrics.stage('parse', url):
+        links, found = get_parse_pool().run(parse_page, html_content, url, encoding)
+    if github is not None:
+        github_repos = {link for link in links if is_github_repo(link)}
+        if github_repos:
+            with metrics.stage('github_enrich', url):
+                for urls in github.urls_for_many(github_repos).values():
+                    links.update(urls)
+    # Canonical forms only, so variants of one URL cost one check downstream
+    with metrics.stage('canonicalize', url):
+        return get_canonicalizer().canonicalize_set(links | found)
+
+
+def fetch_urls(url, github=None, scheduler=None):
+    scheduler = scheduler or get_scheduler()
+    try:
+        with metrics.stage('fetch', url):
+            response = scheduler.call(url, http_client.get, url, timeout=FETCH_TIMEOUT)
+        return page_urls(response.content, url, response.encoding or 'utf-8', github)
+    except Exception as e:
+        print(f"Error fetching {url}: {e}", file=sys.stderr)
+        return set()
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Print every URL found on the given pages")
+    parser.add_argument('urls', nargs='+')
+    parser.add_argument('--github', action='store_true', help="also list release, issue and PR URLs of linked repos")
+    args = parser.parse_args(argv)
+
+    github = None
+    if args.github:
+        from web_tool.github_enrich import GitHubEnricher
+        github = GitHubEnricher()
+    found = set()
+    for url in args.urls:
+        found |= fetch_urls(url, github)
+    for url in sorted(found):
+        sys.stdout.write(f"{url}\n")
+    return 0
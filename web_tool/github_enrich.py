@@ -0,0 +1,258 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from web_tool import http_client, metrics
+from web_tool.scheduler import get_scheduler
+
+GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com')
+GITHUB_CACHE_PATH = os.getenv('GITHUB_CACHE_PATH', 'github_cache.sqlite')
+RATE_LIMIT_RESERVE = 100  # stop spending the budget below this many calls
+MAX_PAGES = 10
+GRAPHQL_BATCH = 20  # repositories per GraphQL query
+GRAPHQL_TTL = 6 * 3600  # GraphQL can't revalidate with ETags, so reuse results for a while
+ALL_KINDS = ('releases', 'issues', 'pulls')
+
+REST_ENDPOINTS = {
+    'releases': ('releases', 'assets', 'browser_download_url'),
+    'issues': ('issues', None, 'html_url'),
+    'pulls': ('pulls', None, 'html_url'),
+}
+GRAPHQL_FIELDS = {
+    'releases': 'releases(first: 100) { pageInfo { hasNextPage } '
+                'nodes { releaseAssets(first: 100) { nodes { downloadUrl } } } }',
+    'issues': 'issues(first: 100, states: OPEN) { pageInfo { hasNextPage } nodes { url } }',
+    'pulls': 'pullRequests(first: 100, states: OPEN) { pageInfo { hasNextPage } nodes { url } }',
+}
+GRAPHQL_CONNECTIONS = {'releases': 'releases', 'issues': 'issues', 'pulls': 'pullRequests'}
+
+
+class RateLimited(Exception):
+    pass
+
+
+def split_repo(repo_url):
+    owner, repo = repo_url.rstrip('/').split('/')[-2:]
+    return owner, repo
+
+
+def base_urls(owner, repo):
+    return [
+        f"https://github.com/{owner}/{repo}/archive/refs/heads/main.zip",
+        f"https://codeload.github.com/{owner}/{repo}/zip/refs/heads/main",
+    ]
+
+
+class GitHubEnricher:
+    def __init__(self, token=GITHUB_TOKEN, kinds=ALL_KINDS, cache_path=GITHUB_CACHE_PATH, api_url=GITHUB_API_URL,
+                 scheduler=None):
+        self.token = token
+        self.kinds = tuple(kinds)
+        self.api_url = api_url.rstrip('/')
+        self.cache_path = cache_path
+        self.scheduler = scheduler or get_scheduler()
+        self.remaining = None
+        self.reset_at = 0
+        self.deferred = set()
+        self.requests = 0
+        self.not_modified = 0
+        self.run_hits = 0
+        self._results = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.cache_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS responses ("
+                         "key TEXT PRIMARY KEY, etag TEXT, body TEXT NOT NULL, next_url TEXT, fetched REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def _headers(self):
+        headers = {'Accept': 'application/vnd.github+json'}
+        if self.token:
+            headers['Authorization'] = f'token {self.token}'
+        return headers
+
+    def _track_rate_limit(self, response):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        if remaining is not None:
+            with self._lock:
+                self.remaining = int(remaining)
+                self.reset_at = int(response.headers.get('X-RateLimit-Reset', 0))
+
+    def _check_budget(self):
+        with self._lock:
+            if self.remaining is not None and self.remaining <= RATE_LIMIT_RESERVE and time.time() < self.reset_at:
+                raise RateLimited(f"{self.remaining} GitHub API calls left until {time.ctime(self.reset_at)}")
+
+    def _send(self, method, url, **kwargs):
+        self._check_budget()
+        with self._lock:
+            self.requests += 1
+        with metrics.stage('github', url):
+            response = self.scheduler.call(url, http_client.request, method, url, **kwargs)
+        self._track_rate_limit(response)
+        if response.status_code in (403, 429) and response.headers.get('X-RateLimit-Remaining') == '0':
+            raise RateLimited(f"GitHub rate limit exhausted for {url}")
+        return response
+
+    def _get_json(self, url):
+        # Conditional GET: a 304 costs nothing against the rate limit. The next
+        # page link is cached too because a 304 needn't repeat the Link header.
+        cached = self._db().execute("SELECT etag, body, next_url FROM responses WHERE key = ?", (url,)).fetchone()
+        headers = self._headers()
+        if cached and cached[0]:
+            headers['If-None-Match'] = cached[0]
+        response = self._send('GET', url, headers=headers)
+        if response.status_code == 304 and cached:
+            with self._lock:
+                self.not_modified += 1
+            return json.loads(cached[1]), cached[2]
+        response.raise_for_status()
+        next_url = response.links.get('next', {}).get('url')
+        self._db().execute("INSERT OR REPLACE INTO responses (key, etag, body, next_url, fetched) VALUES (?, ?, ?, ?, ?)",
+                           (url, response.headers.get('ETag'), response.text, next_url, time.time()))
+        return response.json(), next_url
+
+    def _rest_urls(self, owner, repo):
+        urls = []
+        for kind in self.kinds:
+            path, asset_key, url_key = REST_ENDPOINTS[kind]
+            next_url = f"{self.api_url}/repos/{owner}/{repo}/{path}?per_page=100"
+            for _ in range(MAX_PAGES):
+                data, next_url = self._get_json(next_url)
+                if isinstance(data, list):
+                    for item in data:
+                        if asset_key:
+                            urls.extend(asset[url_key] for asset in item.get(asset_key, []))
+                        else:
+                            urls.append(item[url_key])
+                if not next_url:
+                    break
+        return urls
+
+    def _graphql_urls(self, repos):
+        # One query for many repositories. Repos whose lists don't fit in the
+        # first page are left out of the result and go through paginated REST.
+        cached = {}
+        now = time.time()
+        todo = []
+        for owner, repo in repos:
+            row = self._db().execute("SELECT body, fetched FROM responses WHERE key = ?",
+                                     (f"graphql:{owner}/{repo}:{','.join(self.kinds)}",)).fetchone()
+            if row and now - row[1] < GRAPHQL_TTL:
+                cached[(owner, repo)] = json.loads(row[0])
+            else:
+                todo.append((owner, repo))
+
+        for start in range(0, len(todo), GRAPHQL_BATCH):
+            batch = todo[start:start + GRAPHQL_BATCH]
+            fields = ' '.join(GRAPHQL_FIELDS[kind] for kind in self.kinds)
+            params = ', '.join(f"$o{i}: String!, $n{i}: String!" for i in range(len(batch)))
+            body = ' '.join(f"r{i}: repository(owner: $o{i}, name: $n{i}) {{ {fields} }}" for i in range(len(batch)))
+            variables = {}
+            for i, (owner, repo) in enumerate(batch):
+                variables[f"o{i}"] = owner
+                variables[f"n{i}"] = repo
+            response = self._send('POST', f"{self.api_url}/graphql", headers=self._headers(),
+                                  json={'query': f"query({params}) {{ {body} }}", 'variables': variables})
+            response.raise_for_status()
+            data = response.json().get('data') or {}
+            for i, (owner, repo) in enumerate(batch):
+                node = data.get(f"r{i}")
+                if node is None:
+                    continue
+                if any(node[GRAPHQL_CONNECTIONS[kind]]['pageInfo']['hasNextPage'] for kind in self.kinds):
+                    continue
+                urls = []
+                for kind in self.kinds:
+                    for item in node[GRAPHQL_CONNECTIONS[kind]]['nodes']:
+                        if kind == 'releases':
+                            urls.extend(asset['downloadUrl'] for asset in item['releaseAssets']['nodes'])
+                        else:
+                            urls.append(item['url'])
+                cached[(owner, repo)] = urls
+                self._db().execute(
+                    "INSERT OR REPLACE INTO responses (key, etag, body, next_url, fetched) VALUES (?, NULL, ?, NULL, ?)",
+                    (f"graphql:{owner}/{repo}:{','.join(self.kinds)}", json.dumps(urls), time.time()))
+        return cached
+
+    def _enrich(self, owner, repo):
+        try:
+            return base_urls(owner, repo) + self._rest_urls(owner, repo)
+        except RateLimited as e:
+            self._defer(owner, repo, e)
+        except Exception as e:
+            print(f"Error fetching GitHub data for {owner}/{repo}: {e}")
+        return base_urls(owner, repo)
+
+    def _defer(self, owner, repo, reason):
+        with self._lock:
+            if (owner, repo) not in self.deferred:
+                print(f"Deferring GitHub enrichment for {owner}/{repo}: {reason}")
+            self.deferred.add((owner, repo))
+
+    def urls_for_many(self, repo_urls):
+        keys = {split_repo(repo_url): repo_url for repo_url in repo_urls}
+        results = {}
+        mine = []
+        waits = []
+        with self._lock:
+            for key in keys:
+                if key in self._results:
+                    self.run_hits += 1
+                    results[key] = self._results[key]
+                elif key in self._pending:
+                    waits.append((key, self._pending[key]))
+                else:
+                    self._pending[key] = threading.Event()
+                    mine.append(key)
+
+        if mine and not self.token:
+            for key in mine:
+                results[key] = base_urls(*key)
+        elif len(mine) > 1:
+            try:
+                for key, urls in self._graphql_urls(mine).items():
+                    results[key] = base_urls(*key) + urls
+            except RateLimited as e:
+                for key in mine:
+                    self._defer(*key, e)
+                    results[key] = base_urls(*key)
+            except Exception as e:
+                print(f"GitHub GraphQL batch failed, falling back to REST: {e}")
+        for key in mine:
+            if key not in results:
+                results[key] = self._enrich(*key)
+
+        with self._lock:
+            for key in mine:
+                self._results[key] = sorted(set(results[key]))
+                self._pending.pop(key).set()
+        for key, event in waits:
+            event.wait()
+            with self._lock:
+                results[key] = self._results[key]
+
+        return {keys[key]: sorted(set(urls)) for key, urls in results.items()}
+
+    def urls_for(self, repo_url):
+        return self.urls_for_many([repo_url])[repo_url]
+
+    def deferred_repo_urls(self):
+        with self._lock:
+            return sorted(f"https://github.com/{owner}/{repo}" for owner, repo in self.deferred)
+
+    def report(self):
+        budget = self.remaining if self.remaining is not None else 'unknown'
+        print(f"GitHub: {self.requests} API calls, {self.not_modified} revalidated with 304, "
+              f"{self.run_hits} repeat repos served from memory, {len(self.deferred)} deferred "
+              f"(budget left: {budget})")
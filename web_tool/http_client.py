@@ -0,0 +1,149 @@
+import random
+import sys
+import threading
+import time
+
+from web_tool.scheduler import MAX_IN_FLIGHT
+
+DEFAULT_TIMEOUT = 15
+POOL_SIZE = MAX_IN_FLIGHT  # connections kept per host; enough for every scheduler worker
+POOL_HOSTS = 200  # distinct hosts whose pools stay cached
+UA_POOL_SIZE = 50
+FALLBACK_USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0",
+]
+
+_user_agents = None
+_user_agents_lock = threading.Lock()
+
+
+def user_agents():
+    global _user_agents
+    with _user_agents_lock:
+        if _user_agents is None:
+            try:
+                from fake_useragent import UserAgent
+                ua = UserAgent()
+                _user_agents = list({ua.random for _ in range(UA_POOL_SIZE)})
+            except Exception as e:
+                # stderr: several commands print their URL list on stdout
+                print(f"Falling back to built-in user agents: {e}", file=sys.stderr)
+                _user_agents = list(FALLBACK_USER_AGENTS)
+        return _user_agents
+
+
+def random_user_agent():
+    return random.choice(user_agents())
+
+
+class HttpClient:
+    def __init__(self, pool_size=POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        # Imported here so commands that never touch the network start fast
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.requests = 0
+        self.observers = []  # called with (method, url, response or None, seconds) after each request
+        self._lock = threading.Lock()
+
+    def request(self, method, url, headers=None, **kwargs):
+        headers = dict(headers or {})
+        headers.setdefault('User-Agent', random_user_agent())
+        kwargs.setdefault('timeout', self.timeout)
+        with self._lock:
+            self.requests += 1
+        if not self.observers:
+            return self.session.request(method, url, headers=headers, **kwargs)
+        response = None
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, headers=headers, **kwargs)
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            for observer in self.observers:
+                observer(method, url, response, elapsed)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def stats(self):
+        connections = 0
+        adapters = {id(adapter): adapter for adapter in self.session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+        with self._lock:
+            total = self.requests
+        return {'requests': total, 'connections': connections, 'reused': max(0, total - connections)}
+
+    def report(self):
+        stats = self.stats()
+        rate = 100.0 * stats['reused'] / stats['requests'] if stats['requests'] else 0.0
+        print(f"HTTP: {stats['requests']} requests over {stats['connections']} connections "
+              f"({rate:.1f}% reused a pooled connection)")
+
+
+_client = None
+_client_lock = threading.Lock()
+_observers = []  # added before the client exists; it picks them up when created
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+            _client.observers.extend(_observers)
+        return _client
+
+
+def request(method, url, **kwargs):
+    return get_client().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    return get_client().head(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_client().post(url, **kwargs)
+
+
+def put(url, **kwargs):
+    return get_client().put(url, **kwargs)
+
+
+def add_observer(observer):
+    # Doesn't create the client, so registering an observer stays cheap
+    with _client_lock:
+        _observers.append(observer)
+        if _client is not None:
+            _client.observers.append(observer)
+
+
+def report():
+    get_client().report()
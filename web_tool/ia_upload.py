@@ -0,0 +1,316 @@
+import argparse
+import base64
+import configparser
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+from urllib.parse import quote, urlsplit
+
+from web_tool import http_client
+from web_tool.rate_limiter import RetryPolicy, get_bucket
+from web_tool.scheduler import get_scheduler
+
+IA_S3_URL = os.getenv('IA_S3_URL', 'https://s3.us.archive.org')
+IA_COLLECTION = os.getenv('IA_COLLECTION', 'opensource_media')  # community collection open to any account
+IA_MEDIATYPE = os.getenv('IA_MEDIATYPE', 'web')
+IA_ITEM_PREFIX = os.getenv('IA_ITEM_PREFIX', 'web_tool_pages')
+IA_CONFIG_PATHS = ('~/.ia', '~/.config/internetarchive/ia.ini', '~/.config/ia.ini')
+PAGES_PER_ITEM = 50
+UPLOAD_TIMEOUT = 300
+MAX_RETRIES = 4
+LEDGER_PATH = 'upload_ledger.tsv'
+HASH_CHUNK = 1024 * 1024
+
+upload_bucket = get_bucket('s3.us.archive.org', rate=4.0, burst=8, max_rate=20.0)
+retry_policy = RetryPolicy(max_attempts=MAX_RETRIES)
+
+# Packaged pages are bundled PAGES_PER_ITEM to an item named prefix_date_seq.
+# The item a package goes to is recorded in the ledger the first time it's
+# seen, as "item<TAB>item/package", so a rerun with more or fewer packages
+# never moves one to another item; new packages fill items that still have
+# room before a new one is opened. Files go up as S3 PUTs with Content-MD5,
+# so the endpoint rejects a corrupted body, and the returned ETag is checked
+# too. Each verified file is appended as "md5<TAB>item/name"; files already
+# listed with the same checksum are skipped, so an interrupted upload resumes
+# where it stopped.
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+def load_credentials():
+    access, secret = os.getenv('IA_ACCESS_KEY'), os.getenv('IA_SECRET_KEY')
+    if access and secret:
+        return access, secret
+    for path in IA_CONFIG_PATHS:
+        config = configparser.ConfigParser()
+        try:
+            if config.read(os.path.expanduser(path)) and config.has_section('s3'):
+                return config.get('s3', 'access'), config.get('s3', 'secret')
+        except (configparser.Error, UnicodeDecodeError):
+            continue
+    return None
+
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def metadata_headers(metadata):
+    # x-archive-meta-* headers; lists become meta01, meta02, ... and values
+    # that aren't plain ASCII are sent URI-encoded, as the IA S3 API expects
+    headers = {}
+    for key, value in metadata.items():
+        name = key.replace('_', '--')
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for i, item in enumerate(values, 1):
+            item = str(item)
+            if not item.isascii() or '\n' in item:
+                item = f"uri({quote(item)})"
+            prefix = f"x-archive-meta{i:02d}-" if len(values) > 1 else "x-archive-meta-"
+            headers[prefix + name] = item
+    return headers
+
+
+class UploadLedger:
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self._done = set()
+        self._assigned = {}  # package name -> item
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'rb+') as f:
+                data = f.read()
+                # A run killed mid-write leaves a partial last line; drop it so
+                # the next record doesn't get glued onto it
+                end = data.rfind(b'\n') + 1
+                if end < len(data):
+                    f.truncate(end)
+            for line in data[:end].decode('utf-8', 'surrogateescape').splitlines():
+                md5, _, key = line.partition('\t')
+                if not key:
+                    continue
+                item, _, name = key.partition('/')
+                if md5 == 'item':
+                    self._assigned[name] = item
+                    continue
+                self._done.add((key, md5))
+                # Ledgers written before assignments were recorded still place
+                # every uploaded package
+                package = name.split('/', 1)[0]
+                if '/' in name and package != 'resources':
+                    self._assigned.setdefault(package, item)
+
+    def done(self, key, md5):
+        with self._lock:
+            return (key, md5) in self._done
+
+    def items(self):
+        with self._lock:
+            return {key.split('/', 1)[0] for key, _ in self._done}
+
+    def _append(self, lines):
+        with open(self.path, 'a', encoding='utf-8', errors='surrogateescape') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, key, md5):
+        with self._lock:
+            self._done.add((key, md5))
+            self._append([f"{md5}\t{key}\n"])
+
+    def assign(self, names, per_item=PAGES_PER_ITEM, prefix=IA_ITEM_PREFIX, date=None):
+        # Returns item -> package names for the given packages
+        with self._lock:
+            sizes = Counter(self._assigned.values())
+            open_items = sorted(item for item, size in sizes.items()
+                                if size < per_item and item.startswith(prefix + '_'))
+            date = date or time.strftime('%Y%m%d')
+            sequence = max((int(item.rsplit('_', 1)[1]) for item in sizes
+                            if item.startswith(f"{prefix}_{date}_") and item.rsplit('_', 1)[1].isdigit()), default=0)
+            lines = []
+            for name in sorted(set(names) - self._assigned.keys()):
+                if not open_items:
+                    sequence += 1
+                    open_items.append(f"{prefix}_{date}_{sequence:03d}")
+                item = open_items[0]
+                self._assigned[name] = item
+                sizes[item] += 1
+                if sizes[item] >= per_item:
+                    open_items.pop(0)
+                lines.append(f"item\t{item}/{name}\n")
+            if lines:
+                self._append(lines)
+            assignment = {}
+            for name in sorted(set(names)):
+                assignment.setdefault(self._assigned[name], []).append(name)
+            return assignment
+
+
+class IaUploader:
+    def __init__(self, credentials, collection=IA_COLLECTION, mediatype=IA_MEDIATYPE, metadata=None,
+                 ledger=None, endpoint=IA_S3_URL, scheduler=None):
+        self.credentials = credentials
+        self.collection = collection
+        self.mediatype = mediatype
+        self.metadata = dict(metadata or {})
+        self.ledger = ledger or UploadLedger()
+        self.endpoint = endpoint.rstrip('/')
+        self.scheduler = scheduler or get_scheduler()
+        self.stats = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _put(self, identifier, remote, path, md5, extra_headers):
+        url = f"{self.endpoint}/{identifier}/{quote(remote)}"
+        headers = {'Authorization': f"LOW {self.credentials[0]}:{self.credentials[1]}",
+                   'Content-MD5': base64.b64encode(bytes.fromhex(md5)).decode('ascii'),
+                   'x-amz-auto-make-bucket': '1'}
+        headers.update(extra_headers)
+
+        def send():
+            with open(path, 'rb') as body:
+                response = http_client.put(url, data=body, headers=headers, timeout=UPLOAD_TIMEOUT)
+            # Raising makes the retry policy try again, like a failed connection
+            if response.status_code == 400 and b'BadDigest' in response.content:
+                raise ChecksumMismatch(f"endpoint rejected the checksum of {remote}")
+            etag = response.headers.get('ETag', '').strip('"')
+            if 200 <= response.status_code < 300 and etag and etag != md5:
+                raise ChecksumMismatch(f"ETag {etag} doesn't match {md5} for {remote}")
+            return response
+
+        response = retry_policy.call(send, upload_bucket, label=f"Uploading {identifier}/{remote}")
+        if response is not None and 200 <= response.status_code < 300:
+            self.ledger.record(f"{identifier}/{remote}", md5)
+            self._count('files uploaded')
+            self._count('bytes uploaded', os.path.getsize(path))
+            return True
+        status = response.status_code if response is not None else 'no response'
+        print(f"Failed to upload {identifier}/{remote}: {status}")
+        self._count('files failed')
+        return False
+
+    def upload_item(self, identifier, files, metadata=None):
+        # files maps remote name -> local path
+        todo = []
+        for remote, path in sorted(files.items()):
+            md5 = file_md5(path)
+            if self.ledger.done(f"{identifier}/{remote}", md5):
+                self._count('files skipped')
+            else:
+                todo.append((remote, path, md5))
+        if not todo:
+            return True
+
+        item_metadata = {'collection': self.collection, 'mediatype': self.mediatype, **(metadata or {}),
+                         **self.metadata}
+        create_headers = metadata_headers(item_metadata)
+        create_headers['x-archive-size-hint'] = str(sum(os.path.getsize(path) for _, path, _ in todo))
+        # The first PUT creates the item with its metadata; the rest can only
+        # run in parallel once it exists, and would overwrite that metadata
+        # if they repeated the headers
+        if identifier not in self.ledger.items():
+            remote, path, md5 = todo.pop(0)
+            if not self._put(identifier, remote, path, md5, create_headers):
+                return False
+        host = urlsplit(self.endpoint).netloc
+        results = self.scheduler.map(lambda entry: self._put(identifier, *entry, {}), todo, host=host)
+        ok = all(results)
+        print(f"{'Uploaded' if ok else 'Partially uploaded'} {identifier} ({len(files)} files)")
+        return ok
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+        print("Uploads: " + (", ".join(f"{count} {name}" for name, count in sorted(stats.items())) or "nothing to do"))
+
+
+def find_packages(root):
+    if not os.path.isdir(root):
+        return []
+    return sorted(os.path.join(root, name) for name in os.listdir(root)
+                  if os.path.exists(os.path.join(root, name, 'manifest.json')))
+
+
+def upload_packages(package_dirs, objects_dir, uploader, pages_per_item=PAGES_PER_ITEM, prefix=IA_ITEM_PREFIX):
+    # Shared resources sit once at the item root (resources/<sha256><ext>, as
+    # the manifests say); everything else goes under the package's own name.
+    from web_tool.package import package_files  # package imports this module
+    dirs = {os.path.basename(os.path.normpath(path)): path for path in package_dirs}
+    uploaded = failed = 0
+    for identifier, names in sorted(uploader.ledger.assign(dirs, pages_per_item, prefix).items()):
+        files = {}
+        pages = []
+        for name in names:
+            page_url, package = package_files(dirs[name], objects_dir)
+            pages.append(page_url)
+            for remote, path in package.items():
+                files[remote if remote.startswith('resources/') else f"{name}/{remote}"] = path
+        # Only used if this run creates the item
+        metadata = {'title': f"Archived web pages ({identifier})", 'date': time.strftime('%Y-%m-%d'),
+                    'description': '\n'.join(pages)}
+        if uploader.upload_item(identifier, files, metadata):
+            uploaded += len(names)
+        else:
+            failed += len(names)
+    return uploaded, failed
+
+
+def _parse_metadata(pairs, parser):
+    metadata = {}
+    for pair in pairs:
+        key, sep, value = pair.partition('=')
+        if not sep or not key:
+            parser.error(f"--meta expects KEY=VALUE, got {pair!r}")
+        metadata.setdefault(key, []).append(value)
+    return {key: values[0] if len(values) == 1 else values for key, values in metadata.items()}
+
+
+def add_upload_arguments(parser):
+    parser.add_argument('--collection', default=IA_COLLECTION)
+    parser.add_argument('--mediatype', default=IA_MEDIATYPE)
+    parser.add_argument('--meta', action='append', default=[], metavar='KEY=VALUE',
+                        help="extra item metadata; repeat a key for multiple values")
+    parser.add_argument('--pages-per-item', type=int, default=PAGES_PER_ITEM)
+    parser.add_argument('--item-prefix', default=IA_ITEM_PREFIX)
+    parser.add_argument('--ledger', default=LEDGER_PATH, help="record of verified uploads, for resuming")
+
+
+def uploader_from_args(args, parser):
+    credentials = load_credentials()
+    if credentials is None:
+        print("No Internet Archive credentials: set IA_ACCESS_KEY/IA_SECRET_KEY or write an [s3] section to ~/.ia")
+        return None
+    return IaUploader(credentials, args.collection, args.mediatype, _parse_metadata(args.meta, parser),
+                      UploadLedger(args.ledger))
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Upload packaged pages to the Internet Archive in batches")
+    parser.add_argument('packages', nargs='*', help="package directories (default: every package under --root)")
+    parser.add_argument('--root', default='packages', help="directory holding the packages and objects/")
+    add_upload_arguments(parser)
+    args = parser.parse_args(argv)
+
+    uploader = uploader_from_args(args, parser)
+    if uploader is None:
+        return 1
+    package_dirs = args.packages or find_packages(args.root)
+    try:
+        uploaded, failed = upload_packages(package_dirs, os.path.join(args.root, 'objects'), uploader,
+                                           args.pages_per_item, args.item_prefix)
+    finally:
+        uploader.report()
+    print(f"Uploaded {uploaded} packages, {failed} failed")
+    return 1 if failed else 0
@@ -0,0 +1,105 @@
+import mmap
+import re
+from html import unescape
+from urllib.parse import urljoin
+
+# Tokenizes HTML in a single forward scan without building a tree. Mirrors what
+# BeautifulSoup's html.parser backend exposes for our purposes: lowercased tag and
+# attribute names, unescaped attribute values, last duplicate attribute wins, and
+# no tags parsed inside <script>/<style> bodies or comments.
+
+RAW_TEXT_TAGS = ('script', 'style')
+# BeautifulSoup turns these into lists, so they never matched `isinstance(v, str)`
+MULTI_VALUED_ATTRIBUTES = ('class', 'rel', 'rev', 'accept-charset', 'headers', 'accesskey', 'dropzone')
+
+
+def _compile(pattern, flags=0):
+    return re.compile(pattern, flags), re.compile(pattern.encode('ascii'), flags)
+
+
+_TAG_OPEN = _compile(r'<(!--|[a-zA-Z][^\s/>]*)')
+_TAG_REST = _compile(r'((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>')
+_ATTRIBUTE = _compile(r'([^\s/=>"\'][^\s/=>]*)(?:\s*=\s*("[^"]*"|\'[^\']*\'|[^\s>]*))?')
+_COMMENT_END = ('-->', b'-->')
+_RAW_TEXT_END = {tag: _compile(r'</%s\s*>' % tag, re.IGNORECASE) for tag in RAW_TEXT_TAGS}
+
+
+def iter_tags(html, encoding='utf-8'):
+    # An mmap works like bytes here, so large pages can be scanned straight from disk
+    is_bytes = isinstance(html, (bytes, bytearray, memoryview, mmap.mmap))
+    if isinstance(html, memoryview):
+        html = bytes(html)
+    idx = 1 if is_bytes else 0
+    tag_open = _TAG_OPEN[idx]
+    tag_rest = _TAG_REST[idx]
+    attribute = _ATTRIBUTE[idx]
+    comment_end = _COMMENT_END[idx]
+
+    pos = 0
+    while True:
+        match = tag_open.search(html, pos)
+        if match is None:
+            return
+        name = match.group(1)
+        if name in ('!--', b'!--'):
+            end = html.find(comment_end, match.end())
+            if end == -1:
+                return
+            pos = end + 3
+            continue
+
+        rest = tag_rest.match(html, match.end())
+        if rest is None:
+            pos = match.end()
+            continue
+        pos = rest.end()
+
+        if is_bytes:
+            name = name.decode('ascii', 'replace')
+        name = name.lower()
+
+        attrs = {}
+        for attr in attribute.finditer(rest.group(1)):
+            key, value = attr.group(1), attr.group(2)
+            if is_bytes:
+                key = key.decode('ascii', 'replace')
+            if value is None:
+                value = ''
+            else:
+                if value[:1] in ('"', "'", b'"', b"'"):
+                    value = value[1:-1]
+                if is_bytes:
+                    value = value.decode(encoding, 'replace')
+                if '&' in value:
+                    value = unescape(value)
+            attrs[key.lower()] = value
+
+        yield name, attrs
+
+        if name in _RAW_TEXT_END:
+            end = _RAW_TEXT_END[name][idx].search(html, pos)
+            if end is None:
+                return
+            pos = end.end()
+
+
+def extract_urls(html, base_url, encoding='utf-8'):
+    links = set()
+    images = set()
+    other_urls = set()
+
+    for name, attrs in iter_tags(html, encoding):
+        if name == 'a' and 'href' in attrs:
+            link = urljoin(base_url, attrs['href'])
+            if link.startswith('http'):
+                links.add(link)
+        elif name == 'img' and 'src' in attrs:
+            img_src = urljoin(base_url, attrs['src'])
+            if img_src.startswith('http'):
+                images.add(img_src)
+
+        for key, value in attrs.items():
+            if value.startswith('http') and key not in MULTI_VALUED_ATTRIBUTES:
+                other_urls.add(value)
+
+    return links, images, other_urls
@@ -0,0 +1,205 @@
+import argparse
+import contextlib
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from web_tool import http_client, metrics
+from web_tool.scheduler import get_scheduler, host_key
+
+LIVENESS_TIMEOUT = 10
+DNS_TTL = 24 * 3600  # hosts that don't resolve are skipped for a day
+DNS_FAILURES = 3  # consecutive resolution failures before that; one can be a resolver hiccup
+BREAKER_THRESHOLD = 3  # consecutive timeouts/connection failures before a host is skipped
+BREAKER_COOLDOWN = 6 * 3600  # how long a tripped host is skipped; one probe is let through afterwards
+DNS_ERROR_MARKERS = ('NameResolutionError', 'Failed to resolve', 'Name or service not known',
+                     'nodename nor servname', 'getaddrinfo failed', 'No address associated')
+
+
+def classify_error(e):
+    message = str(e)
+    if any(marker in message for marker in DNS_ERROR_MARKERS):
+        return 'dns'
+    names = {cls.__name__ for cls in type(e).__mro__}
+    if names & {'Timeout', 'TimeoutError', 'ConnectionError'}:
+        return 'unreachable'
+    return 'error'
+
+
+def probe_url(url):
+    # 'live', 'dead' (404), 'dns', 'unreachable' (timeout or refused) or 'error'
+    try:
+        with metrics.stage('liveness', url):
+            response = http_client.head(url, timeout=LIVENESS_TIMEOUT, allow_redirects=True)
+        return 'dead' if response.status_code == 404 else 'live'
+    except Exception as e:
+        return classify_error(e)
+
+
+def check_url_status(url):
+    return probe_url(url) == 'live'
+
+
+class LivenessChecker:
+    # Cache lookups and dead-host checks come first, so only URLs nothing is
+    # known about get a HEAD. Timeouts and refused connections count against
+    # the host; after BREAKER_THRESHOLD in a row (DNS_FAILURES if it doesn't
+    # resolve) it is recorded as down, which stops probing it in this run and
+    # in later runs until the cooldown ends. The host is then half-open: one
+    # trial probe goes through while its other URLs wait. If the host answers
+    # it is probed as usual again, otherwise it is skipped for another cooldown.
+    # Any probe that fails counts the URL as not live, as before.
+
+    def __init__(self, cache=None, scheduler=None, breaker_threshold=BREAKER_THRESHOLD,
+                 breaker_cooldown=BREAKER_COOLDOWN, dns_failures=DNS_FAILURES):
+        self.cache = cache
+        self.scheduler = scheduler or get_scheduler()
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.dns_failures = dns_failures
+        self.outcomes = Counter()
+        self._failures = defaultdict(int)
+        self._open = {}  # host -> reason, for hosts known down during this run
+        self._trials = {}  # half-open host -> Event set when its trial probe finishes, or None before it starts
+        self._checked = set()  # hosts whose cache entry was already read
+        self._lock = threading.Lock()
+
+    def _host_down(self, host):
+        with self._lock:
+            if host in self._open:
+                return self._open[host]
+            if host in self._checked or not self.cache:
+                return None
+        state = self.cache.host_state(host)
+        with self._lock:
+            self._checked.add(host)
+            if state is None:
+                return None
+            reason, expires = state
+            if expires > time.time():
+                self._open[host] = reason
+                return reason
+            self._trials.setdefault(host, None)
+        return None
+
+    def _mark_down(self, host, reason):
+        with self._lock:
+            self._open[host] = reason
+        if self.cache:
+            self.cache.mark_host_down(host, reason, DNS_TTL if reason == 'dns' else self.breaker_cooldown)
+
+    def known_dead(self, urls):
+        # Local-only: URLs cached as 404 or on a host known to be down
+        urls = list(urls)
+        dead = {url for url in urls if self._host_down(host_key(url))}
+        if self.cache:
+            dead |= self.cache.known_dead(url for url in urls if url not in dead)
+        return dead
+
+    def _admit(self, host):
+        # False if the host is down; 'trial' if this probe decides a half-open host
+        while True:
+            if self._host_down(host):
+                return False
+            with self._lock:
+                if host not in self._trials:
+                    return True
+                event = self._trials[host]
+                if event is None:
+                    self._trials[host] = threading.Event()
+                    return 'trial'
+            # The trial is already running, not queued, so waiting can't deadlock the scheduler
+            event.wait()
+
+    def _check(self, url):
+        host = host_key(url)
+        admitted = self._admit(host)
+        if not admitted:
+            with self._lock:
+                self.outcomes['skipped'] += 1
+            return False
+        trial = admitted == 'trial'
+        outcome = 'error'
+        try:
+            outcome = probe_url(url)
+        finally:
+            failed = outcome in ('dns', 'unreachable')
+            with self._lock:
+                self.outcomes[outcome] += 1
+                if failed:
+                    self._failures[host] += 1
+                    threshold = self.dns_failures if outcome == 'dns' else self.breaker_threshold
+                    trip = trial or self._failures[host] == threshold
+                else:
+                    self._failures.pop(host, None)
+                    trip = False
+            if outcome in ('live', 'dead') and self.cache:
+                self.cache.put(url, outcome == 'live')
+            if trip:
+                self._mark_down(host, outcome)
+                with self._lock:
+                    self.outcomes['breakers tripped'] += 1
+            elif trial and self.cache:
+                self.cache.mark_host_up(host)
+            if trial:
+                with self._lock:
+                    event = self._trials.pop(host)
+                    self.outcomes['trial probes'] += 1
+                event.set()
+        return outcome == 'live'
+
+    def check(self, urls):
+        results = {}
+        todo = []
+        for url in dict.fromkeys(urls):
+            live = self.cache.get(url) if self.cache else None
+            if live is None and self._host_down(host_key(url)):
+                live = False
+                with self._lock:
+                    self.outcomes['skipped'] += 1
+            if live is None:
+                todo.append(url)
+            else:
+                results[url] = live
+        results.update(zip(todo, self.scheduler.map(self._check, todo)))
+        return results
+
+    def report(self):
+        if self.cache:
+            self.cache.report()
+        with self._lock:
+            outcomes = dict(self.outcomes)
+        if outcomes:
+            print("Liveness: " + ", ".join(f"{count} {name}" for name, count in sorted(outcomes.items())))
+
+
+def check_liveness(urls, scheduler=None, cache=None):
+    return LivenessChecker(cache, scheduler).check(urls)
+
+
+def _read_args_or_stdin(urls):
+    if urls:
+        return urls
+    return [line.strip() for line in sys.stdin if line.strip()]
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Print the URLs that don't answer 404")
+    parser.add_argument('urls', nargs='*', help="URLs to check (default: one per line on stdin)")
+    parser.add_argument('--no-cache', action='store_true', help="probe every URL, ignoring the liveness cache")
+    args = parser.parse_args(argv)
+
+    from web_tool.liveness_cache import LivenessCache
+    cache = None if args.no_cache else LivenessCache()
+    checker = LivenessChecker(cache)
+    try:
+        for url, live in checker.check(_read_args_or_stdin(args.urls)).items():
+            if live:
+                sys.stdout.write(f"{url}\n")
+    finally:
+        with contextlib.redirect_stdout(sys.stderr):
+            checker.report()
+        if cache:
+            cache.close()
+    return 0
@@ -0,0 +1,88 @@
+import os
+import time
+
+from web_tool.sqlite_cache import SqliteCache
+
+LIVENESS_CACHE_PATH = os.getenv('LIVENESS_CACHE_PATH', 'liveness_cache.sqlite')
+LIVE_TTL = 7 * 24 * 3600  # a live page only matters until it gets archived
+DEAD_TTL = 30 * 24 * 3600  # 404s rarely come back
+MAX_ENTRIES = 1000000
+LOOKUP_BATCH = 500  # URLs per bulk query, under SQLite's variable limit
+
+# Per-URL answers plus host-wide negative entries: a host that doesn't resolve
+# or whose circuit breaker tripped is skipped without probing until it expires.
+# Expired host entries are kept for DEAD_TTL so the next run knows the host was
+# down and lets a single trial probe through before probing it in full.
+
+
+class LivenessCache(SqliteCache):
+    table = 'liveness'
+    key = 'url'
+    value = 'live'
+    schema = ("CREATE TABLE IF NOT EXISTS dead_hosts (host TEXT PRIMARY KEY, reason TEXT NOT NULL, expires REAL NOT NULL)",)
+
+    def __init__(self, path=LIVENESS_CACHE_PATH, live_ttl=LIVE_TTL, dead_ttl=DEAD_TTL, max_entries=MAX_ENTRIES):
+        self.live_ttl = live_ttl
+        self.dead_ttl = dead_ttl
+        self.host_hits = 0
+        super().__init__(path, max_entries)
+
+    def get(self, url):
+        live = self._get(url)
+        return None if live is None else bool(live)
+
+    def get_many(self, urls):
+        return {url: bool(live) for url, live in self._get_many(urls).items()}
+
+    def put(self, url, live):
+        self._put(url, int(bool(live)), self.live_ttl if live else self.dead_ttl)
+
+    def known_dead(self, urls):
+        # Bulk lookup of cached 404s; not counted as hits since the URLs are
+        # looked up again if they get as far as a liveness check
+        urls = list(urls)
+        dead = set()
+        conn = self._connect()
+        now = time.time()
+        for start in range(0, len(urls), LOOKUP_BATCH):
+            batch = urls[start:start + LOOKUP_BATCH]
+            rows = conn.execute(
+                f"SELECT url FROM liveness WHERE live = 0 AND expires > ? AND url IN ({','.join('?' * len(batch))})",
+                [now] + batch).fetchall()
+            dead.update(row[0] for row in rows)
+        return dead
+
+    def host_state(self, host):
+        # (reason, expires) for a host that was marked down, even if it has expired since
+        row = self._connect().execute("SELECT reason, expires FROM dead_hosts WHERE host = ?", (host,)).fetchone()
+        if row is None:
+            return None
+        if row[1] > time.time():
+            with self._lock:
+                self.host_hits += 1
+        return row[0], row[1]
+
+    def mark_host_down(self, host, reason, ttl):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO dead_hosts (host, reason, expires) VALUES (?, ?, ?)",
+            (host, reason, time.time() + ttl))
+
+    def mark_host_up(self, host):
+        self._connect().execute("DELETE FROM dead_hosts WHERE host = ?", (host,))
+
+    def evict(self):
+        super().evict()
+        self._connect().execute("DELETE FROM dead_hosts WHERE expires <= ?", (time.time() - self.dead_ttl,))
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats['host_hits'] = self.host_hits
+        return stats
+
+    def report(self):
+        stats = self.stats()
+        total = stats['hits'] + stats['misses']
+        rate = 100.0 * stats['hits'] / total if total else 0.0
+        print(f"Liveness cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({rate:.1f}% of HEAD requests saved), {stats['host_hits']} dead hosts remembered")
@@ -0,0 +1,356 @@
+import bisect
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from web_tool.scheduler import host_key
+
+METRICS_DIR = os.getenv('METRICS_DIR')  # when set, every command writes its metrics here
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL') or 0)  # seconds between stack samples; 0 is off
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+MAX_HOSTS = 100  # distinct host label values; later hosts are counted as "other"
+TOP_HOSTS = 20  # hosts listed in the run summary, by total stage time
+TOP_STACKS = 25  # hottest stacks listed in the run summary
+PREFIX = 'web_tool_'
+
+# Counters, gauges and fixed-bucket histograms keyed by (name, labels), kept
+# behind one lock: recording is a dict lookup and an add, cheap enough to leave
+# on in the scheduled jobs. Nothing is recorded unless enable() was called (cli
+# does so when METRICS_DIR is set, and the scrape and availability commands
+# always do, for their error report); the module-level helpers are no-ops then.
+# Stages time a unit of pipeline work per host, track how many are in flight
+# and count exceptions by class. HTTP requests are recorded by an http_client
+# observer. At exit, a Prometheus text file and a JSON run summary are written.
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    def __init__(self, max_hosts=MAX_HOSTS):
+        self.max_hosts = max_hosts
+        self.started = time.time()
+        self.counters = Counter()
+        self.gauges = {}  # key -> [value, peak]
+        self.histograms = {}
+        self.errors = Counter()  # (stage, exception class)
+        self.error_examples = {}
+        self._hosts = set()
+        self._lock = threading.Lock()
+
+    def host(self, url):
+        if not url:
+            return ''
+        host = host_key(url)
+        if host in self._hosts:
+            return host
+        with self._lock:
+            if len(self._hosts) < self.max_hosts:
+                self._hosts.add(host)
+                return host
+        return 'other'
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def gauge_add(self, name, delta, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            gauge = self.gauges.get(key)
+            if gauge is None:
+                gauge = self.gauges[key] = [0, 0]
+            gauge[0] += delta
+            if gauge[0] > gauge[1]:
+                gauge[1] = gauge[0]
+
+    def error(self, stage, e, url=None):
+        name = type(e).__name__
+        with self._lock:
+            self.errors[(stage, name)] += 1
+            self.error_examples.setdefault((stage, name), f"{url}: {e}" if url else str(e))
+
+    def stage(self, name, url=None):
+        return _Stage(self, name, url)
+
+    def observe_http(self, method, url, response, elapsed):
+        host = self.host(url)
+        status = str(response.status_code) if response is not None else 'error'
+        self.observe('http_request_seconds', elapsed, method=method, host=host)
+        self.inc('http_responses', status=status, host=host)
+
+    def prometheus(self):
+        with self._lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            errors = sorted(self.errors.items())
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for (name, labels), value in counters:
+            declare(f"{name}_total", 'counter')
+            lines.append(f"{PREFIX}{name}_total{_labels(labels)} {value}")
+        for (stage, error), count in errors:
+            declare('errors_total', 'counter')
+            lines.append(f"{PREFIX}errors_total{_labels((('class', error), ('stage', stage)))} {count}")
+        # Each family has to be contiguous, so all current values go before all peaks
+        for (name, labels), (value, _) in gauges:
+            declare(name, 'gauge')
+            lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+        for (name, labels), (_, peak) in gauges:
+            declare(f"{name}_peak", 'gauge')
+            lines.append(f"{PREFIX}{name}_peak{_labels(labels)} {peak}")
+        for (name, labels), histogram in histograms:
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {histogram.sum:.6f}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, command=None):
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = {key: list(value) for key, value in self.gauges.items()}
+            histograms = dict(self.histograms)
+            errors = dict(self.errors)
+            examples = dict(self.error_examples)
+        stages = {}
+        hosts = Counter()
+        for (name, labels), histogram in histograms.items():
+            labels = dict(labels)
+            if name == 'stage_seconds':
+                stages.setdefault(labels['stage'], Histogram()).merge(histogram)
+                hosts[labels.get('host') or '-'] += histogram.sum
+        errors_by_stage = Counter()
+        for (stage, _), count in errors.items():
+            errors_by_stage[stage] += count
+        statuses = Counter()
+        for (name, labels), count in counters.items():
+            if name == 'http_responses':
+                statuses[dict(labels)['status']] += count
+        return {
+            'command': command,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.started)),
+            'seconds': round(time.time() - self.started, 3),
+            'stages': {stage: {'count': histogram.count, 'errors': errors_by_stage.get(stage, 0),
+                               'seconds': round(histogram.sum, 3), 'p50': round(histogram.quantile(0.5), 3),
+                               'p95': round(histogram.quantile(0.95), 3), 'max': round(histogram.max, 3),
+                               'peak_in_flight': gauges.get(('stage_in_flight', (('stage', stage),)), [0, 0])[1]}
+                       for stage, histogram in sorted(stages.items())},
+            'hosts': [{'host': host, 'seconds': round(seconds, 3)} for host, seconds in hosts.most_common(TOP_HOSTS)],
+            'http_statuses': dict(sorted(statuses.items())),
+            'errors': [{'stage': stage, 'class': name, 'count': count, 'example': examples.get((stage, name))}
+                       for (stage, name), count in sorted(errors.items(), key=lambda item: -item[1])],
+        }
+
+    def report(self):
+        with self._lock:
+            errors = self.errors.most_common()
+            examples = dict(self.error_examples)
+        if errors:
+            print("Errors:")
+            for (stage, name), count in errors:
+                print(f"  {count} {stage} {name}, e.g. {examples[(stage, name)]}")
+
+    def write(self, directory, command=None, profiler=None):
+        os.makedirs(directory, exist_ok=True)
+        # One set of files per process: a workflow may run a command several times
+        base = os.path.join(directory, f"{command or 'run'}-{os.getpid()}")
+        summary = self.summary(command)
+        if profiler is not None:
+            summary['profile'] = profiler.summary()
+            profiler.write(base + '.stacks.txt')
+        with open(base + '.prom', 'w') as f:
+            f.write(self.prometheus())
+        with open(base + '.json', 'w') as f:
+            json.dump(summary, f, indent=1)
+        return base
+
+
+class _Stage:
+    __slots__ = ('metrics', 'name', 'url', 'start')
+
+    def __init__(self, metrics, name, url):
+        self.metrics = metrics
+        self.name = name
+        self.url = url
+
+    def __enter__(self):
+        self.metrics.gauge_add('stage_in_flight', 1, stage=self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        metrics = self.metrics
+        metrics.gauge_add('stage_in_flight', -1, stage=self.name)
+        metrics.observe('stage_seconds', elapsed, stage=self.name, host=metrics.host(self.url))
+        if exc is not None:
+            metrics.error(self.name, exc, self.url)
+        return False
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+class SamplingProfiler:
+    # Samples every thread's stack from a background thread; stacks are kept
+    # in collapsed form ("outer;...;inner count"), which flame graph tools read.
+    # Threads parked on a condition (idle scheduler workers) are left out.
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if code.co_name == 'wait' and code.co_filename.endswith('threading.py'):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def summary(self):
+        return {'interval': self.interval, 'samples': self.samples,
+                'hot_stacks': [{'count': count, 'stack': stack.split(';')[-8:]}
+                               for stack, count in self.stacks.most_common(TOP_STACKS)]}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+_metrics = None
+
+
+def enable():
+    # The observer is only attached once the HTTP client is created, so
+    # enabling metrics doesn't import requests for commands that never use it
+    global _metrics
+    if _metrics is None:
+        from web_tool import http_client
+        _metrics = Metrics()
+        http_client.add_observer(_metrics.observe_http)
+    return _metrics
+
+
+def get_metrics():
+    return _metrics
+
+
+def stage(name, url=None):
+    if _metrics is None:
+        return contextlib.nullcontext()
+    return _metrics.stage(name, url)
+
+
+def error(stage_name, e, url=None):
+    if _metrics is not None:
+        _metrics.error(stage_name, e, url)
+
+
+def inc(name, amount=1, **labels):
+    if _metrics is not None:
+        _metrics.inc(name, amount, **labels)
+
+
+def report():
+    if _metrics is not None:
+        _metrics.report()
+
+
+@contextlib.contextmanager
+def recording(command, directory=METRICS_DIR, profile_interval=PROFILE_INTERVAL):
+    if not directory:
+        yield None
+        return
+    metrics = enable()
+    profiler = SamplingProfiler(profile_interval).start() if profile_interval > 0 else None
+    try:
+        yield metrics
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        base = metrics.write(directory, command, profiler)
+        print(f"Metrics written to {base}.prom and {base}.json", file=sys.stderr)
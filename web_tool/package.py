@@ -0,0 +1,246 @@
+import argparse
+import hashlib
+import json
+import mimetypes
+import mmap
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+from web_tool import http_client
+from web_tool.ia_upload import add_upload_arguments, upload_packages, uploader_from_args
+from web_tool.link_extractor import iter_tags
+from web_tool.scheduler import get_scheduler
+
+URLS_TO_PROCESS = 100
+MAX_WORKERS = 10  # pages packaged at once; requests are capped by the scheduler
+RESOURCE_TAGS = ('img', 'script', 'link')
+PACKAGE_ROOT = 'packages'
+FETCH_TIMEOUT = 30
+CHUNK_SIZE = 64 * 1024
+DROPPED_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length')  # bodies are stored decoded
+
+# Every response body is streamed to disk in chunks and stored once under its
+# SHA-256 in <root>/objects, so an asset shared by many pages is fetched and
+# kept once per run. A page package is just a manifest mapping each URL to its
+# object; uploads (see ia_upload) reference the objects directly, and --warc
+# writes the same responses as a WARC file instead.
+
+
+def _extension(url, content_type):
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    if re.fullmatch(r'\.[a-z0-9]{1,8}', ext):
+        return ext
+    return mimetypes.guess_extension((content_type or '').split(';')[0].strip()) or ''
+
+
+class ResourceStore:
+    def __init__(self, root=PACKAGE_ROOT, scheduler=None):
+        self.root = root
+        self.objects = os.path.join(root, 'objects')
+        os.makedirs(self.objects, exist_ok=True)
+        self.scheduler = scheduler or get_scheduler()
+        self.stats = Counter()
+        self._entries = {}  # url -> entry, or None if the fetch failed
+        self._pending = {}  # url -> Event set when its fetch finishes
+        self._lock = threading.Lock()
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects, sha256[:2], sha256)
+
+    def fetch(self, url):
+        # The first caller downloads; concurrent callers for the same URL wait
+        # for it. Waiting is safe under the scheduler because the owner is
+        # already running, not queued.
+        with self._lock:
+            if url in self._entries:
+                self.stats['url reused'] += 1
+                return self._entries[url]
+            event = self._pending.get(url)
+            owner = event is None
+            if owner:
+                event = self._pending[url] = threading.Event()
+        if not owner:
+            event.wait()
+            with self._lock:
+                self.stats['url reused'] += 1
+                return self._entries.get(url)
+        entry = None
+        try:
+            entry = self._download(url)
+        finally:
+            with self._lock:
+                self._entries[url] = entry
+                del self._pending[url]
+            event.set()
+        return entry
+
+    def fetch_many(self, urls):
+        urls = list(dict.fromkeys(urls))
+        return dict(zip(urls, self.scheduler.map(self.fetch, urls)))
+
+    def _download(self, url):
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects, prefix='.part-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                response = http_client.get(url, timeout=FETCH_TIMEOUT, stream=True)
+                with response:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+            sha256 = digest.hexdigest()
+            path = self.object_path(sha256)
+            with self._lock:
+                if os.path.exists(path):
+                    os.remove(tmp_path)
+                    self.stats['content deduplicated'] += 1
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(tmp_path, path)
+                    self.stats['objects stored'] += 1
+                    self.stats['bytes stored'] += size
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"Error fetching {url}: {str(e)}")
+            with self._lock:
+                self.stats['errors'] += 1
+            return None
+        headers = [(name, value) for name, value in response.headers.items()
+                   if name.lower() not in DROPPED_HEADERS] + [('Content-Length', str(size))]
+        content_type = response.headers.get('Content-Type', '')
+        return {'sha256': sha256, 'size': size, 'status': response.status_code, 'reason': response.reason or '',
+                'content_type': content_type, 'headers': headers, 'fetched': time.time(),
+                'file': f"resources/{sha256}{_extension(url, content_type)}"}
+
+    def resource_urls(self, page_url, entry):
+        # Scanned from an mmap of the stored page, so a large page isn't read into memory
+        if entry is None or entry['size'] == 0:
+            return []
+        urls = []
+        with open(self.object_path(entry['sha256']), 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as html:
+            for name, attrs in iter_tags(html):
+                if name not in RESOURCE_TAGS:
+                    continue
+                src = attrs.get('src') or attrs.get('href')
+                if src:
+                    src = urljoin(page_url, src.strip())
+                    if src.startswith(('http://', 'https://')):
+                        urls.append(src)
+        return urls
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+        print("Resource store: " + ", ".join(f"{count} {name}" for name, count in sorted(stats.items())))
+
+
+def build_package(url, store):
+    page = store.scheduler.call(url, store.fetch, url)
+    if page is None:
+        return None
+    resources = store.fetch_many(store.resource_urls(url, page))
+    return {'url': url, 'page': page,
+            'resources': {resource_url: entry for resource_url, entry in resources.items() if entry}}
+
+
+def write_package(manifest, store, warc=False):
+    # One directory per page, named after the page URL so a rerun writes the same package
+    domain = urlparse(manifest['url']).netloc
+    identifier = f"{domain}_{hashlib.sha256(manifest['url'].encode()).hexdigest()[:12]}"
+    package_dir = os.path.join(store.root, identifier)
+    os.makedirs(package_dir, exist_ok=True)
+    if warc:
+        from web_tool.warc import WarcWriter
+        writer = WarcWriter(os.path.join(package_dir, f"{identifier}.warc.gz"))
+        try:
+            writer.warcinfo([('isPartOf', identifier), ('description', f"{manifest['url']} and its resources")])
+            for url, entry in [(manifest['url'], manifest['page'])] + list(manifest['resources'].items()):
+                writer.response(url, entry['fetched'], entry['status'], entry['reason'], entry['headers'],
+                                store.object_path(entry['sha256']), entry['size'], entry['sha256'])
+        finally:
+            writer.close()
+    # Resource paths are relative to the item the package is uploaded into
+    with open(os.path.join(package_dir, 'manifest.json'), 'w') as f:
+        json.dump({'url': manifest['url'], 'index': manifest['page']['sha256'], 'warc': warc,
+                   'resources': {url: {key: entry[key] for key in ('file', 'sha256', 'size', 'status', 'content_type')}
+                                 for url, entry in manifest['resources'].items()}}, f, indent=1, sort_keys=True)
+    return package_dir
+
+
+def package_files(package_dir, objects_dir):
+    # Returns (page URL, {remote name: local path}) for uploading a written package
+    with open(os.path.join(package_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    files = {'manifest.json': os.path.join(package_dir, 'manifest.json')}
+    object_path = lambda sha256: os.path.join(objects_dir, sha256[:2], sha256)
+    if manifest.get('warc'):
+        for name in os.listdir(package_dir):
+            if name.endswith('.warc.gz'):
+                files[name] = os.path.join(package_dir, name)
+    else:
+        files['index.html'] = object_path(manifest['index'])
+        for entry in manifest['resources'].values():
+            if entry['status'] < 400:  # error bodies only make sense with their status, i.e. in a WARC
+                files[entry['file']] = object_path(entry['sha256'])
+    return manifest['url'], files
+
+
+def process_url(url, store, warc=False):
+    manifest = build_package(url, store)
+    if manifest is None:
+        return None
+    package_dir = write_package(manifest, store, warc)
+    print(f"Packaged {url} as {os.path.basename(package_dir)} ({len(manifest['resources'])} resources)")
+    return package_dir
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Package pages with their resources and upload them to IA")
+    parser.add_argument('--file', default='selected_urls.txt', help="URLs to package, one per line")
+    parser.add_argument('--limit', type=int, default=URLS_TO_PROCESS)
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    parser.add_argument('--out-dir', default=PACKAGE_ROOT, help="where objects and packages are written")
+    parser.add_argument('--warc', action='store_true', help="package each page as a .warc.gz instead of loose files")
+    parser.add_argument('--no-upload', action='store_true', help="only write the packages")
+    add_upload_arguments(parser)
+    args = parser.parse_args(argv)
+
+    uploader = None
+    if not args.no_upload:
+        uploader = uploader_from_args(args, parser)
+        if uploader is None:
+            return 1
+
+    with open(args.file, 'r') as f:
+        urls = [line.strip() for line in f if line.strip()]
+    store = ResourceStore(args.out_dir)
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            package_dirs = [path for path in executor.map(lambda url: process_url(url, store, args.warc),
+                                                          urls[:args.limit]) if path]
+    finally:
+        store.report()
+    if uploader is None:
+        return 0
+    try:
+        uploaded, failed = upload_packages(package_dirs, store.objects, uploader, args.pages_per_item,
+                                           args.item_prefix)
+    finally:
+        uploader.report()
+    print(f"Uploaded {uploaded} packages, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
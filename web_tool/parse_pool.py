@@ -0,0 +1,102 @@
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+# HTML parsing is pure Python and holds the GIL, so the fetch threads hand the
+# raw bytes to a pool of worker processes and wait for the URL sets back; the
+# network waits keep overlapping in threads while parsing uses every core.
+# Pages of SHM_THRESHOLD bytes or more are copied once into a shared memory
+# block the worker reads, instead of being pickled through the pool's pipe.
+# With one CPU (or PARSE_PROCESSES=1) pages are parsed in the calling thread.
+
+PARSE_PROCESSES = int(os.getenv('PARSE_PROCESSES') or os.cpu_count() or 1)
+SHM_THRESHOLD = 256 * 1024  # bytes
+
+
+def _parse_in_worker(parse, payload, size, url, encoding):
+    if isinstance(payload, str):
+        # Name of a shared memory block holding the page
+        block = SharedMemory(payload)
+        try:
+            payload = bytes(block.buf[:size])
+        finally:
+            block.close()
+    return parse(payload, url, encoding)
+
+
+class ParsePool:
+    def __init__(self, processes=PARSE_PROCESSES, shm_threshold=SHM_THRESHOLD):
+        self.processes = processes
+        self.shm_threshold = shm_threshold
+        self.counts = Counter()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned, not forked: the pool starts while fetch threads hold locks
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=get_context('spawn'))
+            return self._executor
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def run(self, parse, content, url, encoding='utf-8'):
+        # parse(content, url, encoding) must be a module-level function
+        if self.processes <= 1:
+            self._count('in thread')
+            return parse(content, url, encoding)
+        executor = self._get_executor()
+        block = None
+        try:
+            if isinstance(content, (bytes, bytearray, memoryview)) and len(content) >= self.shm_threshold:
+                block = SharedMemory(create=True, size=len(content))
+                block.buf[:len(content)] = content
+                future = executor.submit(_parse_in_worker, parse, block.name, len(content), url, encoding)
+                self._count('shared memory')
+            else:
+                future = executor.submit(_parse_in_worker, parse, content, len(content), url, encoding)
+                self._count('pickled')
+            return future.result()
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); parse here and start a fresh pool next time
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            self._count('fallback')
+            return parse(content, url, encoding)
+        finally:
+            if block is not None:
+                block.close()
+                block.unlink()
+
+    def report(self):
+        with self._lock:
+            counts = dict(self.counts)
+        if counts:
+            print(f"Parse pool: {self.processes} processes; "
+                  + ", ".join(f"{count} {name}" for name, count in sorted(counts.items())))
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_parse_pool():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ParsePool()
+        return _shared
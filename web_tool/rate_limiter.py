@@ -0,0 +1,145 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+MIN_RATE = 0.02  # requests per second; one every 50 s at worst
+MAX_RATE = 2.0
+START_RATE = 0.5
+RATE_INCREASE = 0.02  # added per success
+RATE_DECREASE = 0.5  # multiplied per 429/5xx
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    # Additive-increase/multiplicative-decrease token bucket. Callers reserve a
+    # token and sleep for the returned delay, so threads and coroutines share one
+    # schedule without holding the lock while they wait.
+
+    def __init__(self, rate=START_RATE, burst=1, min_rate=MIN_RATE, max_rate=MAX_RATE,
+                 increase=RATE_INCREASE, decrease=RATE_DECREASE):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.successes = 0
+        self.throttles = 0
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._blocked_until - now)
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.successes += 1
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            self.throttles += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(endpoint, **kwargs):
+    with _buckets_lock:
+        if endpoint not in _buckets:
+            _buckets[endpoint] = TokenBucket(**kwargs)
+        return _buckets[endpoint]
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=3, base_delay=5.0, max_delay=300.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt):
+        # Full jitter: spread retries so parallel workers don't retry in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _outcome(self, bucket, response, error, attempt, label):
+        if error is None and response.status_code not in THROTTLE_STATUSES:
+            bucket.on_success()
+            return None
+        if error is None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            bucket.on_throttle(retry_after)
+            print(f"{label}: HTTP {response.status_code}, rate now {bucket.rate:.3f}/s "
+                  f"(attempt {attempt + 1} of {self.max_attempts})")
+            # The bucket already holds callers back for Retry-After
+            return 0.0 if retry_after else self.backoff(attempt)
+        print(f"{label}: {error} (attempt {attempt + 1} of {self.max_attempts})")
+        return self.backoff(attempt)
+
+    def call(self, send, bucket, label='request'):
+        response = None
+        for attempt in range(self.max_attempts):
+            bucket.acquire()
+            error = None
+            try:
+                response = send()
+            except Exception as e:
+                response, error = None, e
+            delay = self._outcome(bucket, response, error, attempt, label)
+            if delay is None:
+                return response
+            if attempt < self.max_attempts - 1 and delay:
+                time.sleep(delay)
+        return response
+
+    async def call_async(self, send, bucket, label='request'):
+        response = None
+        for attempt in range(self.max_attempts):
+            await bucket.acquire_async()
+            error = None
+            try:
+                response = await send()
+            except Exception as e:
+                response, error = None, e
+            delay = self._outcome(bucket, response, error, attempt, label)
+            if delay is None:
+                return response
+            if attempt < self.max_attempts - 1 and delay:
+                await asyncio.sleep(delay)
+        return response
@@ -0,0 +1,157 @@
+import importlib
+import json
+import os
+import re
+import threading
+
+# Site-specific URLs that only show up in raw page text (scripts, JSON blobs,
+# srcset strings) rather than in the tags link_extractor reads. Each rule is a
+# literal URL prefix or a regex, the characters that end a URL, and an optional
+# rewrite. Prefix rules are keyed by their URL's scheme and host: one pass
+# collects the sites a page links to, and only the rules for those are looked
+# for, so adding rules for other sites doesn't slow the scan down. (A regex
+# alternation of the prefixes would: re tries its branches one at a time.)
+# Pattern rules share one combined regex.
+# Extra rules come from a JSON file named by RAW_RULES_PATH:
+#   [{"name": "...", "prefix": "https://...", "terminators": "\"'", "rewrite": "module:function"}]
+# with "pattern" (a regex, no numbered backreferences) in place of "prefix".
+
+RAW_RULES_PATH = os.getenv('RAW_RULES_PATH')
+DEFAULT_TERMINATORS = "\"'"
+_SITE = re.compile(rb'https?://[^/"\'\s<>\\]*')  # scheme and host of an absolute URL
+LEGO_CDN_PREFIX = "https://ideascdn.lego.com/media/generate/lego_ci/"
+MECABRICKS_PREFIX = "https://www.mecabricks.com/"
+
+
+def legacy_to_webp(url):
+    # The /legacy renditions redirect to a webp one that is the file worth saving
+    return url[:-6] + "webp" if url.endswith("/legacy") else url
+
+
+def _load_function(spec):
+    # "package.module:function"
+    module, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+class Rule:
+    def __init__(self, name, prefix=None, pattern=None, terminators=DEFAULT_TERMINATORS, rewrite=None):
+        if (prefix is None) == (pattern is None):
+            raise ValueError(f"rule {name}: needs a prefix or a pattern")
+        if not terminators:
+            raise ValueError(f"rule {name}: needs terminators")
+        self.name = name
+        self.prefix = prefix
+        self.pattern = pattern
+        self.terminators = terminators
+        self.rewrite = rewrite
+        # The rest of the URL, up to a terminator; a URL left open at the end
+        # of the page doesn't match
+        ends = re.escape(terminators.encode())
+        self.tail = b'[^' + ends + b']*+(?=[' + ends + b'])'
+        self.tail_regex = re.compile(self.tail)
+        self.site = None
+        if prefix is not None:
+            site = _SITE.match(prefix.encode())
+            if site is None:
+                raise ValueError(f"rule {name}: a prefix starts with http:// or https://; use a pattern otherwise")
+            self.site = site.group()
+        else:
+            re.compile(pattern.encode() + self.tail)  # a bad pattern fails here, naming its rule
+
+
+BUILTIN_RULES = (
+    Rule('lego-ideas-cdn', prefix=LEGO_CDN_PREFIX, rewrite=legacy_to_webp),
+    Rule('mecabricks', prefix=MECABRICKS_PREFIX, terminators="\"'<> \t\r\n\\"),
+)
+
+
+def load_rules(path):
+    with open(path) as f:
+        specs = json.load(f)
+    rules = []
+    for spec in specs:
+        spec = dict(spec)
+        if spec.get('rewrite'):
+            spec['rewrite'] = _load_function(spec['rewrite'])
+        rules.append(Rule(**spec))
+    return rules
+
+
+class RuleSet:
+    def __init__(self, rules=()):
+        self.rules = []
+        self._compiled = None
+        self._lock = threading.Lock()
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule):
+        with self._lock:
+            if any(existing.name == rule.name for existing in self.rules):
+                raise ValueError(f"rule {rule.name} is already registered")
+            self.rules.append(rule)
+            self._compiled = None
+
+    def _compile(self):
+        with self._lock:
+            if self._compiled is None:
+                # Group _ruleN closes last in a match of pattern rule N, so lastgroup names the rule
+                branches = []
+                by_site = {}
+                for index, rule in enumerate(self.rules):
+                    if rule.prefix is None:
+                        branches.append(b'(?:' + rule.pattern.encode() + b')(?P<_rule' + str(index).encode() + b'>)'
+                                        + rule.tail)
+                    else:
+                        by_site.setdefault(rule.site, []).append((rule.prefix.encode(), rule))
+                for site_rules in by_site.values():
+                    # Longest prefix first, so the most specific rule wins
+                    site_rules.sort(key=lambda entry: -len(entry[0]))
+                self._compiled = re.compile(b'|'.join(branches)) if branches else None, by_site
+            return self._compiled
+
+    def _scan_site(self, content, site, site_rules, found, encoding):
+        start = content.find(site)
+        while start != -1:
+            end = start + 1
+            for prefix, rule in site_rules:
+                if content.startswith(prefix, start):
+                    tail = rule.tail_regex.match(content, start + len(prefix))
+                    if tail is not None:
+                        end = tail.end()
+                        url = content[start:end].decode(encoding, 'replace')
+                        found.add(rule.rewrite(url) if rule.rewrite else url)
+                        break
+            start = content.find(site, end)
+
+    def scan(self, content, encoding='utf-8'):
+        # Every URL the rules find. The sites on the page are collected in one
+        # pass and intersected with the rules' sites; only those present are
+        # searched for, so rules for other sites cost nothing.
+        patterns, by_site = self._compile()
+        found = set()
+        if by_site:
+            for site in by_site.keys() & set(_SITE.findall(content)):
+                self._scan_site(content, site, by_site[site], found, encoding)
+        if patterns is not None:
+            for match in patterns.finditer(content):
+                rule = self.rules[int(match.lastgroup[len('_rule'):])]
+                url = match.group().decode(encoding, 'replace')
+                found.add(rule.rewrite(url) if rule.rewrite else url)
+        return found
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_rules():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            rules = list(BUILTIN_RULES)
+            if RAW_RULES_PATH:
+                rules += load_rules(RAW_RULES_PATH)
+            _shared = RuleSet(rules)
+        return _shared
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from web_tool import http_client, metrics
+from web_tool.rate_limiter import THROTTLE_STATUSES, RetryPolicy, get_bucket
+
+SPN2_ENDPOINT = os.getenv('SPN2_ENDPOINT', 'https://web.archive.org/save')
+SUBMIT_TIMEOUT = 60
+MAX_RETRIES = 3
+MAX_JOBS = int(os.getenv('SPN2_MAX_JOBS') or 5)  # captures archive.org runs at once for one account
+POLL_INTERVAL = 5.0  # seconds before the first status check; doubles up to MAX_POLL_INTERVAL
+MAX_POLL_INTERVAL = 30.0
+JOB_TIMEOUT = 600  # a job still pending after this long is given up and requeued
+
+save_bucket = get_bucket('web.archive.org/save')
+status_bucket = get_bucket('web.archive.org/save/status', rate=2.0, burst=5, max_rate=10.0)
+retry_policy = RetryPolicy(max_attempts=MAX_RETRIES)
+
+
+class SaveFailed(Exception):
+    pass
+
+
+class SaveJobs:
+    # Save Page Now 2: a POST to /save starts a capture and answers at once
+    # with a job ID, and /save/status/<job_id> reports it as pending, success
+    # or error. Up to max_jobs workers each submit a URL and poll its job on
+    # one event loop; blocking HTTP calls run in worker threads. A URL only
+    # counts as saved once its job reports success, and every failure carries
+    # the reason, e.g. SPN2's status_ext ("error:not-found") or "timeout".
+
+    def __init__(self, max_jobs=MAX_JOBS, endpoint=SPN2_ENDPOINT, credentials=None, poll_interval=POLL_INTERVAL,
+                 job_timeout=JOB_TIMEOUT):
+        if credentials is None:
+            from web_tool.ia_upload import load_credentials
+            credentials = load_credentials()
+        self.max_jobs = max_jobs
+        self.endpoint = endpoint.rstrip('/')
+        self.credentials = credentials
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.peak_jobs = 0
+        self._jobs = 0
+
+    def _headers(self):
+        headers = {'Accept': 'application/json'}
+        if self.credentials:
+            headers['Authorization'] = f"LOW {self.credentials[0]}:{self.credentials[1]}"
+        return headers
+
+    async def _json(self, method, url, bucket, label, **kwargs):
+        async def send():
+            return await asyncio.to_thread(http_client.request, method, url, headers=self._headers(),
+                                           timeout=SUBMIT_TIMEOUT, **kwargs)
+
+        response = await retry_policy.call_async(send, bucket, label)
+        if response is None:
+            raise SaveFailed('no response')
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            raise SaveFailed(f"http {response.status_code}")
+        if response.status_code in THROTTLE_STATUSES or data.get('status') == 'error':
+            raise SaveFailed(data.get('status_ext') or data.get('message') or f"http {response.status_code}")
+        return data
+
+    async def save(self, url):
+        # Returns (saved, reason)
+        with metrics.stage('save', url):
+            try:
+                job = await self._json('POST', self.endpoint, save_bucket, f"Submitting {url}", data={'url': url})
+                job_id = job.get('job_id')
+                if not job_id:
+                    raise SaveFailed(job.get('message') or 'no job id')
+                deadline = time.monotonic() + self.job_timeout
+                interval = self.poll_interval
+                while True:
+                    await asyncio.sleep(interval)
+                    status = await self._json('GET', f"{self.endpoint}/status/{job_id}", status_bucket,
+                                              f"Polling {url}")
+                    if status.get('status') == 'success':
+                        metrics.inc('saved')
+                        return True, status.get('timestamp') or 'success'
+                    if time.monotonic() > deadline:
+                        raise SaveFailed('timeout')
+                    interval = min(MAX_POLL_INTERVAL, interval * 2)
+            except SaveFailed as e:
+                reason = str(e)
+            except Exception as e:
+                reason = f"{type(e).__name__}: {e}"
+        metrics.inc('save_failed', reason=reason.split(' ')[0])
+        return False, reason
+
+    async def save_many(self, urls, on_result=None):
+        # on_result(url, saved, seconds, reason) is called on the loop as each job ends
+        queue = asyncio.Queue()
+        for url in urls:
+            queue.put_nowait(url)
+        results = {}
+
+        async def worker():
+            while not queue.empty():
+                url = queue.get_nowait()
+                self._jobs += 1
+                self.peak_jobs = max(self.peak_jobs, self._jobs)
+                start = time.monotonic()
+                try:
+                    saved, reason = await self.save(url)
+                finally:
+                    self._jobs -= 1
+                results[url] = (saved, reason)
+                if on_result is not None:
+                    on_result(url, saved, time.monotonic() - start, reason)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.max_jobs, queue.qsize()))))
+        return results
+
+    def run(self, urls, on_result=None):
+        return asyncio.run(self.save_many(list(dict.fromkeys(urls)), on_result))
+
+    def __call__(self, url):
+        saved, reason = self.run([url])[url]
+        return saved
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Submit URLs to Save Page Now and wait for their captures")
+    parser.add_argument('batch_file', help="URLs to save, one per line")
+    parser.add_argument('processed_file', help="URLs with a confirmed capture are appended here")
+    parser.add_argument('--failed', metavar='FILE', help="append \"reason<TAB>url\" for each failed save")
+    parser.add_argument('--jobs', type=int, default=MAX_JOBS, help="captures in flight at once")
+    args = parser.parse_args(argv)
+
+    with open(args.batch_file) as f:
+        urls = [line.strip() for line in f if line.strip()]
+    saved = failed = 0
+    with open(args.processed_file, 'a') as processed, \
+            open(args.failed if args.failed else os.devnull, 'a') as failures:
+        def record(url, ok, seconds, reason):
+            nonlocal saved, failed
+            if ok:
+                processed.write(f"{url}\n")
+                processed.flush()
+                saved += 1
+                print(f"Successfully archived: {url} ({seconds:.0f}s)")
+            else:
+                failures.write(f"{reason}\t{url}\n")
+                failed += 1
+                print(f"Failed to archive {url}: {reason}")
+
+        jobs = SaveJobs(args.jobs)
+        jobs.run(urls, record)
+    print(f"Saved {saved}, failed {failed}; up to {jobs.peak_jobs} jobs in flight, "
+          f"{save_bucket.throttles} throttled submissions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,344 @@
+import argparse
+import contextlib
+import importlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from web_tool.scheduler import host_key
+
+# Pending saves ranked by how much is at risk if they wait. Every URL has a row
+# of signals (ever captured, when, observed liveness, whether its host has been
+# down, failed saves) and a score computed from them by a pluggable scorer,
+# indexed so a run takes its budget off the top in one indexed query. Signals
+# arrive in batches; only the rows they touch are rescored, so the queue is
+# never re-sorted as a whole. Stored scores are as of the row's last update:
+# `rescore` recomputes all of them after a scorer change.
+
+SAVE_QUEUE_PATH = os.getenv('SAVE_QUEUE_PATH', 'save_queue.sqlite')
+LOOKUP_BATCH = 500  # URLs per bulk query, under SQLite's variable limit
+
+NEVER_CAPTURED = 100.0  # checked and not in the Wayback Machine at all
+UNKNOWN_CAPTURE = 60.0  # not checked yet
+CAPTURE_AGE_WEIGHT = 40.0  # per year since the last capture, capped at one year's worth
+KIND_WEIGHTS = {'cdn-asset': 30.0, 'release-asset': 25.0, 'page': 10.0, 'homepage': 0.0}  # most ephemeral first
+FRAGILE_HOST = 20.0  # the host was down before and came back; it may not next time
+UNAVAILABLE = -500.0  # answers 404 or its host is down right now, so a save would be wasted
+FAILURE_PENALTY = 15.0  # per failed save
+PERMANENT_FAILURES = ('error:not-found', 'error:blocked', 'error:blocked-url', 'error:invalid-url-syntax',
+                      'error:invalid-host-resolution', 'error:filesize-limit')
+ASSET_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.mp4', '.webm', '.zip', '.pdf')
+
+SIGNALS = ('url', 'host', 'kind', 'captured', 'capture_time', 'live', 'host_state', 'failures', 'last_failure')
+
+
+def classify(url):
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    path = parts.path.lower()
+    if (host == 'github.com' and '/releases/download/' in path) or host.endswith('githubusercontent.com'):
+        return 'release-asset'
+    if path.endswith(ASSET_EXTENSIONS) or host.startswith('cdn') or 'cdn.' in host:
+        return 'cdn-asset'
+    if path in ('', '/') and not parts.query:
+        return 'homepage'
+    return 'page'
+
+
+def score_url(signals):
+    # The default scorer; higher is saved first
+    score = KIND_WEIGHTS.get(signals['kind'], 0.0)
+    if signals['captured'] is None:
+        score += UNKNOWN_CAPTURE
+    elif not signals['captured']:
+        score += NEVER_CAPTURED
+    elif signals['capture_age'] is not None:
+        score += CAPTURE_AGE_WEIGHT * min(1.0, signals['capture_age'] / (365 * 24 * 3600))
+    if signals['live'] == 0 or signals['host_state'] == 'down':
+        score += UNAVAILABLE
+    elif signals['host_state'] == 'flaky':
+        score += FRAGILE_HOST
+    if signals['last_failure'] and signals['last_failure'].startswith(PERMANENT_FAILURES):
+        score += UNAVAILABLE
+    return score - FAILURE_PENALTY * signals['failures']
+
+
+def load_scorer(spec):
+    # "package.module:function"
+    module, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+def _batches(items, size=LOOKUP_BATCH):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SaveQueue:
+    def __init__(self, path=SAVE_QUEUE_PATH, scorer=None, max_entries=None):
+        self.path = path
+        self.scorer = scorer or score_url
+        self.max_entries = max_entries
+        self.stats = Counter()
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS queue ("
+                          "url TEXT PRIMARY KEY, host TEXT NOT NULL, kind TEXT NOT NULL, "
+                          "captured INTEGER, capture_time REAL, live INTEGER, host_state TEXT, "
+                          "failures INTEGER NOT NULL DEFAULT 0, last_failure TEXT, "
+                          "score REAL NOT NULL, updated REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS queue_score ON queue (score DESC, url)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS queue_host ON queue (host)")
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def _score(self, row, now):
+        signals = dict(zip(SIGNALS, row))
+        capture_time = signals.pop('capture_time')
+        signals['capture_age'] = None if capture_time is None else now - capture_time
+        return self.scorer(signals)
+
+    def _new_row(self, url):
+        return (url, host_key(url), classify(url), None, None, None, None, 0, None)
+
+    def _rescore(self, conn, urls):
+        # Recomputes the score of just these rows
+        now = time.time()
+        updates = []
+        for batch in _batches(urls):
+            rows = conn.execute(f"SELECT {', '.join(SIGNALS)} FROM queue WHERE url IN ({','.join('?' * len(batch))})",
+                                batch).fetchall()
+            updates.extend((self._score(row, now), now, row[0]) for row in rows)
+        conn.executemany("UPDATE queue SET score = ?, updated = ? WHERE url = ?", updates)
+        self.stats['rescored'] += len(updates)
+
+    def add(self, urls):
+        # New URLs only; queued ones keep their signals
+        now = time.time()
+        rows = [self._new_row(url) for url in dict.fromkeys(url.strip() for url in urls) if url]
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(f"INSERT OR IGNORE INTO queue ({', '.join(SIGNALS)}, score, updated) "
+                             f"VALUES ({', '.join('?' * len(SIGNALS))}, ?, ?)",
+                             [row + (self._score(row, now), now) for row in rows])
+            added = conn.total_changes - before
+            if self.max_entries is not None and added:
+                # Full: the lowest-scoring URLs make room
+                count = conn.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+                if count > self.max_entries:
+                    conn.execute("DELETE FROM queue WHERE url IN ("
+                                 "SELECT url FROM queue ORDER BY score, url DESC LIMIT ?)", (count - self.max_entries,))
+                    self.stats['dropped'] += count - self.max_entries
+        self.stats['added'] += added
+        return added
+
+    def remove(self, urls):
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("DELETE FROM queue WHERE url = ?", ((url,) for url in urls))
+            removed = conn.total_changes - before
+        self.stats['removed'] += removed
+        return removed
+
+    def sync(self, urls):
+        # Makes the queue hold exactly `urls`, e.g. the URL list file it ranks
+        with self._transaction() as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS listed (url TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM listed")
+            conn.executemany("INSERT OR IGNORE INTO listed VALUES (?)", ((url,) for url in urls))
+            before = conn.total_changes
+            conn.execute("DELETE FROM queue WHERE url NOT IN (SELECT url FROM listed)")
+            removed = conn.total_changes - before
+            new = [row[0] for row in conn.execute("SELECT url FROM listed WHERE url NOT IN (SELECT url FROM queue)")]
+            conn.execute("DELETE FROM listed")
+        self.stats['removed'] += removed
+        return self.add(new), removed
+
+    def _update(self, statement, params):
+        # params: (value..., url) tuples; the statement skips rows it wouldn't
+        # change, so only rows whose signals changed are rescored
+        with self._transaction() as conn:
+            changed = [param[-1] for param in params if conn.execute(statement, param).rowcount]
+            self._rescore(conn, changed)
+
+    def record_captures(self, captured, capture_time=None):
+        # url -> True/False from an availability check
+        self._update("UPDATE queue SET captured = ?1, capture_time = COALESCE(?2, capture_time) WHERE url = ?3 "
+                     "AND (captured IS NOT ?1 OR capture_time IS NOT COALESCE(?2, capture_time))",
+                     ((int(bool(value)), capture_time if value else None, url)
+                      for url, value in captured.items() if value is not None))
+
+    def record_liveness(self, live):
+        self._update("UPDATE queue SET live = ?1 WHERE url = ?2 AND live IS NOT ?1",
+                     ((int(bool(value)), url) for url, value in live.items() if value is not None))
+
+    def record_failures(self, reasons):
+        # url -> reason of a failed save, e.g. SPN2's status_ext
+        self._update("UPDATE queue SET failures = failures + 1, last_failure = ? WHERE url = ?",
+                     ((reason, url) for url, reason in reasons.items()))
+        self.stats['failures recorded'] += len(reasons)
+
+    def refresh(self, wayback_cache=None, liveness_cache=None):
+        # Pulls signals for every queued URL out of the local caches
+        with self._lock:
+            urls = [row[0] for row in self.conn.execute("SELECT url FROM queue")]
+        if wayback_cache is not None:
+            self.record_captures(wayback_cache.get_many(urls))
+        if liveness_cache is not None:
+            self.record_liveness(liveness_cache.get_many(urls))
+            now = time.time()
+            changes = []
+            with self._lock:
+                hosts = self.conn.execute("SELECT DISTINCT host, host_state FROM queue").fetchall()
+            for host, current in hosts:
+                state = liveness_cache.host_state(host)
+                state = None if state is None else 'down' if state[1] > now else 'flaky'
+                if state != current:
+                    changes.append((state, host))
+            with self._transaction() as conn:
+                changed = []
+                for state, host in changes:
+                    changed += [row[0] for row in conn.execute("SELECT url FROM queue WHERE host = ?", (host,))]
+                conn.executemany("UPDATE queue SET host_state = ? WHERE host = ?", changes)
+                self._rescore(conn, changed)
+
+    def rescore(self):
+        with self._lock:
+            urls = [row[0] for row in self.conn.execute("SELECT url FROM queue")]
+        with self._transaction() as conn:
+            self._rescore(conn, urls)
+        return len(urls)
+
+    def take(self, count):
+        # The `count` highest-scoring URLs; they stay queued until removed or
+        # their failure is recorded
+        with self._lock:
+            urls = [row[0] for row in self.conn.execute(
+                "SELECT url FROM queue ORDER BY score DESC, url LIMIT ?", (count,))]
+        self.stats['taken'] += len(urls)
+        return urls
+
+    def scores(self, urls):
+        # Stored scores, plus what URLs not queued yet would start with
+        scores = {}
+        with self._lock:
+            for batch in _batches(urls):
+                scores.update(self.conn.execute(
+                    f"SELECT url, score FROM queue WHERE url IN ({','.join('?' * len(batch))})", batch).fetchall())
+        now = time.time()
+        for url in urls:
+            if url not in scores:
+                scores[url] = self._score(self._new_row(url), now)
+        return scores
+
+    def order(self, urls):
+        urls = list(urls)
+        scores = self.scores(urls)
+        return sorted(urls, key=lambda url: (-scores[url], url))
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+
+    def report(self):
+        stats = dict(self.stats)
+        print(f"Save queue: {len(self)} queued"
+              + "".join(f", {count} {name}" for name, count in sorted(stats.items()) if count))
+
+    def close(self):
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.close()
+
+
+def _read_args_or_stdin(urls):
+    if urls:
+        return urls
+    return [line.strip() for line in sys.stdin if line.strip()]
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Rank pending saves by how much is at risk")
+    parser.add_argument('--scorer', metavar='MODULE:FUNCTION', help="score function replacing the default")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, help_text in (('add', "queue URLs that aren't queued yet"), ('done', "drop saved URLs")):
+        sub = subparsers.add_parser(command, help=help_text)
+        sub.add_argument('queue')
+        sub.add_argument('urls', nargs='*', help="URLs (default: one per line on stdin)")
+    sync = subparsers.add_parser('sync', help="make the queue hold exactly the URLs in a list file")
+    sync.add_argument('queue')
+    sync.add_argument('file')
+    take = subparsers.add_parser('take', help="print the highest-scoring URLs")
+    take.add_argument('queue')
+    take.add_argument('count', type=int)
+    take.add_argument('--scores', action='store_true', help="print \"score<TAB>url\"")
+    failed = subparsers.add_parser('failed', help="record failed saves from \"reason<TAB>url\" lines on stdin")
+    failed.add_argument('queue')
+    refresh = subparsers.add_parser('refresh', help="update signals from the availability and liveness caches")
+    refresh.add_argument('queue')
+    refresh.add_argument('--wayback', metavar='PATH', help="availability cache")
+    refresh.add_argument('--liveness', metavar='PATH', help="liveness cache")
+    rescore = subparsers.add_parser('rescore', help="recompute every score, e.g. after changing the scorer")
+    rescore.add_argument('queue')
+
+    args = parser.parse_args(argv)
+    queue = SaveQueue(args.queue, load_scorer(args.scorer) if args.scorer else None)
+    try:
+        if args.command == 'add':
+            print(f"Queued {queue.add(_read_args_or_stdin(args.urls))} new URLs", file=sys.stderr)
+        elif args.command == 'done':
+            print(f"Dropped {queue.remove(_read_args_or_stdin(args.urls))} saved URLs", file=sys.stderr)
+        elif args.command == 'sync':
+            from web_tool.url_store import UrlStore
+            added, removed = queue.sync(UrlStore(args.file))
+            print(f"Queue now matches {args.file}: {added} added, {removed} dropped", file=sys.stderr)
+        elif args.command == 'take':
+            urls = queue.take(args.count)
+            scores = queue.scores(urls) if args.scores else {}
+            for url in urls:
+                sys.stdout.write(f"{scores[url]:.1f}\t{url}\n" if args.scores else f"{url}\n")
+        elif args.command == 'failed':
+            reasons = {}
+            for line in sys.stdin:
+                reason, _, url = line.rstrip('\n').rpartition('\t')
+                if url:
+                    reasons[url] = reason or 'unknown'
+            queue.record_failures(reasons)
+            print(f"Recorded {len(reasons)} failed saves", file=sys.stderr)
+        elif args.command == 'refresh':
+            wayback = liveness = None
+            if args.wayback and os.path.exists(args.wayback):
+                from web_tool.wayback_cache import AvailabilityCache
+                wayback = AvailabilityCache(args.wayback)
+            if args.liveness and os.path.exists(args.liveness):
+                from web_tool.liveness_cache import LivenessCache
+                liveness = LivenessCache(args.liveness)
+            try:
+                queue.refresh(wayback, liveness)
+            finally:
+                for cache in (wayback, liveness):
+                    if cache is not None:
+                        cache.close()
+        elif args.command == 'rescore':
+            print(f"Rescored {queue.rescore()} URLs", file=sys.stderr)
+        with contextlib.redirect_stdout(sys.stderr):
+            queue.report()
+    finally:
+        queue.close()
+    return 0
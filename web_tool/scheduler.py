@@ -0,0 +1,143 @@
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+MAX_IN_FLIGHT = 32  # global cap on concurrent outbound requests
+DEFAULT_HOST_LIMIT = 4  # arbitrary sites and CDNs
+HOST_LIMITS = {
+    'archive.org': 8,  # also covers web.archive.org
+    'api.github.com': 4,
+}
+MAX_QUEUED = 256  # submit() blocks beyond this, so producers can't run ahead
+
+
+def host_key(url_or_host):
+    if '//' in url_or_host:
+        url_or_host = urlsplit(url_or_host).netloc
+    return url_or_host.lower().rsplit('@', 1)[-1].split(':', 1)[0]
+
+
+class RequestScheduler:
+    # Tasks must not block on other tasks submitted to the same scheduler, or a
+    # full set of workers can deadlock waiting on work that never gets a slot.
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, host_limits=None, default_host_limit=DEFAULT_HOST_LIMIT,
+                 max_queued=MAX_QUEUED):
+        self.max_in_flight = max_in_flight
+        self.host_limits = dict(HOST_LIMITS if host_limits is None else host_limits)
+        self.default_host_limit = default_host_limit
+        self.max_queued = max_queued
+        self.completed = 0
+        self.peak_in_flight = 0
+        self._cond = threading.Condition()
+        self._queues = defaultdict(deque)
+        self._hosts = deque()  # hosts with queued work, in round-robin order
+        self._in_flight = defaultdict(int)
+        self._running = 0
+        self._queued = 0
+        self._shutdown = False
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(max_in_flight)]
+        for worker in self._workers:
+            worker.start()
+
+    def limit_for(self, host):
+        parts = host.split('.')
+        for i in range(len(parts)):
+            limit = self.host_limits.get('.'.join(parts[i:]))
+            if limit is not None:
+                return limit
+        return self.default_host_limit
+
+    def submit(self, url_or_host, fn, *args, **kwargs):
+        host = host_key(url_or_host)
+        future = Future()
+        with self._cond:
+            while self._queued >= self.max_queued and not self._shutdown:
+                self._cond.wait()
+            if self._shutdown:
+                raise RuntimeError("scheduler has been shut down")
+            if not self._queues[host]:
+                self._hosts.append(host)
+            self._queues[host].append((future, fn, args, kwargs))
+            self._queued += 1
+            self._cond.notify_all()
+        return future
+
+    def call(self, url_or_host, fn, *args, **kwargs):
+        return self.submit(url_or_host, fn, *args, **kwargs).result()
+
+    def map(self, fn, urls, host=None):
+        urls = list(urls)
+        futures = [self.submit(host or url, fn, url) for url in urls]
+        return [future.result() for future in futures]
+
+    def _next_task(self):
+        for _ in range(len(self._hosts)):
+            host = self._hosts[0]
+            self._hosts.rotate(-1)
+            if self._in_flight[host] < self.limit_for(host):
+                queue = self._queues[host]
+                task = queue.popleft()
+                if not queue:
+                    self._hosts.remove(host)
+                    del self._queues[host]
+                return host, task
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    next_task = self._next_task()
+                    if next_task is not None:
+                        break
+                    if self._shutdown and not self._queued:
+                        return
+                    self._cond.wait()
+                host, (future, fn, args, kwargs) = next_task
+                self._queued -= 1
+                self._in_flight[host] += 1
+                self._running += 1
+                self.peak_in_flight = max(self.peak_in_flight, self._running)
+                self._cond.notify_all()
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+
+            with self._cond:
+                self._in_flight[host] -= 1
+                if not self._in_flight[host]:
+                    del self._in_flight[host]
+                self._running -= 1
+                self.completed += 1
+                self._cond.notify_all()
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def report(self):
+        print(f"Scheduler: {self.completed} requests, peak {self.peak_in_flight} in flight "
+              f"(cap {self.max_in_flight})")
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RequestScheduler()
+        return _shared
@@ -0,0 +1,123 @@
+import argparse
+import concurrent.futures
+
+from web_tool import extract, http_client, metrics
+from web_tool.availability import check_availability
+from web_tool.canonicalize import get_canonicalizer
+from web_tool.github_enrich import GitHubEnricher
+from web_tool.liveness import LivenessChecker
+from web_tool.liveness_cache import LivenessCache
+from web_tool.parse_pool import get_parse_pool
+from web_tool.scheduler import get_scheduler
+from web_tool.url_store import UrlStore
+from web_tool.url_stream import reservoir_sample
+from web_tool.wayback_cache import AvailabilityCache
+
+URLS_TO_PROCESS = 3000
+MAX_WORKERS = 20  # source pages processed at once; requests are capped by the scheduler
+
+
+class Scraper:
+    def __init__(self, liveness=False, cache=None, github=None, scheduler=None):
+        self.cache = cache or AvailabilityCache()
+        self.github = github or GitHubEnricher()
+        self.scheduler = scheduler or get_scheduler()
+        self.liveness_checker = LivenessChecker(LivenessCache(), self.scheduler) if liveness else None
+        # Errors are counted by stage and exception class in the metrics registry
+        metrics.enable()
+
+    def process_url(self, url):
+        all_urls = extract.fetch_urls(url, self.github, self.scheduler)
+        source = get_canonicalizer().canonicalize_set([url])
+        all_urls |= source
+        print(f"Found {len(all_urls)} URLs in {url}")
+
+        # Cheapest stage first: URLs already known dead (cached 404s, hosts that
+        # don't resolve or keep timing out) are dropped before any request,
+        # and only unarchived URLs go on to a HEAD
+        if self.liveness_checker:
+            all_urls -= self.liveness_checker.known_dead(all_urls)
+        # Failed lookups are counted by the 'availability' and 'cdx' stages
+        archived = check_availability(all_urls, self.cache, self.scheduler)
+        # URLs whose status couldn't be checked are kept; saving them again is harmless
+        unarchived = [url for url in all_urls if not archived.get(url)]
+        if self.liveness_checker:
+            live = self.liveness_checker.check(unarchived)
+            unarchived = [url for url in unarchived if live[url]]
+        else:
+            # Like the old scraper.py, the source page itself is always queued
+            # for a fresh snapshot, archived or not
+            unarchived.extend(source - set(unarchived))
+        return unarchived
+
+    def run(self, source_path='source_urls.txt', output_path='output_urls.txt', limit=URLS_TO_PROCESS,
+            workers=MAX_WORKERS):
+        # Both stores journal every change durably, so each finished source is
+        # committed as it completes. After a crash the journals are replayed on
+        # open: finished sources are no longer in source_store and their URLs are
+        # already in output_store, so a rerun picks up with the rest.
+        output_store = UrlStore(output_path)
+        source_store = UrlStore(source_path)
+        if source_store.pending() or output_store.pending():
+            print(f"Resuming: replaying {source_store.pending()} source and {output_store.pending()} output "
+                  f"journal entries from an interrupted run")
+        # One pass over the list, holding only the sample
+        source_urls_to_process = reservoir_sample(source_store, limit)
+
+        processed = added = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.process_url, url): url for url in source_urls_to_process}
+            for future in concurrent.futures.as_completed(futures):
+                source_url = futures[future]
+                try:
+                    urls = future.result()
+                except Exception as e:
+                    metrics.error('scrape', e, source_url)
+                    continue
+                added += output_store.add(sorted(urls))
+                source_store.remove([source_url])
+                processed += 1
+        print(f"Journaled {added} unarchived URLs for {output_path}")
+        # Repos skipped for lack of API budget come back as sources on a later run
+        source_store.add(self.github.deferred_repo_urls())
+
+        # Each compaction is an atomic rename; if the run dies between the two,
+        # the remaining journal is replayed next time
+        output_store.compact()
+        source_store.compact()
+        return processed, added
+
+    def report(self):
+        get_canonicalizer().report()
+        self.cache.report()
+        if self.liveness_checker:
+            self.liveness_checker.report()
+        self.scheduler.report()
+        http_client.report()
+        get_parse_pool().report()
+        self.github.report()
+        metrics.report()
+
+    def close(self):
+        self.cache.close()
+        get_parse_pool().close()
+        if self.liveness_checker:
+            self.liveness_checker.cache.close()
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Collect unarchived URLs from a sample of source pages")
+    parser.add_argument('--sources', default='source_urls.txt')
+    parser.add_argument('--output', default='output_urls.txt')
+    parser.add_argument('--limit', type=int, default=URLS_TO_PROCESS, help="source pages to sample")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    parser.add_argument('--check-liveness', action='store_true', help="drop URLs that answer 404")
+    args = parser.parse_args(argv)
+
+    scraper = Scraper(liveness=args.check_liveness)
+    try:
+        scraper.run(args.sources, args.output, args.limit, args.workers)
+    finally:
+        scraper.report()
+        scraper.close()
+    return 0
@@ -0,0 +1,379 @@
+import argparse
+import bisect
+import hashlib
+import json
+import math
+import os
+import shlex
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from multiprocessing import Pool
+
+from web_tool.canonicalize import get_canonicalizer
+from web_tool.scheduler import host_key
+
+# Splits a URL list across matrix jobs by host: hosts are placed on a consistent
+# hash ring, weighted by how long their URLs took in earlier runs, and a shard
+# that is already full passes the host on to the next shard clockwise (bounded
+# loads). Each shard appends "status<TAB>seconds<TAB>url" lines to a checkpoint
+# as it goes, so a retried job skips what's done and merge() can fold results
+# and timings back in. The status is "ok" or "failed", optionally followed by
+# ":reason".
+
+SHARD_COUNT = 20
+VIRTUAL_NODES = 64  # ring points per shard
+LOAD_FACTOR = 1.15  # no shard gets more than this times the mean estimated cost
+DEFAULT_COST = 1.0  # seconds per URL for hosts without history
+MIN_COST = 0.01  # keeps instant (e.g. dry-run) hosts from weighing nothing
+COSTS_PATH = 'shard_costs.json'
+COST_SMOOTHING = 0.3  # weight of the newest run in the per-host moving average
+MAX_COST_HOSTS = 20000
+FSYNC_EVERY = 20
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8', 'surrogateescape'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    def __init__(self, shards, virtual_nodes=VIRTUAL_NODES):
+        self.shards = shards
+        points = sorted((_hash(f"shard-{shard}-{v}"), shard) for shard in range(shards) for v in range(virtual_nodes))
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def walk(self, key):
+        # Shards in ring order starting from the key's position, each once
+        start = bisect.bisect(self._points, _hash(key))
+        seen = set()
+        for i in range(len(self._points)):
+            shard = self._owners[(start + i) % len(self._points)]
+            if shard not in seen:
+                seen.add(shard)
+                yield shard
+                if len(seen) == self.shards:
+                    return
+
+
+def load_costs(path=COSTS_PATH):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_costs(costs, path=COSTS_PATH):
+    # Keep the most expensive hosts if the table grows too large
+    if len(costs) > MAX_COST_HOSTS:
+        costs = dict(sorted(costs.items(), key=lambda item: -item[1])[:MAX_COST_HOSTS])
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(sorted(costs.items())), f, indent=0)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def partition(urls, shards=SHARD_COUNT, costs=None, load_factor=LOAD_FACTOR):
+    costs = costs or {}
+    by_host = defaultdict(list)
+    for url in urls:
+        by_host[host_key(url)].append(url)
+
+    total = sum(len(members) * costs.get(host, DEFAULT_COST) for host, members in by_host.items())
+    capacity = load_factor * total / shards if total else 0.0
+
+    # A host heavier than one shard's capacity is cut into slices, each placed
+    # on its own; anything lighter stays on a single shard.
+    units = []
+    for host, members in by_host.items():
+        cost = costs.get(host, DEFAULT_COST)
+        slices = max(1, math.ceil(len(members) * cost / capacity)) if capacity else 1
+        size = math.ceil(len(members) / slices)
+        for i in range(slices):
+            part = members[i * size:(i + 1) * size]
+            if part:
+                units.append((len(part) * cost, host if slices == 1 else f"{host}#{i}", part))
+    units.sort(key=lambda unit: (-unit[0], unit[1]))
+
+    ring = HashRing(shards)
+    assigned = [[] for _ in range(shards)]
+    loads = [0.0] * shards
+    for weight, key, part in units:
+        target = None
+        for shard in ring.walk(key):
+            if loads[shard] + weight <= capacity:
+                target = shard
+                break
+        if target is None:
+            target = min(range(shards), key=lambda shard: loads[shard])
+        assigned[target].extend(part)
+        loads[target] += weight
+    return assigned, loads
+
+
+def shard_path(directory, prefix, index, start=1):
+    return os.path.join(directory, f"{prefix}{index + start:02d}")
+
+
+def write_shards(assigned, directory, prefix='batch_', start=1):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index, urls in enumerate(assigned):
+        path = shard_path(directory, prefix, index, start)
+        with open(path, 'w', encoding='utf-8', errors='surrogateescape') as f:
+            f.writelines(f"{url}\n" for url in urls)
+        paths.append(path)
+    return paths
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+        for line in f:
+            # A torn last line from a killed job has no newline and is simply redone
+            if not line.endswith('\n'):
+                continue
+            fields = line[:-1].split('\t', 2)
+            if len(fields) == 3 and fields[0].partition(':')[0] in ('ok', 'failed'):
+                try:
+                    yield fields[0], float(fields[1]), fields[2]
+                except ValueError:
+                    continue
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+        self.done = {url: status for status, _, url in read_checkpoint(path)}
+        self._file = None
+        self._unsynced = 0
+
+    def record(self, url, ok, elapsed, reason=None):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if os.path.exists(self.path):
+                # Drop a torn last record so new ones start on a fresh line
+                with open(self.path, 'rb+') as f:
+                    data = f.read()
+                    if data and not data.endswith(b'\n'):
+                        f.truncate(data.rfind(b'\n') + 1)
+            self._file = open(self.path, 'a', encoding='utf-8', errors='surrogateescape')
+        status = 'ok' if ok else 'failed'
+        if reason and not ok:
+            status += ':' + ' '.join(reason.split())
+        self._file.write(f"{status}\t{elapsed:.3f}\t{url}\n")
+        self._file.flush()
+        self.done[url] = status
+        self._unsynced += 1
+        if self._unsynced >= FSYNC_EVERY:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+
+def make_action(name, command=None):
+    if name == 'save':
+        # Submits capture jobs and only reports URLs whose capture succeeded
+        from web_tool.save_page_now import SaveJobs
+        return SaveJobs()
+    if name == 'exec':
+        argv = shlex.split(command)
+        return lambda url: subprocess.run(argv + [url], stdout=subprocess.DEVNULL,
+                                          stderr=subprocess.DEVNULL).returncode == 0
+    if name == 'dry-run':
+        return lambda url: True
+    raise ValueError(f"unknown action: {name}")
+
+
+def run_shard(path, checkpoint_path, action, retry_failed=False):
+    checkpoint = Checkpoint(checkpoint_path)
+    with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+        urls = [line.strip() for line in f if line.strip()]
+    skip = {url for url, status in checkpoint.done.items() if status == 'ok' or not retry_failed}
+    todo = [url for url in urls if url not in skip]
+    print(f"{path}: {len(urls) - len(todo)} of {len(urls)} URLs already done, {len(todo)} to go")
+    saved = failed = 0
+
+    def record(url, ok, elapsed, reason=None):
+        nonlocal saved, failed
+        checkpoint.record(url, ok, elapsed, reason)
+        if ok:
+            saved += 1
+        else:
+            failed += 1
+
+    try:
+        if hasattr(action, 'run'):
+            # A job engine (SaveJobs) keeps many URLs in flight and reports each as it ends
+            action.run(todo, record)
+        else:
+            for url in todo:
+                start = time.monotonic()
+                try:
+                    ok = bool(action(url))
+                except Exception as e:
+                    print(f"Error processing {url}: {e}")
+                    ok = False
+                record(url, ok, time.monotonic() - start)
+    finally:
+        checkpoint.close()
+    print(f"{path}: {saved} succeeded, {failed} failed this run")
+    return saved, failed
+
+
+def merge(checkpoint_paths, list_path=None, costs_path=None, queue=None):
+    succeeded = set()
+    failed = {}  # url -> reason of its last failure
+    timings = defaultdict(list)
+    for path in checkpoint_paths:
+        for status, elapsed, url in read_checkpoint(path):
+            if status == 'ok':
+                succeeded.add(url)
+                failed.pop(url, None)
+            elif url not in succeeded:
+                failed[url] = status.partition(':')[2] or 'unknown'
+            timings[host_key(url)].append(elapsed)
+    # Failed URLs stay in the list and are tried again next run
+    for reason, count in Counter(failed.values()).most_common():
+        print(f"  {count} failed: {reason}")
+
+    if list_path:
+        # Shards hold canonical URLs, so the list is canonicalized as it is
+        # rewritten; otherwise variants of a saved URL would stay behind
+        from web_tool.url_store import UrlStore
+        from web_tool.url_stream import sorted_unique, subtract
+        store = UrlStore(list_path)
+        canonical = sorted_unique(get_canonicalizer().canonicalize_stream(store))
+        store.replace(subtract(canonical, sorted(succeeded)), presorted=True)
+    if queue is not None:
+        # Failed saves lower a URL's priority; saved ones leave the queue
+        queue.record_failures(failed)
+        queue.remove(succeeded)
+        if list_path:
+            queue.sync(UrlStore(list_path))
+    if costs_path:
+        costs = load_costs(costs_path)
+        for host, values in timings.items():
+            observed = max(MIN_COST, sum(values) / len(values))
+            previous = costs.get(host)
+            costs[host] = observed if previous is None else (
+                COST_SMOOTHING * observed + (1 - COST_SMOOTHING) * previous)
+        save_costs(costs, costs_path)
+    return len(succeeded), len(failed)
+
+
+def _run_local_shard(job):
+    path, checkpoint_path, action_name, command = job
+    return run_shard(path, checkpoint_path, make_action(action_name, command))
+
+
+def run_local(input_path, workdir, shards, processes, action_name, command=None, costs_path=None):
+    from web_tool.url_store import UrlStore
+    urls = get_canonicalizer().canonicalize_many(UrlStore(input_path), unique=True)
+    assigned, loads = partition(urls, shards, load_costs(costs_path))
+    paths = write_shards(assigned, os.path.join(workdir, 'splits'))
+    checkpoints = [os.path.join(workdir, 'checkpoints', os.path.basename(path) + '.ckpt') for path in paths]
+    with Pool(processes) as pool:
+        pool.map(_run_local_shard, [(path, checkpoint, action_name, command)
+                                    for path, checkpoint in zip(paths, checkpoints)])
+    return merge(checkpoints, input_path, costs_path)
+
+
+def _print_plan(assigned, loads):
+    for index, (urls, load) in enumerate(zip(assigned, loads)):
+        hosts = len({host_key(url) for url in urls})
+        print(f"shard {index:>3}: {len(urls):>7} URLs, {hosts:>5} hosts, est. {load:10.1f}s")
+    if loads and max(loads):
+        mean = sum(loads) / len(loads)
+        print(f"Largest shard is {max(loads) / mean:.2f}x the mean estimated cost")
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Host-aware sharding with checkpoint/resume")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    split = subparsers.add_parser('split', help="partition a URL list into shard files")
+    split.add_argument('input')
+    split.add_argument('--shards', type=int, default=SHARD_COUNT)
+    split.add_argument('--out-dir', default='splits')
+    split.add_argument('--prefix', default='batch_')
+    split.add_argument('--start', type=int, default=1, help="number of the first shard file")
+    split.add_argument('--costs', default=COSTS_PATH, help="per-host seconds per URL from earlier runs")
+    split.add_argument('--queue', metavar='PATH', help="save queue whose scores order each shard, highest first")
+
+    run = subparsers.add_parser('run', help="process one shard, resuming from its checkpoint")
+    run.add_argument('shard')
+    run.add_argument('checkpoint')
+    run.add_argument('--action', choices=('save', 'exec', 'dry-run'), default='save')
+    run.add_argument('--exec', dest='exec_command', help="command run as `<command> <url>` for --action exec")
+    run.add_argument('--retry-failed', action='store_true', help="retry URLs the checkpoint marks as failed")
+
+    merge_parser = subparsers.add_parser('merge', help="fold shard checkpoints into the URL list and cost table")
+    merge_parser.add_argument('checkpoints', nargs='*')
+    merge_parser.add_argument('--list', help="URL list file to remove succeeded URLs from")
+    merge_parser.add_argument('--costs', default=COSTS_PATH)
+    merge_parser.add_argument('--queue', metavar='PATH', help="save queue to record failures in and drop saved URLs from")
+
+    local = subparsers.add_parser('local', help="split, run every shard in its own process, then merge")
+    local.add_argument('input')
+    local.add_argument('--workdir', default='shard_work')
+    local.add_argument('--shards', type=int, default=4)
+    local.add_argument('--processes', type=int, default=4)
+    local.add_argument('--action', choices=('save', 'exec', 'dry-run'), default='dry-run')
+    local.add_argument('--exec', dest='exec_command')
+    local.add_argument('--costs', default=None)
+
+    args = parser.parse_args(argv)
+    if args.command == 'split':
+        from web_tool.url_store import UrlStore
+        canonicalizer = get_canonicalizer()
+        urls = canonicalizer.canonicalize_many(UrlStore(args.input), unique=True)
+        assigned, loads = partition(urls, args.shards, load_costs(args.costs))
+        if args.queue:
+            # A job that runs out of time has then spent it on the most at-risk URLs
+            from web_tool.save_queue import SaveQueue
+            queue = SaveQueue(args.queue)
+            try:
+                assigned = [queue.order(shard) for shard in assigned]
+            finally:
+                queue.close()
+        write_shards(assigned, args.out_dir, args.prefix, args.start)
+        _print_plan(assigned, loads)
+        canonicalizer.report()
+    elif args.command == 'run':
+        if args.action == 'exec' and not args.exec_command:
+            parser.error("--action exec needs --exec")
+        run_shard(args.shard, args.checkpoint, make_action(args.action, args.exec_command), args.retry_failed)
+    elif args.command == 'merge':
+        queue = None
+        if args.queue:
+            from web_tool.save_queue import SaveQueue
+            queue = SaveQueue(args.queue)
+        try:
+            succeeded, failed = merge(args.checkpoints, args.list, args.costs, queue)
+        finally:
+            if queue is not None:
+                queue.report()
+                queue.close()
+        print(f"Merged {len(args.checkpoints)} checkpoints: {succeeded} succeeded, {failed} failed")
+    elif args.command == 'local':
+        if args.action == 'exec' and not args.exec_command:
+            parser.error("--action exec needs --exec")
+        succeeded, failed = run_local(args.input, args.workdir, args.shards, args.processes, args.action,
+                                      args.exec_command, args.costs)
+        print(f"Local run: {succeeded} succeeded, {failed} failed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
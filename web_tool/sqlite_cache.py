@@ -0,0 +1,97 @@
+import sqlite3
+import threading
+import time
+
+EVICT_EVERY = 1000  # puts between size checks
+LOOKUP_BATCH = 500  # keys per bulk query, under SQLite's variable limit
+
+# Base of the on-disk caches: a table of (key, value, checked, expires) rows in
+# a WAL-mode SQLite file, with one connection per thread since connections
+# can't be shared between threads. Expired rows are deleted and the table is
+# capped at max_entries, oldest first, every EVICT_EVERY puts.
+
+
+class SqliteCache:
+    table = None
+    key = None
+    value = None
+    schema = ()  # further CREATE statements for subclasses' own tables
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connect()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                         f"{self.key} TEXT PRIMARY KEY, {self.value} INTEGER NOT NULL, "
+                         "checked REAL NOT NULL, expires REAL NOT NULL)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_checked ON {self.table} (checked)")
+            for statement in self.schema:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key):
+        row = self._connect().execute(
+            f"SELECT {self.value} FROM {self.table} WHERE {self.key} = ? AND expires > ?",
+            (key, time.time())).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row[0]
+
+    def _get_many(self, keys):
+        # Bulk form of _get for batch jobs; not counted as hits or misses
+        keys = list(keys)
+        conn = self._connect()
+        now = time.time()
+        found = {}
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[start:start + LOOKUP_BATCH]
+            found.update(conn.execute(
+                f"SELECT {self.key}, {self.value} FROM {self.table} "
+                f"WHERE expires > ? AND {self.key} IN ({','.join('?' * len(batch))})", [now] + batch).fetchall())
+        return found
+
+    def _put(self, key, value, ttl):
+        now = time.time()
+        self._connect().execute(
+            f"INSERT OR REPLACE INTO {self.table} ({self.key}, {self.value}, checked, expires) VALUES (?, ?, ?, ?)",
+            (key, value, now, now + ttl))
+        with self._lock:
+            self._puts += 1
+            evict = self._puts % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        conn = self._connect()
+        conn.execute(f"DELETE FROM {self.table} WHERE expires <= ?", (time.time(),))
+        count = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(f"DELETE FROM {self.table} WHERE {self.key} IN ("
+                         f"SELECT {self.key} FROM {self.table} ORDER BY checked LIMIT ?)",
+                         (count - self.max_entries,))
+
+    def close(self):
+        # Fold the WAL back into the main file so the cached artifact is self-contained
+        self._connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._local.conn.close()
+        self._local.conn = None
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,302 @@
+import argparse
+import array
+import hashlib
+import heapq
+import mmap
+import os
+import shutil
+import struct
+import sys
+
+from web_tool.url_stream import open_list, sorted_unique
+
+# On-disk layout of a .urlset file:
+#   header   MAGIC, bloom hash count, url count, bloom size, data size
+#   offsets  count + 1 little-endian uint64 offsets into the data block
+#   bloom    optional Bloom filter bits (bloom size bytes, 0 when disabled)
+#   data     the sorted, de-duplicated URLs concatenated without separators
+# Membership is a binary search over the memory-mapped offsets. URLs added with
+# add-batch go to an append-only "<set>.log" until the next compact.
+
+MAGIC = b'URLSET1\n'
+HEADER = struct.Struct('<8sIQQQ')
+BLOOM_BITS_PER_URL = 10
+BLOOM_HASHES = 7
+CONFLICT_MARKERS = (b'<<<<<<<', b'=======', b'>>>>>>>')
+OFFSET_BATCH = 65536  # offsets buffered before they are spilled to disk
+
+
+def _bloom_positions(url, bits, hashes):
+    digest = hashlib.blake2b(url, digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+def _as_bytes(url):
+    return url if isinstance(url, bytes) else url.encode('utf-8')
+
+
+def read_text_urls(path):
+    with open_list(path, 'rb') as f:
+        for line in f:
+            url = line.strip()
+            if url and not url.startswith(CONFLICT_MARKERS):
+                yield url
+
+
+def _read_offsets(f):
+    while True:
+        batch = array.array('Q')
+        batch.frombytes(f.read(8 * OFFSET_BATCH))
+        if not batch:
+            return
+        yield from batch
+
+
+def write_urlset(path, urls, bloom=True):
+    # `urls` must be sorted; duplicates are dropped here. Data and offsets are
+    # spilled to temporary files as they come, so only the Bloom filter is
+    # held in memory.
+    tmp_data = path + '.data.tmp'
+    tmp_offsets = path + '.offsets.tmp'
+    offset = 0
+    count = 0
+    previous = None
+    offsets = array.array('Q', [0])
+    with open(tmp_data, 'wb') as data, open(tmp_offsets, 'wb') as offsets_file:
+        for url in urls:
+            url = _as_bytes(url)
+            if url == previous:
+                continue
+            data.write(url)
+            offset += len(url)
+            offsets.append(offset)
+            if len(offsets) >= OFFSET_BATCH:
+                offsets.tofile(offsets_file)
+                offsets = array.array('Q')
+            previous = url
+            count += 1
+        offsets.tofile(offsets_file)
+
+    bloom_bytes = b''
+    if bloom and count:
+        bits = (count * BLOOM_BITS_PER_URL + 63) // 64 * 64
+        filt = bytearray((bits + 7) // 8)
+        with open(tmp_data, 'rb') as data, open(tmp_offsets, 'rb') as offsets_file:
+            ends = _read_offsets(offsets_file)
+            start = next(ends)
+            for end in ends:
+                for pos in _bloom_positions(data.read(end - start), bits, BLOOM_HASHES):
+                    filt[pos >> 3] |= 1 << (pos & 7)
+                start = end
+        bloom_bytes = bytes(filt)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, BLOOM_HASHES if bloom_bytes else 0, count, len(bloom_bytes), offset))
+        with open(tmp_offsets, 'rb') as offsets_file:
+            shutil.copyfileobj(offsets_file, out, 1 << 20)
+        out.write(bloom_bytes)
+        with open(tmp_data, 'rb') as data:
+            shutil.copyfileobj(data, out, 1 << 20)
+        out.flush()
+        os.fsync(out.fileno())
+    os.remove(tmp_data)
+    os.remove(tmp_offsets)
+    os.replace(tmp_path, path)
+    return count
+
+
+class UrlSet:
+    def __init__(self, path):
+        self.path = path
+        self.log_path = path + '.log'
+        self._load()
+
+    def _load(self):
+        path = self.path
+        self.count = 0
+        self._mmap = None
+        self._bloom = None
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER.size:
+            with open(path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self._hashes, self.count, bloom_size, _ = HEADER.unpack_from(self._mmap)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a url set")
+            offsets_end = HEADER.size + 8 * (self.count + 1)
+            self._view = memoryview(self._mmap)
+            self._offsets = self._view[HEADER.size:offsets_end].cast('Q')
+            if bloom_size:
+                self._bloom = self._view[offsets_end:offsets_end + bloom_size]
+                self._bloom_bits = bloom_size * 8
+            self._data_start = offsets_end + bloom_size
+        self._pending = set()
+        if os.path.exists(self.log_path):
+            self._pending.update(read_text_urls(self.log_path))
+
+    def __len__(self):
+        return self.count + len(self._pending)
+
+    def _url_at(self, i):
+        start = self._data_start
+        return self._mmap[start + self._offsets[i]:start + self._offsets[i + 1]]
+
+    def _in_base(self, url):
+        if not self.count:
+            return False
+        if self._bloom is not None:
+            for pos in _bloom_positions(url, self._bloom_bits, self._hashes):
+                if not self._bloom[pos >> 3] & (1 << (pos & 7)):
+                    return False
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._url_at(mid) < url:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < self.count and self._url_at(lo) == url
+
+    def __contains__(self, url):
+        url = _as_bytes(url)
+        return url in self._pending or self._in_base(url)
+
+    def __iter__(self):
+        base = (self._url_at(i) for i in range(self.count))
+        previous = None
+        for url in heapq.merge(base, sorted(self._pending)):
+            if url != previous:
+                yield url
+            previous = url
+
+    def add_batch(self, urls):
+        new_urls = []
+        for url in urls:
+            url = _as_bytes(url).strip()
+            if url and url not in self:
+                self._pending.add(url)
+                new_urls.append(url)
+        if new_urls:
+            with open(self.log_path, 'ab') as log:
+                log.write(b''.join(url + b'\n' for url in new_urls))
+                log.flush()
+                os.fsync(log.fileno())
+        return len(new_urls)
+
+    def compact(self, bloom=True):
+        count = write_urlset(self.path + '.compact', iter(self), bloom)
+        self.close()
+        os.replace(self.path + '.compact', self.path)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._load()
+        return count
+
+    def close(self):
+        if self._mmap is not None:
+            self._offsets.release()
+            if self._bloom is not None:
+                self._bloom.release()
+                self._bloom = None
+            self._view.release()
+            self._mmap.close()
+            self._mmap = None
+
+
+def _iter_source(path):
+    with open(path, 'rb') as f:
+        is_urlset = f.read(len(MAGIC)) == MAGIC
+    if is_urlset:
+        return iter(UrlSet(path))
+    return sorted_unique(read_text_urls(path))
+
+
+def merge(output, inputs, bloom=True):
+    previous = None
+
+    def unique(urls):
+        nonlocal previous
+        for url in urls:
+            if url != previous:
+                previous = url
+                yield url
+
+    return write_urlset(output, unique(heapq.merge(*(_iter_source(path) for path in inputs))), bloom)
+
+
+def import_text(path, text_path, bloom=True):
+    return write_urlset(path, sorted_unique(read_text_urls(text_path)), bloom)
+
+
+def _read_args_or_stdin(urls):
+    if urls:
+        return [_as_bytes(url).strip() for url in urls]
+    return [line.strip() for line in sys.stdin.buffer if line.strip()]
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Compact sorted URL sets with O(log n) membership")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    contains = subparsers.add_parser('contains', help="print URLs that are in the set (exit 1 if any is not)")
+    contains.add_argument('set')
+    contains.add_argument('urls', nargs='*', help="URLs to check (default: one per line on stdin)")
+    contains.add_argument('--missing', action='store_true', help="print the URLs that are NOT in the set instead")
+
+    add_batch = subparsers.add_parser('add-batch', help="add URLs to the set's append log")
+    add_batch.add_argument('set')
+    add_batch.add_argument('urls', nargs='*', help="URLs to add (default: one per line on stdin)")
+
+    merge_parser = subparsers.add_parser('merge', help="merge url sets and/or text files into a new set")
+    merge_parser.add_argument('output')
+    merge_parser.add_argument('inputs', nargs='+')
+    merge_parser.add_argument('--no-bloom', action='store_true')
+
+    compact = subparsers.add_parser('compact', help="fold the append log into the sorted set")
+    compact.add_argument('set')
+    compact.add_argument('--no-bloom', action='store_true')
+
+    import_parser = subparsers.add_parser('import', help="build a set from a text file, dropping conflict markers")
+    import_parser.add_argument('set')
+    import_parser.add_argument('text_file')
+    import_parser.add_argument('--no-bloom', action='store_true')
+
+    export = subparsers.add_parser('export', help="write the set as sorted text to stdout")
+    export.add_argument('set')
+
+    args = parser.parse_args(argv)
+    out = sys.stdout.buffer
+
+    if args.command == 'contains':
+        url_set = UrlSet(args.set)
+        all_present = True
+        for url in _read_args_or_stdin(args.urls):
+            present = url in url_set
+            all_present = all_present and present
+            if present != args.missing:
+                out.write(url + b'\n')
+        out.flush()
+        return 0 if all_present else 1
+    if args.command == 'add-batch':
+        added = UrlSet(args.set).add_batch(_read_args_or_stdin(args.urls))
+        print(f"Added {added} new URLs to {args.set}", file=sys.stderr)
+    elif args.command == 'merge':
+        count = merge(args.output, args.inputs, not args.no_bloom)
+        print(f"Wrote {count} URLs to {args.output}", file=sys.stderr)
+    elif args.command == 'compact':
+        count = UrlSet(args.set).compact(not args.no_bloom)
+        print(f"Compacted {args.set} to {count} URLs", file=sys.stderr)
+    elif args.command == 'import':
+        count = import_text(args.set, args.text_file, not args.no_bloom)
+        print(f"Imported {count} URLs from {args.text_file} into {args.set}", file=sys.stderr)
+    elif args.command == 'export':
+        for url in UrlSet(args.set):
+            out.write(url + b'\n')
+        out.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
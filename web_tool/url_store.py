@@ -0,0 +1,199 @@
+import argparse
+import heapq
+import os
+import sys
+import threading
+
+from web_tool.url_stream import open_list, read_urls, sorted_unique
+
+# A plain sorted text file (the snapshot the workflows read and commit) plus an
+# append-only "<file>.journal" of "+url" / "-url" records. Adds and removals
+# only touch the journal; compact() streams snapshot and journal into a new
+# snapshot and swaps it in with an atomic rename. The journal is first renamed
+# to "<file>.journal.compacting", so records added while the new snapshot is
+# being written go to a fresh journal and survive the swap. Replaying a record
+# that is already in the snapshot changes nothing, so a crash at any point
+# loses no records. A snapshot named *.gz is read and written gzip-compressed;
+# the journal is always plain text.
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _is_sorted(path):
+    previous = ''
+    for line in read_urls(path):
+        if line < previous:
+            return False
+        previous = line
+    return True
+
+
+class UrlStore:
+    def __init__(self, path, sync=True):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.rotated_path = self.journal_path + '.compacting'
+        self.sync = sync
+        self._added = set()
+        self._removed = set()
+        self._base = (set(), set())  # the rotated journal's adds and removals while a compaction runs
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        for path in (self.rotated_path, self.journal_path):
+            for record in read_urls(path):
+                self._apply(record[0], record[1:])
+        if os.path.exists(self.rotated_path):
+            # Left by a compaction that didn't finish
+            self._unrotate()
+
+    def _apply(self, op, url):
+        if op == '+':
+            self._removed.discard(url)
+            self._added.add(url)
+        elif op == '-':
+            self._added.discard(url)
+            self._removed.add(url)
+
+    def _append(self, op, urls):
+        records = []
+        with self._lock:
+            for url in urls:
+                url = url.strip()
+                if url:
+                    self._apply(op, url)
+                    records.append(f"{op}{url}\n")
+            if records:
+                with open(self.journal_path, 'a', encoding='utf-8', errors='surrogateescape') as journal:
+                    journal.write(''.join(records))
+                    journal.flush()
+                    if self.sync:
+                        os.fsync(journal.fileno())
+        return len(records)
+
+    def add(self, urls):
+        return self._append('+', urls)
+
+    def remove(self, urls):
+        return self._append('-', urls)
+
+    def _changes(self):
+        # Adds and removals not yet in the snapshot file; later records win
+        base_added, base_removed = self._base
+        return ((base_added - self._removed) | self._added, (base_removed - self._added) | self._removed)
+
+    def pending(self):
+        with self._lock:
+            added, removed = self._changes()
+            return len(added) + len(removed)
+
+    def _snapshot(self):
+        if _is_sorted(self.path):
+            return read_urls(self.path)
+        # Files written by older tools may be unsorted; sort them once, on disk
+        return sorted_unique(read_urls(self.path))
+
+    def __iter__(self):
+        with self._lock:
+            added, removed = self._changes()
+        return self._merged(added, removed)
+
+    def _merged(self, added, removed):
+        added = sorted(added)
+        previous = None
+        for url in heapq.merge(self._snapshot(), added):
+            if url != previous and url not in removed:
+                yield url
+            previous = url
+
+    def compact(self):
+        return self._write(None)
+
+    def replace(self, urls, presorted=False):
+        # Swap in a whole new content set (e.g. rewritten URLs), dropping the
+        # journal; presorted streams (sorted and unique already) skip the sort
+        return self._write(urls if presorted else sorted_unique(urls))
+
+    def _write(self, urls):
+        with self._compact_lock:
+            with self._lock:
+                if os.path.exists(self.journal_path):
+                    os.replace(self.journal_path, self.rotated_path)
+                self._base = (self._added, self._removed)
+                self._added, self._removed = set(), set()
+            if urls is None:
+                urls = self._merged(*self._base)
+            tmp_path = self.path + '.tmp'
+            count = 0
+            try:
+                with open_list(tmp_path, 'w', compressed=self.path.endswith('.gz')) as out:
+                    for url in urls:
+                        out.write(f"{url}\n")
+                        count += 1
+                # After close, so a gzip trailer is on disk too
+                _fsync(tmp_path)
+            except BaseException:
+                with self._lock:
+                    self._added, self._removed = self._changes()
+                    self._base = (set(), set())
+                    self._unrotate()
+                raise
+            with self._lock:
+                os.replace(tmp_path, self.path)
+                if os.path.exists(self.rotated_path):
+                    os.remove(self.rotated_path)
+                self._base = (set(), set())
+        return count
+
+    def _unrotate(self):
+        # Puts the rotated journal's records back in front of the live ones
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8', errors='surrogateescape') as out:
+            for path in (self.rotated_path, self.journal_path):
+                for record in read_urls(path):
+                    out.write(f"{record}\n")
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, self.journal_path)
+        os.remove(self.rotated_path)
+
+
+def _read_args_or_stdin(urls):
+    if urls:
+        return urls
+    return (line.strip() for line in sys.stdin if line.strip())
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Journaled add/remove for sorted URL list files")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, help_text in (('add', "journal URLs to add"), ('remove', "journal URLs to remove")):
+        sub = subparsers.add_parser(command, help=help_text)
+        sub.add_argument('file')
+        sub.add_argument('urls', nargs='*', help="URLs (default: one per line on stdin)")
+    compact = subparsers.add_parser('compact', help="fold the journal into a new sorted snapshot")
+    compact.add_argument('file')
+    export = subparsers.add_parser('export', help="stream the current contents to stdout without compacting")
+    export.add_argument('file')
+
+    args = parser.parse_args(argv)
+    store = UrlStore(args.file)
+    if args.command == 'add':
+        print(f"Journaled {store.add(_read_args_or_stdin(args.urls))} additions to {args.file}", file=sys.stderr)
+    elif args.command == 'remove':
+        print(f"Journaled {store.remove(_read_args_or_stdin(args.urls))} removals from {args.file}", file=sys.stderr)
+    elif args.command == 'compact':
+        print(f"Compacted {args.file} to {store.compact()} URLs", file=sys.stderr)
+    elif args.command == 'export':
+        for url in store:
+            sys.stdout.write(f"{url}\n")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import gzip
+import heapq
+import itertools
+import math
+import os
+import random
+import tempfile
+
+# Helpers for URL lists too large to hold in memory: lists are read as streams
+# (gzip-compressed or not), samples are drawn in one pass, and sorting spills
+# sorted, de-duplicated runs of CHUNK_URLS to temporary files that a k-way merge
+# streams back. Memory is bounded by the chunk size, not by the list.
+
+CHUNK_URLS = int(os.getenv('SORT_CHUNK_URLS') or 1_000_000)  # URLs sorted in memory per run
+MERGE_FAN_IN = 64  # runs merged at once; more are merged in passes
+GZIP_MAGIC = b'\x1f\x8b'
+GZIP_LEVEL = 6  # zlib's default; level 9 is several times slower for a few percent
+
+
+def open_list(path, mode='r', compressed=None):
+    # gzip is recognised by its magic bytes when reading and by a .gz suffix
+    # when writing, unless `compressed` says otherwise
+    if compressed is None:
+        if mode.startswith('r'):
+            with open(path, 'rb') as f:
+                compressed = f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+        else:
+            compressed = path.endswith('.gz')
+    if 'b' in mode:
+        return gzip.open(path, mode, GZIP_LEVEL) if compressed else open(path, mode)
+    if compressed:
+        return gzip.open(path, mode + 't', GZIP_LEVEL, encoding='utf-8', errors='surrogateescape')
+    return open(path, mode, encoding='utf-8', errors='surrogateescape')
+
+
+def read_urls(path):
+    if not os.path.exists(path):
+        return
+    with open_list(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def reservoir_sample(items, k, rng=random):
+    # Uniform sample of k items in one pass (Algorithm L): after the first k,
+    # a geometric skip says how many items to pass over before the next
+    # replacement, so the RNG runs O(k log(n/k)) times instead of once per item
+    items = iter(items)
+    sample = list(itertools.islice(items, max(k, 0)))
+    if len(sample) == k and k > 0:
+        missing = object()
+        w = math.exp(math.log(rng.random() or 1e-300) / k)
+        while True:
+            skip = math.floor(math.log(rng.random() or 1e-300) / math.log(1 - w))
+            item = next(itertools.islice(items, skip, None), missing)
+            if item is missing:
+                break
+            sample[rng.randrange(k)] = item
+            w *= math.exp(math.log(rng.random() or 1e-300) / k)
+    rng.shuffle(sample)
+    return sample
+
+
+def unique(urls):
+    # Drops repeats from a sorted stream
+    return (url for url, _ in itertools.groupby(urls))
+
+
+def _write_run(directory, urls, binary):
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.run')
+    with os.fdopen(fd, 'wb') as f:
+        if not binary:
+            urls = (url.encode('utf-8', 'surrogateescape') for url in urls)
+        f.writelines(url + b'\n' for url in urls)
+    return path
+
+
+def _read_run(path, binary):
+    with open(path, 'rb') as f:
+        for line in f:
+            yield line[:-1] if binary else line[:-1].decode('utf-8', 'surrogateescape')
+    os.remove(path)
+
+
+def sorted_unique(urls, chunk_size=None, tmp_dir=None):
+    # Sorted, de-duplicated stream of str or bytes URLs. Input that fits in
+    # one chunk never touches the disk.
+    chunk_size = chunk_size or CHUNK_URLS
+    urls = iter(urls)
+    first = list(itertools.islice(urls, chunk_size))
+    chunk = sorted(set(first))
+    if len(first) < chunk_size:
+        yield from chunk
+        return
+    del first
+    binary = isinstance(chunk[0], bytes)
+    with tempfile.TemporaryDirectory(prefix='web_tool-sort-', dir=tmp_dir) as directory:
+        runs = []
+        while chunk:
+            runs.append(_write_run(directory, chunk, binary))
+            chunk = None  # freed before the next chunk is read, so only one is ever held
+            chunk = sorted(set(itertools.islice(urls, chunk_size)))
+        while len(runs) > MERGE_FAN_IN:
+            group, runs = runs[:MERGE_FAN_IN], runs[MERGE_FAN_IN:]
+            merged = unique(heapq.merge(*(_read_run(path, binary) for path in group)))
+            runs.append(_write_run(directory, merged, binary))
+        yield from unique(heapq.merge(*(_read_run(path, binary) for path in runs)))
+
+
+def subtract(urls, remove):
+    # Both streams sorted: the URLs of `urls` that aren't in `remove`
+    remove = iter(remove)
+    current = next(remove, None)
+    for url in urls:
+        while current is not None and current < url:
+            current = next(remove, None)
+        if current != url:
+            yield url
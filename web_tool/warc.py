@@ -0,0 +1,74 @@
+import base64
+import gzip
+import itertools
+import time
+import uuid
+
+WARC_VERSION = 'WARC/1.1'
+CHUNK_SIZE = 64 * 1024
+SOFTWARE = 'web_tool'
+
+# Minimal WARC/1.1 writer: one warcinfo record, then response records whose
+# payload is streamed from a file in chunks. Each record is its own gzip member,
+# as in any .warc.gz, so readers can seek to a record.
+
+
+def warc_date(timestamp=None):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+def sha256_label(hex_digest):
+    return 'sha256:' + base64.b32encode(bytes.fromhex(hex_digest)).decode('ascii')
+
+
+def record_id():
+    return f"<urn:uuid:{uuid.uuid4()}>"
+
+
+class WarcWriter:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'wb')
+        self.warcinfo_id = None
+        self.records = 0
+
+    def _write_record(self, headers, parts, length):
+        lines = [WARC_VERSION] + [f"{name}: {value}" for name, value in headers] + [f"Content-Length: {length}"]
+        with gzip.GzipFile(fileobj=self._file, mode='wb') as member:
+            member.write(('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8'))
+            for part in parts:
+                member.write(part)
+            member.write(b'\r\n\r\n')
+        self.records += 1
+
+    def warcinfo(self, fields):
+        block = ''.join(f"{name}: {value}\r\n" for name, value in
+                        [('software', SOFTWARE), ('format', 'WARC File Format 1.1')] + list(fields)).encode('utf-8')
+        self.warcinfo_id = record_id()
+        self._write_record([('WARC-Type', 'warcinfo'), ('WARC-Record-ID', self.warcinfo_id),
+                            ('WARC-Date', warc_date()), ('Content-Type', 'application/warc-fields')],
+                           [block], len(block))
+
+    def response(self, url, fetched, status, reason, headers, payload_path, payload_size, payload_sha256):
+        http_head = ''.join([f"HTTP/1.1 {status} {reason}\r\n"] +
+                            [f"{name}: {value}\r\n" for name, value in headers] + ['\r\n']).encode('latin-1', 'replace')
+        record_headers = [('WARC-Type', 'response'), ('WARC-Record-ID', record_id()),
+                          ('WARC-Date', warc_date(fetched)), ('WARC-Target-URI', url),
+                          ('Content-Type', 'application/http;msgtype=response'),
+                          ('WARC-Payload-Digest', sha256_label(payload_sha256))]
+        if self.warcinfo_id:
+            record_headers.append(('WARC-Warcinfo-ID', self.warcinfo_id))
+        block = itertools.chain([http_head], _read_chunks(payload_path))
+        self._write_record(record_headers, block, len(http_head) + payload_size)
+
+    def close(self):
+        self._file.close()
+
+
+def _read_chunks(path):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
@@ -0,0 +1,59 @@
+import os
+from urllib.parse import urlsplit, urlunsplit
+
+from web_tool.sqlite_cache import SqliteCache
+
+WAYBACK_CACHE_PATH = os.getenv('WAYBACK_CACHE_PATH', 'wayback_cache.sqlite')
+POSITIVE_TTL = 30 * 24 * 3600  # captures don't disappear, re-check monthly
+NEGATIVE_TTL = 12 * 3600  # uncaptured URLs may get saved at any time
+MAX_ENTRIES = 1000000
+
+DEFAULT_PORTS = {'http': ':80', 'https': ':443'}
+
+
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    port = DEFAULT_PORTS.get(scheme)
+    if port and netloc.endswith(port):
+        netloc = netloc[:-len(port)]
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+class AvailabilityCache(SqliteCache):
+    table = 'availability'
+    key = 'url'
+    value = 'archived'
+
+    def __init__(self, path=WAYBACK_CACHE_PATH, positive_ttl=POSITIVE_TTL, negative_ttl=NEGATIVE_TTL,
+                 max_entries=MAX_ENTRIES):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        super().__init__(path, max_entries)
+
+    def get(self, url):
+        archived = self._get(normalize_url(url))
+        return None if archived is None else bool(archived)
+
+    def get_many(self, urls):
+        keys = {url: normalize_url(url) for url in urls}
+        found = self._get_many(set(keys.values()))
+        return {url: bool(found[key]) for url, key in keys.items() if key in found}
+
+    def put(self, url, archived):
+        self._put(normalize_url(url), int(bool(archived)), self.positive_ttl if archived else self.negative_ttl)
+
+    def lookup(self, url, check):
+        archived = self.get(url)
+        if archived is None:
+            archived = check(url)
+            self.put(url, archived)
+        return archived
+
+    def report(self):
+        stats = self.stats()
+        total = stats['hits'] + stats['misses']
+        rate = 100.0 * stats['hits'] / total if total else 0.0
+        print(f"Wayback cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({rate:.1f}% of availability requests saved)")